@@ -1,23 +1,1315 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import (Flask, render_template, request, redirect, url_for, jsonify, flash, session, g,
+                   before_render_template, template_rendered)
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+import click
 import sqlite3
 import csv
+import array
+import bisect
+import codecs
+import collections
+import contextlib
+import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import multiprocessing
+import operator
+import queue
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+import zlib
 import os
-from datetime import datetime
+import pathlib
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import date, datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: no migration lock
+    fcntl = None
+
+try:
+    import numpy
+except ImportError:  # Column stores fall back to pure Python loops
+    numpy = None
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'database_explorer_secret_key_render')
+# Blank numbers are stored as NULL; show them as empty cells and inputs, not 'None'
+app.jinja_env.finalize = lambda value: '' if value is None else value
 
 # Use environment variable for database path or default to local
 DATABASE = os.environ.get('DATABASE_PATH', 'database_explorer.db')
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
+# Connection pool and SQLite tuning
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE_KB = int(os.environ.get('DB_CACHE_SIZE_KB', 16384))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+
+MONTH_FORMATS = ('%b %Y', '%B %Y', '%Y-%m', '%m/%Y')
+DAY_FORMATS = ('%d %b %Y', '%d %B %Y', '%d/%m/%Y', '%Y-%m-%d', '%d-%m-%Y', '%d-%b-%Y')
+
+@functools.lru_cache(maxsize=4096)
+def parse_day_key(value):
+    """Parse a date such as '20/05/2025' or '4 Dec 2024' into an integer yyyymmdd key"""
+    if not value:
+        return None
+    value = str(value).strip()
+    for fmt in DAY_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.year * 10000 + parsed.month * 100 + parsed.day
+    return None
+
+@functools.lru_cache(maxsize=4096)
+def parse_month_key(value):
+    """Parse a month label such as 'Jan 2025' into an integer yyyymm key
+
+    Full dates are accepted too and keyed by their month.
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    if len(value) == 6 and value.isdigit():
+        return int(value)
+    for fmt in MONTH_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+        return parsed.year * 100 + parsed.month
+    day_key = parse_day_key(value)
+    return day_key // 100 if day_key else None
+
+# Request, SQL and import instrumentation, per worker process
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'off')
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Metrics:
+    """Thread-safe counters and latency histograms in Prometheus text format.
+
+    Series are keyed by a tuple of (label, value) pairs. Histograms keep
+    per-bucket counts and are only made cumulative when rendered, so an
+    observation is one bisect and two additions under the lock.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def observe(self, name, labels, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            counts = series.get(labels)
+            if counts is None:
+                counts = series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += seconds
+
+    def increment(self, name, labels, amount=1):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = tuple(labels) + tuple(extra)
+        if not pairs:
+            return ''
+        escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in pairs)
+        return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self, samples=()):
+        """Prometheus text exposition of everything recorded.
+
+        samples are extra (name, kind, help, [(labels, value)]) families,
+        e.g. gauges read from other components at scrape time.
+        """
+        with self._lock:
+            histograms = {name: {labels: list(counts) for labels, counts in series.items()}
+                          for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+        lines = []
+        for name in sorted(histograms):
+            kind, text = self._help.get(name, ('histogram', name))
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} histogram']
+            for labels, counts in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self.format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{self.format_labels(labels)} {counts[-1]:.6f}')
+                lines.append(f'{name}_count{self.format_labels(labels)} {cumulative}')
+        families = [(name, *self._help.get(name, ('counter', name)), sorted(series.items()))
+                    for name, series in sorted(counters.items())]
+        for name, kind, text, series in families + list(samples):
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            lines += [f'{name}{self.format_labels(labels)} {value}' for labels, value in series]
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics(METRICS_BUCKETS)
+metrics.describe('http_request_duration_seconds', 'histogram', 'Time to build a response, by route')
+metrics.describe('template_render_seconds', 'histogram', 'Jinja template rendering time')
+metrics.describe('db_connection_acquire_seconds', 'histogram', 'Time to get a pooled database connection')
+metrics.describe('sqlite_statement_seconds', 'histogram',
+                 'SQL statement time up to the first row, by operation and table')
+metrics.describe('sqlite_slow_queries_total', 'counter', f'Statements slower than {SLOW_QUERY_SECONDS}s')
+metrics.describe('import_phase_seconds', 'histogram', 'CSV import time per phase')
+metrics.describe('write_queue_wait_seconds', 'histogram', 'Time writes wait for the writer and write lock')
+metrics.describe('write_transaction_seconds', 'histogram', 'Writer transaction time, grouped or exclusive')
+
+# First table a statement names, for low-cardinality metric labels
+SQL_TABLE_NAME = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?(?!(?:OF|ON)\b)([\w.]+)',
+                            re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def statement_labels(sql):
+    words = sql.split(None, 1)
+    match = SQL_TABLE_NAME.search(sql)
+    return (('operation', words[0].upper() if words else ''), ('table', match.group(1) if match else ''))
+
+def record_statement(sql, elapsed):
+    labels = statement_labels(sql)
+    metrics.observe('sqlite_statement_seconds', labels, elapsed)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        metrics.increment('sqlite_slow_queries_total', labels)
+        app.logger.warning('Slow query (%.3fs): %s', elapsed, ' '.join(sql.split())[:2000])
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to its pool.
+
+    execute() and executemany() are timed for the SQL metrics. For queries
+    that is the time to the first row, which covers sorting and grouping
+    but not the rows fetched afterwards.
+    """
+
+    pool = None
+    # Set once archive_arms() attaches an archive; the pool detaches them on release
+    archives_attached = False
+
+    def execute(self, sql, parameters=()):
+        if not METRICS_ENABLED:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_statement(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, parameters):
+        if not METRICS_ENABLED:
+            return super().executemany(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            record_statement(sql, time.perf_counter() - started)
+
+    def close(self):
+        if self.pool is not None and self.pool.release(self):
+            return
+        super().close()
+
+def open_connection(database):
+    """New sqlite3 connection with the tuning PRAGMAs applied"""
+    # uri=True lets archives be attached read-only with file:...?mode=ro
+    conn = sqlite3.connect(database, factory=PooledConnection, check_same_thread=False, uri=True)
     conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}')
+    conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+    conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = -{DB_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {DB_MMAP_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
     return conn
 
-def init_database():
-    conn = get_db_connection()
-    
+class ConnectionPool:
+    """Per-process pool of tuned SQLite connections.
+
+    Connections are opened lazily up to ``size``; once all of them are in
+    use, callers wait up to ``timeout`` seconds for one to be released.
+    """
+
+    def __init__(self, database, size, timeout):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._pid = os.getpid()
+        self._inherited = []
+        self._stats = {'hits': 0, 'misses': 0, 'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0}
+
+    def _connect(self):
+        conn = open_connection(self.database)
+        conn.pool = self
+        return conn
+
+    def _check_fork(self):
+        # Connections must never be shared across fork(). Keep references to
+        # any inherited ones so they are not closed (and checkpointed) here.
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    while not self._idle.empty():
+                        self._inherited.append(self._idle.get_nowait())
+                    self._opened = 0
+                    self._pid = os.getpid()
+
+    def acquire(self):
+        self._check_fork()
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._stats['hits'] += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+                self._stats['misses'] += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        started = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise sqlite3.OperationalError('Timed out waiting for a database connection')
+        with self._lock:
+            self._stats['waits'] += 1
+            self._stats['wait_seconds'] += time.perf_counter() - started
+        return conn
+
+    def release(self, conn):
+        """Return conn to the pool; False means the caller should close it"""
+        if self._pid != os.getpid():
+            return False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if conn.archives_attached:
+                detach_archives(conn)
+        except sqlite3.Error:
+            with self._lock:
+                self._opened -= 1
+            return False
+        self._idle.put(conn)
+        return True
+
+    def clear(self):
+        """Close all idle connections, e.g. before the server forks workers"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._opened -= 1
+            sqlite3.Connection.close(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(size=self.size, open=self._opened, idle=self._idle.qsize())
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['wait_seconds'] = round(stats['wait_seconds'], 6)
+        requests = stats['hits'] + stats['misses'] + stats['waits']
+        stats['hit_ratio'] = round((stats['hits'] + stats['waits']) / requests, 4) if requests else None
+        return stats
+
+db_pool = ConnectionPool(DATABASE, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+def get_db_connection():
+    if not METRICS_ENABLED:
+        return db_pool.acquire()
+    started = time.perf_counter()
+    conn = db_pool.acquire()
+    metrics.observe('db_connection_acquire_seconds', (), time.perf_counter() - started)
+    return conn
+
+# Single writer per process: mutations are queued to one thread, which
+# applies small ones together in one transaction (group commit). A lock file
+# serialises the writer threads of all worker processes, so they queue for
+# SQLite's write lock instead of failing with "database is locked".
+WRITE_QUEUE_ENABLED = os.environ.get('WRITE_QUEUE_ENABLED', '1').lower() not in ('0', 'false', 'off')
+WRITE_GROUP_MAX = int(os.environ.get('WRITE_GROUP_MAX', 64))
+WRITE_GROUP_WAIT_MS = float(os.environ.get('WRITE_GROUP_WAIT_MS', 0))
+WRITE_TIMEOUT = float(os.environ.get('WRITE_TIMEOUT', 30))
+WRITE_LOCK_PATH = os.environ.get('WRITE_LOCK_PATH', DATABASE + '.write.lock')
+
+WriteJob = collections.namedtuple('WriteJob', 'work exclusive future queued_at')
+
+class WriterBusy(sqlite3.OperationalError):
+    """A queued write was dropped because the writer stayed busy past its timeout"""
+
+class WriteQueue:
+    """Funnel database writes through one writer thread per process.
+
+    run(work) queues work(conn) and blocks until it has been applied,
+    returning its result or raising its exception. Queued jobs are taken in
+    groups of up to ``max_group`` and applied in one BEGIN IMMEDIATE
+    transaction, each inside a savepoint so that a failing job only rolls
+    back its own changes; the group then shares a single commit. Exclusive
+    jobs run alone and manage their own transaction, for imports and other
+    long writers that commit themselves.
+
+    With the queue disabled, run() applies work on a pooled connection in
+    the calling thread instead.
+    """
+
+    def __init__(self, database, lock_path, max_group, linger, enabled=True):
+        self.database = database
+        self.lock_path = lock_path
+        self.max_group = max_group
+        self.linger = linger
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._jobs = None
+        self._pid = None
+        self._stats = {'jobs': 0, 'groups': 0, 'exclusive': 0, 'failed': 0, 'timeouts': 0, 'largest_group': 0,
+                       'lock_wait_seconds': 0.0, 'transaction_seconds': 0.0}
+
+    def _queue(self):
+        # The writer thread only exists in the process that started it, so a
+        # forked worker starts its own on first use
+        with self._lock:
+            if self._pid != os.getpid():
+                self._jobs = queue.Queue()
+                self._pid = os.getpid()
+                threading.Thread(target=self._serve, args=(self._jobs,), name='db-writer', daemon=True).start()
+            return self._jobs
+
+    def run(self, work, exclusive=False, timeout=WRITE_TIMEOUT):
+        """Apply work(conn) and return its result.
+
+        Grouped work runs inside an open transaction and must not commit.
+        Jobs still queued after timeout seconds are dropped with WriterBusy;
+        a job that has started is always waited for, so the caller learns
+        its real outcome.
+        """
+        future = self.submit(work, exclusive)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                return future.result()
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise WriterBusy('Timed out waiting for the database writer')
+
+    def submit(self, work, exclusive=False):
+        """Queue work(conn) without waiting and return a Future for its result"""
+        if not self.enabled:
+            future = Future()
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self._run_inline(work, exclusive))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        job = WriteJob(work, exclusive, Future(), time.perf_counter())
+        self._queue().put(job)
+        return job.future
+
+    def _run_inline(self, work, exclusive):
+        conn = get_db_connection()
+        try:
+            if exclusive:
+                return work(conn)
+            conn.execute('BEGIN IMMEDIATE')
+            result = work(conn)
+            conn.commit()
+            return result
+        finally:
+            conn.close()
+
+    def _next_group(self, jobs, carried):
+        """Jobs for the next transaction; an exclusive job ends a group and is carried over"""
+        first = carried or jobs.get()
+        group, carried = [first], None
+        if not first.exclusive:
+            if self.linger:
+                time.sleep(self.linger)
+            while len(group) < self.max_group:
+                try:
+                    job = jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job.exclusive:
+                    carried = job
+                    break
+                group.append(job)
+        # Jobs whose caller gave up are skipped
+        return [job for job in group if job.future.set_running_or_notify_cancel()], carried
+
+    def _serve(self, jobs):
+        conn = lock_file = None
+        carried = None
+        while True:
+            group, carried = self._next_group(jobs, carried)
+            if not group:
+                continue
+            kind = 'exclusive' if group[0].exclusive else 'group'
+            try:
+                if conn is None:
+                    conn = open_connection(self.database)
+                if lock_file is None and fcntl is not None:
+                    lock_file = open(self.lock_path, 'a')
+                started = time.perf_counter()
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                locked = time.perf_counter()
+                try:
+                    if METRICS_ENABLED:
+                        for job in group:
+                            metrics.observe('write_queue_wait_seconds', (('kind', kind),), locked - job.queued_at)
+                    if group[0].exclusive:
+                        self._apply_exclusive(conn, group[0])
+                    else:
+                        self._apply_group(conn, group)
+                finally:
+                    if lock_file is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+                finished = time.perf_counter()
+                if METRICS_ENABLED:
+                    metrics.observe('write_transaction_seconds', (('kind', kind),), finished - locked)
+                with self._lock:
+                    self._stats['jobs'] += len(group)
+                    self._stats['exclusive' if group[0].exclusive else 'groups'] += 1
+                    self._stats['largest_group'] = max(self._stats['largest_group'], len(group))
+                    self._stats['failed'] += sum(job.future.exception() is not None for job in group)
+                    self._stats['lock_wait_seconds'] += locked - started
+                    self._stats['transaction_seconds'] += finished - locked
+            except Exception as e:
+                # The connection or lock failed: fail the unresolved jobs and reconnect
+                unresolved = [job for job in group if not job.future.done()]
+                for job in unresolved:
+                    job.future.set_exception(e)
+                with self._lock:
+                    self._stats['failed'] += len(unresolved)
+                if conn is not None:
+                    sqlite3.Connection.close(conn)
+                    conn = None
+
+    def _apply_group(self, conn, group):
+        outcomes = []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for job in group:
+                conn.execute('SAVEPOINT write_job')
+                try:
+                    outcomes.append((job.work(conn), None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO write_job')
+                    outcomes.append((None, e))
+                conn.execute('RELEASE write_job')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        for job, (result, error) in zip(group, outcomes):
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def _apply_exclusive(self, conn, job):
+        result = error = None
+        try:
+            result = job.work(conn)
+        except Exception as e:
+            error = e
+        if conn.in_transaction:
+            conn.rollback()
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            queued = self._jobs.qsize() if self._jobs is not None and self._pid == os.getpid() else 0
+        stats.update(enabled=self.enabled, queued=queued, max_group=self.max_group)
+        stats['lock_wait_seconds'] = round(stats['lock_wait_seconds'], 6)
+        stats['transaction_seconds'] = round(stats['transaction_seconds'], 6)
+        transactions = stats['groups'] + stats['exclusive']
+        stats['jobs_per_transaction'] = round(stats['jobs'] / transactions, 2) if transactions else None
+        return stats
+
+write_queue = WriteQueue(DATABASE, WRITE_LOCK_PATH, WRITE_GROUP_MAX, WRITE_GROUP_WAIT_MS / 1000,
+                         WRITE_QUEUE_ENABLED)
+
+# Secondary indexes for the columns we filter and join on
+TABLE_INDEXES = {
+    'domain_cost': [('team', 'month'), ('domain',), ('owner',), ('team', 'month_key'), ('month_key',),
+                    ('end_date_key',)],
+    'hosting_cost': [('domain',), ('team',), ('month_registration_key',), ('month_expire_key',)],
+    'performance': [('domain',), ('team',), ('owner',), ('cashgame',), ('chalong',), ('playgame',),
+                    ('end_date_key',)],
+    'revenue': [('team', 'month'), ('code',), ('owner',), ('team', 'month_key'), ('month_key',)],
+    'salary': [('team',)],
+}
+
+# Text columns indexed for full-text search, per table
+SEARCH_COLUMNS = {
+    'domain_cost': ['domain', 'kw', 'owner'],
+    'hosting_cost': ['domain'],
+    'performance': ['domain', 'owner'],
+    'revenue': ['code', 'owner'],
+    'salary': ['nickname'],
+}
+
+# Numeric columns whose running totals are kept in table_sums
+STATS_SUM_COLUMNS = {
+    'domain_cost': ['cost'],
+    'hosting_cost': ['sum_hosting_cost_by_domain'],
+    'performance': ['total_register', 'total_topup'],
+    'revenue': ['win_loss'],
+    'salary': ['salary'],
+}
+
+# Canonical integer keys parsed from free-form date text at write time:
+# (key column, source column, parser) per table
+DATE_KEY_COLUMNS = {
+    'domain_cost': [('month_key', 'month', parse_month_key), ('end_date_key', 'end_date', parse_day_key)],
+    'hosting_cost': [('month_registration_key', 'month_registration', parse_month_key),
+                     ('month_expire_key', 'month_expire', parse_month_key)],
+    'performance': [('end_date_key', 'end_date', parse_day_key)],
+    'revenue': [('month_key', 'month', parse_month_key)],
+}
+
+def add_date_key_columns(conn):
+    """Add missing date key columns and backfill them once from the text columns"""
+    for table, keys in DATE_KEY_COLUMNS.items():
+        existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        for key_column, source_column, parser in keys:
+            if key_column in existing:
+                continue
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {key_column} INTEGER')
+            values = conn.execute(f'SELECT DISTINCT {source_column} FROM {table} '
+                                  f'WHERE {source_column} IS NOT NULL').fetchall()
+            conn.executemany(f'UPDATE {table} SET {key_column} = ? WHERE {source_column} = ?',
+                             [(parser(row[0]), row[0]) for row in values if parser(row[0]) is not None])
+
+# Natural keys matched by upsert imports. Rows written by an upsert import
+# carry a hash of their content in row_hash; the key is unique among them.
+NATURAL_KEYS = {
+    'domain_cost': ('domain', 'month'),
+    'hosting_cost': ('domain', 'month_registration'),
+    'performance': ('domain',),
+    'revenue': ('code', 'month'),
+    'salary': ('nickname', 'team'),
+}
+
+def add_natural_keys(conn):
+    """Add the row_hash column and the partial unique natural key index per table"""
+    for table, key in NATURAL_KEYS.items():
+        existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+        if 'row_hash' not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN row_hash TEXT')
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_natural_key "
+                     f"ON {table} ({', '.join(key)}) WHERE row_hash IS NOT NULL")
+
+def create_row_hash_triggers(conn):
+    """Clear row_hash when an upserted row is changed outside an import.
+
+    Form edits, bulk updates and monthly figure changes set it to '', which
+    keeps the row under its natural key but matches no content hash, so
+    the next upsert import of the file rewrites the row instead of counting
+    it unchanged. Imports set row_hash themselves and are skipped through
+    bulk_loads.
+    """
+    for table in NATURAL_KEYS:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_row_hash_au AFTER UPDATE OF {', '.join(WRITE_COLUMNS[table])} ON {table}
+            WHEN NEW.row_hash IS OLD.row_hash AND NEW.row_hash <> ''
+            AND NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = '{table}') BEGIN
+                UPDATE {table} SET row_hash = '' WHERE id = NEW.id;
+            END
+        ''')
+    for suffix, event, ref in (('ai', 'INSERT', 'new'), ('ad', 'DELETE', 'old'), ('au', 'UPDATE', 'new')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS performance_monthly_row_hash_{suffix} AFTER {event} ON performance_monthly
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = 'performance') BEGIN
+                UPDATE performance SET row_hash = '' WHERE id = {ref}.domain_id AND row_hash <> '';
+            END
+        ''')
+
+def create_indexes(conn):
+    for table, indexes in TABLE_INDEXES.items():
+        for columns in indexes:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{'_'.join(columns)} "
+                         f"ON {table} ({', '.join(columns)})")
+
+def create_search_index(conn, table):
+    """Create an FTS5 index over SEARCH_COLUMNS[table], kept in sync by triggers.
+
+    Uses the trigram tokenizer for substring matching when SQLite supports it
+    and falls back to unicode61 prefix matching otherwise. Returns False when
+    FTS5 is unavailable.
+    """
+    fts_table = f'{table}_fts'
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts_table,)).fetchone():
+        return True
+
+    columns = SEARCH_COLUMNS[table]
+    column_list = ', '.join(columns)
+    for tokenizer in ('trigram', 'unicode61'):
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE {fts_table} USING fts5("
+                         f"{column_list}, content='{table}', content_rowid='id', tokenize='{tokenizer}')")
+            break
+        except sqlite3.OperationalError:
+            continue
+    else:
+        return False
+
+    new_values = ', '.join(f'new.{column}' for column in columns)
+    old_values = ', '.join(f'old.{column}' for column in columns)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table}
+        WHEN NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = '{table}') BEGIN
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column_list} ON {table} BEGIN
+            INSERT INTO {fts_table} ({fts_table}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts_table} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    conn.execute(f"INSERT INTO {fts_table} ({fts_table}) VALUES ('rebuild')")
+    return True
+
+def create_table_stats(conn, table):
+    """Seed table_stats/table_sums for table and install the triggers that keep them exact"""
+    sum_columns = STATS_SUM_COLUMNS[table]
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f'''
+            INSERT OR IGNORE INTO table_stats (table_name, row_count, max_id)
+            SELECT '{table}', COUNT(*), COALESCE(MAX(id), 0) FROM {table}
+        ''')
+        for column in sum_columns:
+            conn.execute(f'''
+                INSERT OR IGNORE INTO table_sums (table_name, column_name, total)
+                SELECT '{table}', '{column}', COALESCE(SUM({column}), 0) FROM {table}
+            ''')
+
+        def sum_updates(delta):
+            return ''.join(f"UPDATE table_sums SET total = total + {delta.format(column=column)} "
+                           f"WHERE table_name = '{table}' AND column_name = '{column}';\n"
+                           for column in sum_columns)
+
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_ai AFTER INSERT ON {table}
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = '{table}') BEGIN
+                UPDATE table_stats SET row_count = row_count + 1, max_id = MAX(max_id, new.id)
+                WHERE table_name = '{table}';
+                {sum_updates('COALESCE(new.{column}, 0)')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_ad AFTER DELETE ON {table} BEGIN
+                UPDATE table_stats SET row_count = row_count - 1 WHERE table_name = '{table}';
+                {sum_updates('- COALESCE(old.{column}, 0)')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_stats_au AFTER UPDATE OF {', '.join(sum_columns)} ON {table} BEGIN
+                {sum_updates('COALESCE(new.{column}, 0) - COALESCE(old.{column}, 0)')}
+            END
+        ''')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def create_write_generations(conn):
+    """Seed write_generations and install the triggers that bump it on every write.
+
+    Each table's generation changes whenever one of its rows (or, for
+    performance, one of its monthly rows) is written, so any process can
+    tell whether something it derived from the table is still current.
+    """
+    for table in TABLE_COLUMNS:
+        conn.execute("INSERT OR IGNORE INTO write_generations (table_name, generation, modified_at) "
+                     "VALUES (?, 1, CAST(strftime('%s', 'now') AS INTEGER))", (table,))
+    for source, table in [(table, table) for table in TABLE_COLUMNS] + [('performance_monthly', 'performance')]:
+        bump = (f"UPDATE write_generations SET generation = generation + 1, "
+                f"modified_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE table_name = '{table}';")
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {source}_gen_ai AFTER INSERT ON {source}
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = '{table}') BEGIN
+                {bump}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {source}_gen_ad AFTER DELETE ON {source} BEGIN
+                {bump}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {source}_gen_au AFTER UPDATE ON {source} BEGIN
+                {bump}
+            END
+        ''')
+
+def add_write_rewrites(conn):
+    """Count updates and deletes apart from inserts in write_generations.rewrites.
+
+    Readers that follow a table by its max id (see ColumnStore) only need
+    to reload when this count moves.
+    """
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(write_generations)')}
+    if 'rewrites' not in columns:
+        conn.execute('ALTER TABLE write_generations ADD COLUMN rewrites INTEGER NOT NULL DEFAULT 0')
+    for table in TABLE_COLUMNS:
+        bump = (f"UPDATE write_generations SET generation = generation + 1, rewrites = rewrites + 1, "
+                f"modified_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE table_name = '{table}';")
+        for suffix, event in (('ad', 'DELETE'), ('au', 'UPDATE')):
+            conn.execute(f'DROP TRIGGER IF EXISTS {table}_gen_{suffix}')
+            conn.execute(f'''
+                CREATE TRIGGER {table}_gen_{suffix} AFTER {event} ON {table} BEGIN
+                    {bump}
+                END
+            ''')
+
+def read_write_generations(conn):
+    """Map each table to its (generation, last write as a unix timestamp)"""
+    return {row['table_name']: (row['generation'], row['modified_at'])
+            for row in conn.execute('SELECT table_name, generation, modified_at FROM write_generations')}
+
+def begin_bulk_load(conn, table):
+    """Switch off per-row trigger maintenance for rows inserted in this transaction.
+
+    Returns the current max id; pass it to finish_bulk_load() before
+    committing so the search index and table stats catch up on the new rows
+    with a few set-based statements, which is far cheaper than firing the
+    insert triggers row by row.
+    """
+    conn.execute('INSERT OR IGNORE INTO bulk_loads (table_name) VALUES (?)', (table,))
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}').fetchone()[0]
+
+def finish_bulk_load(conn, table, watermark):
+    fts_table = f'{table}_fts'
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts_table,)).fetchone():
+        column_list = ', '.join(SEARCH_COLUMNS[table])
+        conn.execute(f'INSERT INTO {fts_table} (rowid, {column_list}) '
+                     f'SELECT id, {column_list} FROM {table} WHERE id > ?', (watermark,))
+
+    conn.execute(f'''
+        UPDATE table_stats
+        SET row_count = row_count + (SELECT COUNT(*) FROM {table} WHERE id > ?),
+            max_id = MAX(max_id, (SELECT COALESCE(MAX(id), 0) FROM {table}))
+        WHERE table_name = ?
+    ''', (watermark, table))
+    for column in STATS_SUM_COLUMNS[table]:
+        conn.execute(f'''
+            UPDATE table_sums
+            SET total = total + (SELECT COALESCE(SUM({column}), 0) FROM {table} WHERE id > ?)
+            WHERE table_name = ? AND column_name = ?
+        ''', (watermark, table, column))
+    mark_rollups_dirty(conn, table, f'{table}.id > ?', (watermark,))
+    conn.execute("UPDATE write_generations SET generation = generation + 1, "
+                 "modified_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE table_name = ?", (table,))
+    conn.execute('DELETE FROM bulk_loads WHERE table_name = ?', (table,))
+
+def read_table_stats(conn):
+    """Row counts, running sums and max ids for every table, in O(1).
+
+    These cover the hot database, which is what listings, search and
+    analytics read; archived rows are in read_archived_stats().
+    """
+    stats = {}
+    for row in conn.execute('SELECT table_name, row_count, max_id FROM table_stats'):
+        stats[row['table_name']] = {'row_count': row['row_count'], 'max_id': row['max_id'], 'sums': {}}
+    for row in conn.execute('SELECT table_name, column_name, total FROM table_sums'):
+        stats[row['table_name']]['sums'][row['column_name']] = row['total']
+    return stats
+
+def read_archived_stats(conn):
+    """Row counts and sums of the archived rows of each table, added up over its partitions"""
+    stats = {}
+    for row in conn.execute('SELECT table_name, SUM(row_count) AS row_count FROM archive_partitions '
+                            'GROUP BY table_name'):
+        stats[row['table_name']] = {'row_count': row['row_count'], 'sums': {}}
+    for row in conn.execute('SELECT table_name, column_name, SUM(total) AS total FROM archive_partition_sums '
+                            'GROUP BY table_name, column_name'):
+        stats[row['table_name']]['sums'][row['column_name']] = row['total']
+    return stats
+
+# Month columns performance used to carry before performance_monthly, by
+# month number. They are migrated once and still exposed by performance_wide.
+PERFORMANCE_WIDE_COLUMNS = [
+    (5, 'regis_may', 'topup_may'),
+    (6, 'regis_june', 'topup_june'),
+    (7, 'regis_july', 'topup_july'),
+]
+
+# Year used for monthly figures of performance rows without an end date,
+# when they are first written
+PERFORMANCE_DEFAULT_YEAR_SQL = "CAST(strftime('%Y', 'now') AS INTEGER)"
+
+def create_performance_monthly(conn):
+    """Create the long-format performance_monthly table and its read view.
+
+    One (domain_id, month_key) row per performance row and month replaces the
+    hard-coded regis_<month>/topup_<month> columns; domain_id is the id of
+    the performance row. Existing month columns are copied over the first
+    time and then dropped. The performance_wide view keeps serving the old
+    column names to the templates and the listing API.
+    """
+    created = not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'performance_monthly'").fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS performance_monthly (
+            domain_id INTEGER NOT NULL,
+            month_key INTEGER NOT NULL,
+            regis INTEGER NOT NULL DEFAULT 0,
+            topup INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (domain_id, month_key)
+        ) WITHOUT ROWID
+    ''')
+    # Covering index for per-month aggregation across all domains
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_performance_monthly_month_key '
+                 'ON performance_monthly (month_key, regis, topup)')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS performance_monthly_cascade AFTER DELETE ON performance BEGIN
+            DELETE FROM performance_monthly WHERE domain_id = old.id;
+        END
+    ''')
+
+    existing = {row['name'] for row in conn.execute('PRAGMA table_info(performance)')}
+    legacy = [columns for columns in PERFORMANCE_WIDE_COLUMNS if columns[1] in existing]
+    if created:
+        for number, regis, topup in legacy:
+            conn.execute(f'''
+                INSERT OR IGNORE INTO performance_monthly (domain_id, month_key, regis, topup)
+                SELECT id, COALESCE(end_date_key / 10000, {PERFORMANCE_DEFAULT_YEAR_SQL}) * 100 + {number},
+                       COALESCE({regis}, 0), COALESCE({topup}, 0)
+                FROM performance WHERE COALESCE({regis}, 0) != 0 OR COALESCE({topup}, 0) != 0
+            ''')
+    for _, regis, topup in legacy:
+        try:
+            conn.execute(f'ALTER TABLE performance DROP COLUMN {regis}')
+            conn.execute(f'ALTER TABLE performance DROP COLUMN {topup}')
+        except sqlite3.OperationalError:
+            # SQLite before 3.35 cannot drop columns; they are simply no longer used
+            break
+
+    recreate_performance_wide(conn)
+    return created
+
+def performance_wide_sql():
+    """SELECT behind the performance_wide view, also created in archive files.
+
+    Month columns show the year of the row's end date. Rows without one show
+    the latest year they have figures for, which was fixed when they were
+    written (see performance_months_year()), so they do not go blank when
+    the calendar year changes.
+    """
+    year = (f'COALESCE(p.end_date_key / 10000, '
+            f'(SELECT MAX(month_key) / 100 FROM performance_monthly WHERE domain_id = p.id), '
+            f'{PERFORMANCE_DEFAULT_YEAR_SQL}) * 100')
+    month_columns = ',\n'.join(
+        f'COALESCE((SELECT {value} FROM performance_monthly m '
+        f'WHERE m.domain_id = p.id AND m.month_key = {year} + {number}), 0) AS {column}'
+        for number, regis, topup in PERFORMANCE_WIDE_COLUMNS
+        for value, column in (('regis', regis), ('topup', topup)))
+    return f'''
+        SELECT {', '.join(f'p.{column}' for column in TABLE_COLUMNS['performance'])},
+               {month_columns}
+        FROM performance p
+    '''
+
+# Source tables feeding the P&L rollups and the key columns they are grouped by
+ROLLUP_SOURCES = {
+    'domain_cost': ('domain', 'team'),
+    'hosting_cost': ('domain', 'team'),
+    'performance': ('domain', 'team'),
+    'revenue': (None, 'team'),
+    'salary': (None, 'team'),
+}
+
+def rollup_dirty_sql(table, ref):
+    """SQL marking the rollup keys touched by a row (ref is 'new' or 'old')"""
+    domain_column, team_column = ROLLUP_SOURCES[table]
+    statements = []
+    if domain_column:
+        statements.append(f'INSERT OR IGNORE INTO pnl_dirty_domains (domain) '
+                          f'SELECT {ref}.{domain_column} WHERE {ref}.{domain_column} IS NOT NULL;')
+    elif table == 'revenue':
+        # Revenue rows reach a domain through the player codes on performance
+        statements.append(f'INSERT OR IGNORE INTO pnl_dirty_domains (domain) '
+                          f'SELECT domain FROM performance WHERE domain IS NOT NULL AND '
+                          f'(cashgame = {ref}.code OR chalong = {ref}.code OR playgame = {ref}.code);')
+    statements.append(f'INSERT OR IGNORE INTO pnl_dirty_teams (team) '
+                      f'SELECT {ref}.{team_column} WHERE {ref}.{team_column} IS NOT NULL;')
+    return '\n'.join(statements)
+
+def mark_rollups_dirty(conn, table, where='1', params=()):
+    """Mark the rollup keys of every row of table matching where as dirty"""
+    domain_column, team_column = ROLLUP_SOURCES[table]
+    if domain_column:
+        conn.execute(f'INSERT OR IGNORE INTO pnl_dirty_domains (domain) '
+                     f'SELECT DISTINCT {domain_column} FROM {table} '
+                     f'WHERE {domain_column} IS NOT NULL AND {where}', params)
+    elif table == 'revenue':
+        conn.execute(f'''
+            INSERT OR IGNORE INTO pnl_dirty_domains (domain)
+            SELECT DISTINCT p.domain FROM revenue
+            JOIN performance p ON revenue.code IN (p.cashgame, p.chalong, p.playgame)
+            WHERE p.domain IS NOT NULL AND {where}
+        ''', params)
+    conn.execute(f'INSERT OR IGNORE INTO pnl_dirty_teams (team) '
+                 f'SELECT DISTINCT {team_column} FROM {table} '
+                 f'WHERE {team_column} IS NOT NULL AND {where}', params)
+
+def create_rollup_tables(conn):
+    """Create the materialized P&L tables and the triggers that mark them stale"""
+    created = not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'pnl_domain_month'").fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pnl_domain_month (
+            domain TEXT NOT NULL,
+            month_key INTEGER NOT NULL,
+            month TEXT,
+            domain_cost REAL NOT NULL,
+            hosting_cost REAL NOT NULL,
+            revenue REAL NOT NULL,
+            registrations INTEGER NOT NULL,
+            topups INTEGER NOT NULL,
+            profit REAL NOT NULL,
+            PRIMARY KEY (domain, month_key)
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pnl_team_month (
+            team TEXT NOT NULL,
+            month_key INTEGER NOT NULL,
+            month TEXT,
+            domain_cost REAL NOT NULL,
+            hosting_cost REAL NOT NULL,
+            revenue REAL NOT NULL,
+            salary REAL NOT NULL,
+            registrations INTEGER NOT NULL,
+            topups INTEGER NOT NULL,
+            profit REAL NOT NULL,
+            PRIMARY KEY (team, month_key)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pnl_domain_month_month_key ON pnl_domain_month (month_key)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pnl_team_month_month_key ON pnl_team_month (month_key)')
+    conn.execute('CREATE TABLE IF NOT EXISTS pnl_dirty_domains (domain TEXT PRIMARY KEY)')
+    conn.execute('CREATE TABLE IF NOT EXISTS pnl_dirty_teams (team TEXT PRIMARY KEY)')
+
+    for table in ROLLUP_SOURCES:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_pnl_ai AFTER INSERT ON {table}
+            WHEN NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = '{table}') BEGIN
+                {rollup_dirty_sql(table, 'new')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_pnl_ad AFTER DELETE ON {table} BEGIN
+                {rollup_dirty_sql(table, 'old')}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_pnl_au AFTER UPDATE ON {table} BEGIN
+                {rollup_dirty_sql(table, 'old')}
+                {rollup_dirty_sql(table, 'new')}
+            END
+        ''')
+
+    # Monthly figures reach the rollups through their performance row. Bulk
+    # loads of performance mark their new rows dirty in finish_bulk_load().
+    def monthly_dirty_sql(ref):
+        return (f'INSERT OR IGNORE INTO pnl_dirty_domains (domain) '
+                f'SELECT domain FROM performance WHERE id = {ref}.domain_id AND domain IS NOT NULL;\n'
+                f'INSERT OR IGNORE INTO pnl_dirty_teams (team) '
+                f'SELECT team FROM performance WHERE id = {ref}.domain_id AND team IS NOT NULL;')
+
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS performance_monthly_pnl_ai AFTER INSERT ON performance_monthly
+        WHEN NOT EXISTS (SELECT 1 FROM bulk_loads WHERE table_name = 'performance') BEGIN
+            {monthly_dirty_sql('new')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS performance_monthly_pnl_ad AFTER DELETE ON performance_monthly BEGIN
+            {monthly_dirty_sql('old')}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS performance_monthly_pnl_au AFTER UPDATE ON performance_monthly BEGIN
+            {monthly_dirty_sql('old')}
+            {monthly_dirty_sql('new')}
+        END
+    ''')
+
+    if created:
+        for table in ROLLUP_SOURCES:
+            mark_rollups_dirty(conn, table)
+
+def performance_month_items(key_column, arms):
+    """UNION ALL branches joining performance_monthly rows to their performance key.
+
+    One branch per partition in arms (see archive_arms()); monthly rows are
+    archived along with their performance row, so each joins within its file.
+    """
+    return archive_union(arms, f'''
+        SELECT p.{key_column}, m.month_key,
+               substr('JanFebMarAprMayJunJulAugSepOctNovDec', (m.month_key % 100) * 3 - 2, 3)
+                   || ' ' || (m.month_key / 100),
+               0, 0, 0, 0, m.regis, m.topup
+        FROM {{schema}}.performance p JOIN {{schema}}.performance_monthly m ON m.domain_id = p.id
+        WHERE p.{key_column} IN dirty AND {{visible}}
+    ''')
+
+def rollups_pending(conn):
+    """True when some domain or team is waiting for refresh_rollups()"""
+    return conn.execute('SELECT EXISTS (SELECT 1 FROM pnl_dirty_domains) '
+                        'OR EXISTS (SELECT 1 FROM pnl_dirty_teams)').fetchone()[0] == 1
+
+# Temp tables refresh_rollups() works from: the keys being refreshed, and
+# the P&L items of their archived rows
+ROLLUP_STAGING_TABLES = {
+    'pnl_refresh_domains': '(domain TEXT)',
+    'pnl_refresh_teams': '(team TEXT)',
+    'pnl_archived_performance': '(domain TEXT, cashgame TEXT, chalong TEXT, playgame TEXT)',
+    'pnl_archived_items': '(level TEXT, key TEXT, month_key INTEGER, month TEXT, domain_cost REAL, '
+                          'hosting_cost REAL, revenue REAL, salary REAL, registrations REAL, topups REAL)',
+}
+
+# Statements copying one archive partition's rows of the keys being
+# refreshed into temp.pnl_archived_items; {schema} and {visible} are filled
+# in as by archive_union()
+DOMAIN_DIRTY = 'WITH dirty AS (SELECT domain FROM temp.pnl_refresh_domains)'
+TEAM_DIRTY = 'WITH dirty AS (SELECT team FROM temp.pnl_refresh_teams)'
+ARCHIVED_ROLLUP_ITEMS = {
+    'domain_cost': [
+        f"""INSERT INTO temp.pnl_archived_items {DOMAIN_DIRTY}
+        SELECT 'domain', domain, month_key, month, cost, 0, 0, 0, 0, 0 FROM {{schema}}.domain_cost
+        WHERE domain IN dirty AND {{visible}}""",
+        f"""INSERT INTO temp.pnl_archived_items {TEAM_DIRTY}
+        SELECT 'team', team, month_key, month, cost, 0, 0, 0, 0, 0 FROM {{schema}}.domain_cost
+        WHERE team IN dirty AND {{visible}}""",
+    ],
+    'hosting_cost': [
+        f"""INSERT INTO temp.pnl_archived_items {DOMAIN_DIRTY}
+        SELECT 'domain', domain, month_registration_key, month_registration, 0, sum_hosting_cost_by_domain,
+               0, 0, 0, 0
+        FROM {{schema}}.hosting_cost WHERE domain IN dirty AND {{visible}}""",
+        f"""INSERT INTO temp.pnl_archived_items {TEAM_DIRTY}
+        SELECT 'team', team, month_registration_key, month_registration, 0, sum_hosting_cost_by_domain,
+               0, 0, 0, 0
+        FROM {{schema}}.hosting_cost WHERE team IN dirty AND {{visible}}""",
+    ],
+    'performance': [
+        f"""INSERT INTO temp.pnl_archived_performance {DOMAIN_DIRTY}
+        SELECT domain, cashgame, chalong, playgame FROM {{schema}}.performance
+        WHERE domain IN dirty AND {{visible}}""",
+        f"""INSERT INTO temp.pnl_archived_items {DOMAIN_DIRTY}
+        SELECT 'domain', * FROM ({{months_domain}})""",
+        f"""INSERT INTO temp.pnl_archived_items {TEAM_DIRTY}
+        SELECT 'team', * FROM ({{months_team}})""",
+    ],
+    # Revenue joins to the performance rows of every partition, so it is
+    # staged after all of them
+    'revenue': [
+        f"""INSERT INTO temp.pnl_archived_items {DOMAIN_DIRTY}
+        SELECT 'domain', domain, month_key, month, 0, 0, win_loss, 0, 0, 0 FROM (
+            SELECT DISTINCT p.domain, r.id, r.month_key, r.month, r.win_loss
+            FROM (SELECT domain, cashgame, chalong, playgame FROM main.performance WHERE domain IN dirty
+                  UNION ALL SELECT * FROM temp.pnl_archived_performance) p
+            JOIN {{schema}}.revenue r ON r.code IN (p.cashgame, p.chalong, p.playgame)
+            WHERE {{visible}}
+        )""",
+        f"""INSERT INTO temp.pnl_archived_items {TEAM_DIRTY}
+        SELECT 'team', team, month_key, month, 0, 0, win_loss, 0, 0, 0 FROM {{schema}}.revenue
+        WHERE team IN dirty AND {{visible}}""",
+    ],
+}
+
+def stage_rollup_refresh(conn):
+    """Snapshot the dirty keys and copy the P&L items of their archived rows.
+
+    Archives are attached one at a time and detached again, so a refresh
+    reads any number of archive years within SQLite's limit on attached
+    databases. ATTACH cannot run inside a transaction, so this runs before
+    refresh_rollups() opens its own; the writer lock keeps other writes
+    out in between.
+    """
+    for table, columns in ROLLUP_STAGING_TABLES.items():
+        conn.execute(f'CREATE TEMP TABLE IF NOT EXISTS {table} {columns}')
+        conn.execute(f'DELETE FROM temp.{table}')
+    conn.execute('INSERT INTO temp.pnl_refresh_domains SELECT domain FROM pnl_dirty_domains')
+    conn.execute('INSERT INTO temp.pnl_refresh_teams SELECT team FROM pnl_dirty_teams')
+    conn.commit()
+
+    order = list(ARCHIVED_ROLLUP_ITEMS)
+    partitions = sorted(conn.execute('SELECT table_name, period, archived_before FROM archive_partitions').fetchall(),
+                        key=lambda row: (order.index(row['table_name']), row['period']))
+    for table_name, period, archived_before in partitions:
+        column, scale = ARCHIVE_TABLES[table_name]
+        schema = archive_schema(period)
+        arm = [(schema, f'{column} < {archived_before * scale}')]
+        attach_archive(conn, period)
+        try:
+            for sql in ARCHIVED_ROLLUP_ITEMS[table_name]:
+                conn.execute(sql.format(schema=schema, visible=arm[0][1],
+                                        months_domain=performance_month_items('domain', arm),
+                                        months_team=performance_month_items('team', arm)))
+            conn.commit()
+        finally:
+            conn.execute(f'DETACH DATABASE {schema}')
+
+def refresh_rollups(conn):
+    """Recompute the P&L rows of dirty domains and teams.
+
+    Only keys touched since the last refresh are recomputed, using the
+    domain/team indexes on the source tables. Archived rows are staged from
+    their archive files first (see stage_rollup_refresh()), so months moved
+    out by archive_months() keep their P&L. Returns the number of domains
+    and teams refreshed.
+    """
+    if not rollups_pending(conn):
+        return {'domains': 0, 'teams': 0}
+
+    stage_rollup_refresh(conn)
+    hot = [('main', None)]
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        refreshed = {
+            'domains': conn.execute('SELECT COUNT(*) FROM temp.pnl_refresh_domains').fetchone()[0],
+            'teams': conn.execute('SELECT COUNT(*) FROM temp.pnl_refresh_teams').fetchone()[0],
+        }
+        conn.execute('DELETE FROM pnl_domain_month WHERE domain IN (SELECT domain FROM temp.pnl_refresh_domains)')
+        conn.execute(f'''
+            INSERT INTO pnl_domain_month (domain, month_key, month, domain_cost, hosting_cost, revenue,
+                                          registrations, topups, profit)
+            WITH dirty AS (SELECT domain FROM temp.pnl_refresh_domains),
+            dirty_performance AS (
+                SELECT domain, cashgame, chalong, playgame FROM main.performance WHERE domain IN dirty
+                UNION ALL
+                SELECT * FROM temp.pnl_archived_performance
+            ),
+            items (key, month_key, month, domain_cost, hosting_cost, revenue, salary, registrations, topups) AS (
+                SELECT domain, month_key, month, cost, 0, 0, 0, 0, 0 FROM main.domain_cost
+                WHERE domain IN dirty
+                UNION ALL
+                SELECT domain, month_registration_key, month_registration, 0, sum_hosting_cost_by_domain, 0, 0, 0, 0
+                FROM main.hosting_cost WHERE domain IN dirty
+                UNION ALL
+                SELECT domain, month_key, month, 0, 0, win_loss, 0, 0, 0 FROM (
+                    SELECT DISTINCT p.domain, r.id, r.month_key, r.month, r.win_loss
+                    FROM dirty_performance p JOIN main.revenue r ON r.code IN (p.cashgame, p.chalong, p.playgame)
+                )
+                UNION ALL
+                {performance_month_items('domain', hot)}
+                UNION ALL
+                SELECT key, month_key, month, domain_cost, hosting_cost, revenue, salary, registrations, topups
+                FROM temp.pnl_archived_items WHERE level = 'domain'
+            )
+            SELECT key, COALESCE(month_key, 0), MIN(month),
+                   TOTAL(domain_cost), TOTAL(hosting_cost), TOTAL(revenue),
+                   TOTAL(registrations), TOTAL(topups),
+                   TOTAL(revenue) - TOTAL(domain_cost) - TOTAL(hosting_cost)
+            FROM items GROUP BY key, COALESCE(month_key, 0)
+        ''')
+
+        conn.execute('DELETE FROM pnl_team_month WHERE team IN (SELECT team FROM temp.pnl_refresh_teams)')
+        conn.execute(f'''
+            INSERT INTO pnl_team_month (team, month_key, month, domain_cost, hosting_cost, revenue, salary,
+                                        registrations, topups, profit)
+            WITH dirty AS (SELECT team FROM temp.pnl_refresh_teams),
+            items (key, month_key, month, domain_cost, hosting_cost, revenue, salary, registrations, topups) AS (
+                SELECT team, month_key, month, cost, 0, 0, 0, 0, 0 FROM main.domain_cost
+                WHERE team IN dirty
+                UNION ALL
+                SELECT team, month_registration_key, month_registration, 0, sum_hosting_cost_by_domain, 0, 0, 0, 0
+                FROM main.hosting_cost WHERE team IN dirty
+                UNION ALL
+                SELECT team, month_key, month, 0, 0, win_loss, 0, 0, 0 FROM main.revenue
+                WHERE team IN dirty
+                UNION ALL
+                {performance_month_items('team', hot)}
+                UNION ALL
+                SELECT key, month_key, month, domain_cost, hosting_cost, revenue, salary, registrations, topups
+                FROM temp.pnl_archived_items WHERE level = 'team'
+            ),
+            months AS (
+                SELECT key, COALESCE(month_key, 0) AS month_key, MIN(month) AS month,
+                       TOTAL(domain_cost) AS domain_cost, TOTAL(hosting_cost) AS hosting_cost,
+                       TOTAL(revenue) AS revenue, TOTAL(registrations) AS registrations,
+                       TOTAL(topups) AS topups
+                FROM items GROUP BY key, COALESCE(month_key, 0)
+            ),
+            -- salary rows are monthly pay with no month of their own, so every month
+            -- of a team is charged the team's current payroll: a salary edit changes
+            -- the profit of past months too, and months need other activity to appear
+            salaries AS (
+                SELECT team AS key, TOTAL(salary) AS salary FROM salary WHERE team IN dirty GROUP BY team
+            )
+            SELECT m.key, m.month_key, m.month, m.domain_cost, m.hosting_cost, m.revenue,
+                   COALESCE(s.salary, 0), m.registrations, m.topups,
+                   m.revenue - m.domain_cost - m.hosting_cost - COALESCE(s.salary, 0)
+            FROM months m LEFT JOIN salaries s ON s.key = m.key
+        ''')
+
+        # Keys marked after the snapshot stay dirty for the next refresh
+        conn.execute('DELETE FROM pnl_dirty_domains '
+                     'WHERE domain IN (SELECT domain FROM temp.pnl_refresh_domains) OR domain IS NULL')
+        conn.execute('DELETE FROM pnl_dirty_teams WHERE team IN (SELECT team FROM temp.pnl_refresh_teams) OR team IS NULL')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return refreshed
+
+def create_base_tables(conn):
     # Domain Cost table
     conn.execute('''
         CREATE TABLE IF NOT EXISTS domain_cost (
@@ -60,12 +1352,6 @@ def init_database():
             playgame TEXT,
             total_register INTEGER,
             total_topup INTEGER,
-            regis_may INTEGER,
-            topup_may INTEGER,
-            regis_june INTEGER,
-            topup_june INTEGER,
-            regis_july INTEGER,
-            topup_july INTEGER,
             cvr TEXT,
             first_seen_cg TEXT,
             first_seen_cl TEXT,
@@ -100,22 +1386,108 @@ def init_database():
         )
     ''')
     
+    # Tables being bulk-loaded by the open transaction; per-row triggers skip them
+    conn.execute('CREATE TABLE IF NOT EXISTS bulk_loads (table_name TEXT PRIMARY KEY)')
+    
+    # Per-table write counters, bumped by triggers; see create_write_generations()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS write_generations (
+            table_name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL,
+            modified_at INTEGER NOT NULL
+        )
+    ''')
+    
+    # Exact row counters and running totals maintained by triggers
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_stats (
+            table_name TEXT PRIMARY KEY,
+            row_count INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_sums (
+            table_name TEXT,
+            column_name TEXT,
+            total REAL NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        )
+    ''')
+    
+
+def create_search_indexes(conn):
+    for table in SEARCH_COLUMNS:
+        create_search_index(conn, table)
+
+def create_all_table_stats(conn):
+    for table in STATS_SUM_COLUMNS:
+        create_table_stats(conn, table)
+
+def migrate_performance_monthly(conn):
+    # Databases that already have rollups must recompute them from the new table
+    if (create_performance_monthly(conn)
+            and conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'pnl_dirty_domains'").fetchone()):
+        mark_rollups_dirty(conn, 'performance')
+
+def recreate_performance_wide(conn):
+    conn.execute('DROP VIEW IF EXISTS performance_wide')
+    conn.execute(f'CREATE VIEW performance_wide AS {performance_wide_sql()}')
+
+def create_archive_partitions(conn):
+    """Registry of the archive files rows were moved to; see archive_months()"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_partitions (
+            period INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            archived_before INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            archived_at TEXT NOT NULL,
+            PRIMARY KEY (table_name, period)
+        )
+    ''')
+
+def create_archive_partition_sums(conn):
+    """Count archived rows per partition instead of in table_stats/table_sums.
+
+    Archiving used to leave the counters as they were, so they kept counting
+    rows that hot reads no longer return. Existing partitions are counted
+    from their files (see count_archive_partition()) and the counters of
+    the archived tables recomputed from their hot rows.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_partition_sums (
+            period INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            column_name TEXT NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (table_name, period, column_name)
+        )
+    ''')
+    partitions = conn.execute('SELECT period, table_name FROM archive_partitions').fetchall()
+    if not partitions:
+        return
+    # ATTACH cannot run inside a transaction
     conn.commit()
-    conn.close()
+    for period, table_name in partitions:
+        schema = attach_archive(conn, period)
+        try:
+            count_archive_partition(conn, schema, period, table_name)
+            conn.commit()
+        finally:
+            conn.execute(f'DETACH DATABASE {schema}')
+    for table_name in ARCHIVE_TABLES:
+        conn.execute(f'UPDATE table_stats SET row_count = (SELECT COUNT(*) FROM {table_name}) '
+                     'WHERE table_name = ?', (table_name,))
+        for column in STATS_SUM_COLUMNS[table_name]:
+            conn.execute(f'UPDATE table_sums SET total = (SELECT TOTAL({column}) FROM {table_name}) '
+                         'WHERE table_name = ? AND column_name = ?', (table_name, column))
 
-def import_initial_data():
-    """Import CSV data only if tables are empty"""
-    conn = get_db_connection()
-    
-    # Check if data already exists
-    domain_count = conn.execute('SELECT COUNT(*) FROM domain_cost').fetchone()[0]
-    if domain_count > 0:
-        print("Database already has data, skipping initial import.")
-        conn.close()
+def import_initial_data(conn):
+    """Seed sample rows into an empty database"""
+    if conn.execute('SELECT 1 FROM domain_cost LIMIT 1').fetchone():
         return
     
-    print("Importing initial CSV data...")
-    
     # Sample data for initial deployment
     sample_domain_data = [
         ('example.com', 'sample', 'Sample Type', 'Sample Team', 'Sample Owner', '1 Jan 2025', 'A', 100.0, 'Jan 2025'),
@@ -128,8 +1500,14 @@ def import_initial_data():
     ]
     
     sample_performance_data = [
-        ('example.com', 'Sample Team', 'Sample Owner', 'A', '1 Jan 2025', 'sample123', 'sample123', 'sample123', 10, 5, 2, 1, 3, 2, 5, 2, '10%', '', '', '', '', 25),
-        ('demo.com', 'Demo Team', 'Demo Owner', 'B', '1 Feb 2025', 'demo456', 'demo456', 'demo456', 20, 10, 4, 3, 6, 4, 10, 3, '15%', '', '', '', '', 50)
+        ('example.com', 'Sample Team', 'Sample Owner', 'A', '1 Jan 2025', 'sample123', 'sample123', 'sample123', 10, 5, '10%', '', '', '', '', 25),
+        ('demo.com', 'Demo Team', 'Demo Owner', 'B', '1 Feb 2025', 'demo456', 'demo456', 'demo456', 20, 10, '15%', '', '', '', '', 50)
+    ]
+    
+    # (month_key, regis, topup, domain)
+    sample_performance_monthly = [
+        (202505, 2, 1, 'example.com'), (202506, 3, 2, 'example.com'), (202507, 5, 2, 'example.com'),
+        (202505, 4, 3, 'demo.com'), (202506, 6, 4, 'demo.com'), (202507, 10, 3, 'demo.com')
     ]
     
     sample_revenue_data = [
@@ -142,122 +1520,1240 @@ def import_initial_data():
         ('Demo Employee', 17000.0, 'Demo Team')
     ]
     
+    for table_name, rows in (('domain_cost', sample_domain_data),
+                             ('hosting_cost', sample_hosting_data),
+                             ('performance', sample_performance_data),
+                             ('revenue', sample_revenue_data),
+                             ('salary', sample_salary_data)):
+        conn.executemany(INSERT_STATEMENTS[table_name],
+                         [with_date_keys(table_name, row) for row in rows])
+    conn.executemany('INSERT OR REPLACE INTO performance_monthly (domain_id, month_key, regis, topup) '
+                     'SELECT id, ?, ?, ? FROM performance WHERE domain = ?', sample_performance_monthly)
+
+# Schema migrations, applied in order and recorded in schema_version. Append
+# new steps with the next version; never change or renumber applied ones.
+# Steps must be safe to re-run: helpers such as create_table_stats() commit
+# on their own, so a crash can leave a step applied but not yet recorded.
+# Versions 1-10 are the schema that used to be created on every startup, so
+# databases from before schema_version run them all as a no-op baseline.
+MIGRATIONS = [
+    (1, 'base_tables', create_base_tables),
+    (2, 'date_key_columns', add_date_key_columns),
+    (3, 'natural_keys', add_natural_keys),
+    (4, 'indexes', create_indexes),
+    (5, 'search_indexes', create_search_indexes),
+    (6, 'table_stats', create_all_table_stats),
+    (7, 'performance_monthly', migrate_performance_monthly),
+    (8, 'write_generations', create_write_generations),
+    (9, 'rollups', create_rollup_tables),
+    (10, 'sample_data', import_initial_data),
+    (11, 'write_rewrites', add_write_rewrites),
+    (12, 'archive_partitions', create_archive_partitions),
+    (13, 'performance_wide_year', recreate_performance_wide),
+    (14, 'row_hash_triggers', create_row_hash_triggers),
+    (15, 'archive_partition_sums', create_archive_partition_sums),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Run pending migrations at startup; with 0, run `flask --app app db upgrade`
+# before starting the web server instead
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1').lower() not in ('0', 'false', 'off')
+MIGRATION_LOCK_PATH = os.environ.get('MIGRATION_LOCK_PATH', DATABASE + '.migrate.lock')
+
+def read_schema_version(conn):
     try:
-        # Insert sample data
-        conn.executemany('''
-            INSERT INTO domain_cost (domain, kw, type, team, owner, end_date, plan, cost, month)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_domain_data)
-        
-        conn.executemany('''
-            INSERT INTO hosting_cost (month_registration, month_expire, domain, team, sum_hosting_cost_by_domain)
-            VALUES (?, ?, ?, ?, ?)
-        ''', sample_hosting_data)
-        
-        conn.executemany('''
-            INSERT INTO performance (domain, team, owner, plan, end_date, cashgame, chalong, playgame,
-                                   total_register, total_topup, regis_may, topup_may, regis_june, topup_june,
-                                   regis_july, topup_july, cvr, first_seen_cg, first_seen_cl, first_seen_pg,
-                                   date_gap, unique_visits)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_performance_data)
-        
-        conn.executemany('''
-            INSERT INTO revenue (code, month, owner, team, web, win_loss, rename, reteam)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', sample_revenue_data)
-        
-        conn.executemany('''
-            INSERT INTO salary (nickname, salary, team)
-            VALUES (?, ?, ?)
-        ''', sample_salary_data)
-        
-        conn.commit()
-        print("Sample data imported successfully!")
-        
-    except Exception as e:
-        print(f"Error importing sample data: {e}")
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        return 0
+
+@contextlib.contextmanager
+def migration_lock():
+    """Exclusive lock file so that only one process migrates at a time"""
+    if fcntl is None:
+        yield
+        return
+    with open(MIGRATION_LOCK_PATH, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def migrate_database(target=None):
+    """Apply pending migrations up to target (default: all); returns the (version, name) pairs applied.
+
+    The version is read after taking the lock, so processes that queued
+    behind the one migrating find nothing left to do.
+    """
+    applied = []
+    with migration_lock():
+        conn = get_db_connection()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TEXT NOT NULL
+                )
+            ''')
+            current = read_schema_version(conn)
+            for version, name, step in MIGRATIONS:
+                if version <= current or (target is not None and version > target):
+                    continue
+                step(conn)
+                conn.execute('INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                             (version, name, datetime.now().isoformat(timespec='seconds')))
+                conn.commit()
+                applied.append((version, name))
+            if applied:
+                conn.execute('PRAGMA optimize')
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+    return applied
+
+def check_schema():
+    """Startup check, a single query when the schema is current.
+
+    Migrates first if AUTO_MIGRATE is on; otherwise returns False while
+    migrations are pending.
+    """
+    conn = get_db_connection()
+    try:
+        current = read_schema_version(conn)
+    finally:
+        conn.close()
+    if current >= SCHEMA_VERSION:
+        return True
+    if not AUTO_MIGRATE:
+        app.logger.warning('Database schema is at version %s of %s; run `flask --app app db upgrade`',
+                           current, SCHEMA_VERSION)
+        return False
+    for version, name in migrate_database():
+        app.logger.info('Applied migration %s: %s', version, name)
+    return True
+
+db_cli = AppGroup('db', help='Database schema migrations, bundle imports and archiving.')
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, help='Stop after this version.')
+def db_upgrade(target):
+    """Apply pending schema migrations."""
+    for version, name in migrate_database(target):
+        click.echo(f'Applied migration {version}: {name}')
+    db_current.callback()
+
+@db_cli.command('current')
+def db_current():
+    """Show the applied migrations and schema version."""
+    conn = get_db_connection()
+    try:
+        current = read_schema_version(conn)
+        history = conn.execute('SELECT version, name, applied_at FROM schema_version ORDER BY version'
+                               ).fetchall() if current else []
     finally:
         conn.close()
+    for row in history:
+        click.echo(f"{row['version']:>4}  {row['name']:<24} {row['applied_at']}")
+    click.echo(f'Database schema is at version {current} of {SCHEMA_VERSION}')
+
+app.cli.add_command(db_cli)
+
+# Response cache bounds, per worker process
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1024))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+class ResponseCache:
+    """Per-process LRU cache of rendered responses, bounded by entries and bytes.
+
+    Entries remember the write generations of the tables they were built
+    from and are only served while those are unchanged, so a write made by
+    any worker invalidates them everywhere.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0, 'not_modified': 0}
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['versions'] != versions:
+                self._stats['stale'] += 1
+                self._bytes -= len(self._entries.pop(key)['body'])
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, entry):
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous['body'])
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted['body'])
+                self._stats['evictions'] += 1
+
+    def record_not_modified(self):
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._entries), bytes=self._bytes,
+                         max_entries=self.max_entries, max_bytes=self.max_bytes)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return stats
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+
+def cached_response(*tables):
+    """Cache a GET view's response per path and query arguments.
+
+    tables are the tables the response is built from, with '{table_name}'
+    style placeholders filled from the view arguments; none means every
+    table. Responses carry an ETag and Last-Modified and must be
+    revalidated, so browsers and pollers get 304s until the data changes.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            # Pending flash messages are rendered into the page
+            if '_flashes' in session:
+                return view(**kwargs)
+            try:
+                conn = get_db_connection()
+                try:
+                    generations = read_write_generations(conn)
+                finally:
+                    conn.close()
+            except sqlite3.Error:
+                return view(**kwargs)
+
+            names = [table.format(**kwargs) for table in tables] or list(generations)
+            versions = tuple(generations.get(name, (0, 0))[0] for name in names)
+            modified = max((generations.get(name, (0, 0))[1] for name in names), default=0)
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = response_cache.get(key, versions)
+            if entry is None:
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200 or response.is_streamed or response.cache_control.no_store:
+                    return response
+                body = response.get_data()
+                entry = {'versions': versions, 'body': body, 'content_type': response.content_type,
+                         'etag': hashlib.md5(body).hexdigest()}
+                response_cache.put(key, entry)
+            else:
+                response = app.response_class(entry['body'], content_type=entry['content_type'])
+
+            response.set_etag(entry['etag'])
+            if modified:
+                response.last_modified = modified
+            response.cache_control.no_cache = True
+            response.make_conditional(request)
+            if response.status_code == 304:
+                response_cache.record_not_modified()
+            return response
+        return wrapper
+    return decorator
 
 @app.route('/')
+@cached_response()
 def index():
     try:
         conn = get_db_connection()
-        
-        # Get counts for dashboard
-        counts = {}
-        tables = ['domain_cost', 'hosting_cost', 'performance', 'revenue', 'salary']
-        
-        for table in tables:
-            try:
-                count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
-                counts[table] = count
-            except:
-                counts[table] = 0
-        
-        conn.close()
-        return render_template('index.html', counts=counts)
+        try:
+            stats = read_table_stats(conn)
+        finally:
+            conn.close()
     except Exception as e:
         return f"Database connection error: {e}", 500
 
+    # Get counts for dashboard
+    counts = {table: stats.get(table, {}).get('row_count', 0) for table in STATS_SUM_COLUMNS}
+    return render_template('index.html', counts=counts)
+
+# Column names and the Python type used to parse filter values for each table
+TABLE_COLUMNS = {
+    'domain_cost': {
+        'id': int, 'domain': str, 'kw': str, 'type': str, 'team': str, 'owner': str,
+        'end_date': str, 'plan': str, 'cost': float, 'month': str,
+        'month_key': int, 'end_date_key': int,
+    },
+    'hosting_cost': {
+        'id': int, 'month_registration': str, 'month_expire': str, 'domain': str, 'team': str,
+        'sum_hosting_cost_by_domain': float, 'month_registration_key': int, 'month_expire_key': int,
+    },
+    'performance': {
+        'id': int, 'domain': str, 'team': str, 'owner': str, 'plan': str, 'end_date': str,
+        'cashgame': str, 'chalong': str, 'playgame': str, 'total_register': int, 'total_topup': int,
+        'cvr': str, 'first_seen_cg': str,
+        'first_seen_cl': str, 'first_seen_pg': str, 'date_gap': str, 'unique_visits': int,
+        'end_date_key': int,
+    },
+    'revenue': {
+        'id': int, 'code': str, 'month': str, 'owner': str, 'team': str, 'web': str,
+        'win_loss': float, 'rename': str, 'reteam': str, 'month_key': int,
+    },
+    'salary': {
+        'id': int, 'nickname': str, 'salary': float, 'team': str,
+    },
+}
+
+# Relations listings read from, when not the table itself
+READ_SOURCES = {'performance': 'performance_wide'}
+
+# Columns listings can select and filter on, including view-only columns
+READ_COLUMNS = {table: dict(columns) for table, columns in TABLE_COLUMNS.items()}
+READ_COLUMNS['performance'].update({column: int for _, regis, topup in PERFORMANCE_WIDE_COLUMNS
+                                    for column in (regis, topup)})
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Query arguments that control paging or output rather than filter rows
+PAGING_ARGS = {'before', 'after', 'limit', 'fields', 'format', 'gzip'}
+
+# Month key column used by month_from/month_to, per table
+MONTH_FILTER_COLUMNS = {
+    'domain_cost': 'month_key',
+    'hosting_cost': 'month_registration_key',
+    'revenue': 'month_key',
+}
+
+# End date key column used by expires_within_days and whether it is a
+# yyyymmdd (day) or yyyymm (month) key
+EXPIRY_FILTER_COLUMNS = {
+    'domain_cost': ('end_date_key', 'day'),
+    'hosting_cost': ('month_expire_key', 'month'),
+    'performance': ('end_date_key', 'day'),
+}
+
+def date_range_filter(table_name, key, value):
+    """Resolve month_from/month_to/expires_within_days to a key column range"""
+    if key in ('month_from', 'month_to'):
+        if table_name not in MONTH_FILTER_COLUMNS:
+            raise ValueError(f'{key} is not supported for {table_name}')
+        month_key = parse_month_key(value)
+        if month_key is None:
+            raise ValueError(f'Invalid month for {key}: {value!r}')
+        op = '>=' if key == 'month_from' else '<='
+        return [f'{MONTH_FILTER_COLUMNS[table_name]} {op} ?'], [month_key]
+
+    if table_name not in EXPIRY_FILTER_COLUMNS:
+        raise ValueError(f'{key} is not supported for {table_name}')
+    try:
+        days = int(value)
+        if days < 0:
+            raise ValueError
+        start, end = date.today(), date.today() + timedelta(days=days)
+    except (ValueError, OverflowError):
+        raise ValueError(f'Invalid value for {key}: {value!r}')
+    column, unit = EXPIRY_FILTER_COLUMNS[table_name]
+    if unit == 'day':
+        keys = [int(start.strftime('%Y%m%d')), int(end.strftime('%Y%m%d'))]
+    else:
+        keys = [int(start.strftime('%Y%m')), int(end.strftime('%Y%m'))]
+    return [f'{column} BETWEEN ? AND ?'], keys
+
+def build_filters(table_name, args):
+    """Translate query arguments into a WHERE clause for table_name.
+
+    ``column=value`` filters on equality (repeat the argument to match any of
+    several values) and ``column_min``/``column_max`` give inclusive ranges on
+    numeric columns. ``month_from``/``month_to`` and ``expires_within_days``
+    range over the indexed date key columns. Raises ValueError for unknown
+    columns or bad values.
+    """
+    columns = READ_COLUMNS[table_name]
+    clauses, params = [], []
+    for key in args:
+        if key in PAGING_ARGS:
+            continue
+        if key in ('month_from', 'month_to', 'expires_within_days'):
+            range_clauses, range_params = date_range_filter(table_name, key, args.get(key))
+            clauses.extend(range_clauses)
+            params.extend(range_params)
+            continue
+        column, op = key, '='
+        if key not in columns and key[-4:] in ('_min', '_max') and key[:-4] in columns:
+            column, op = key[:-4], '>=' if key.endswith('_min') else '<='
+            if columns[column] is str:
+                raise ValueError(f'Range filters are only supported on numeric columns: {key}')
+        if column not in columns:
+            raise ValueError(f'Unknown filter: {key}')
+
+        try:
+            values = [columns[column](value) for value in args.getlist(key)]
+        except ValueError:
+            raise ValueError(f'Invalid value for {key}: {args.get(key)!r}')
+
+        if op == '=' and len(values) > 1:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        else:
+            for value in values:
+                clauses.append(f'{column} {op} ?')
+                params.append(value)
+    return clauses, params
+
+def fetch_page(conn, table_name, args, columns=None):
+    """Fetch one keyset-paginated page of table_name, newest rows first.
+
+    ``before=<id>`` pages towards older rows and ``after=<id>`` towards newer
+    ones, so every page is a range scan on the primary key regardless of how
+    deep it is. Returns the rows and the cursors for the adjacent pages.
+    """
+    limit = min(max(args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    before = args.get('before', type=int)
+    after = args.get('after', type=int)
+
+    if columns is None:
+        columns = list(READ_COLUMNS[table_name])
+    elif 'id' not in columns:
+        columns = ['id'] + columns
+    unknown = [column for column in columns if column not in READ_COLUMNS[table_name]]
+    if unknown:
+        raise ValueError(f"Unknown column: {', '.join(unknown)}")
+
+    clauses, params = build_filters(table_name, args)
+    if after is not None:
+        clauses.append('id > ?')
+        params.append(after)
+        order = 'ASC'
+    else:
+        if before is not None:
+            clauses.append('id < ?')
+            params.append(before)
+        order = 'DESC'
+
+    # Archived partitions are read too when the date filters reach them
+    sql, params = archive_select(conn, table_name, columns, clauses, params, *archive_range(table_name, args))
+    rows = conn.execute(f'{sql} ORDER BY id {order} LIMIT ?', params + [limit + 1]).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+
+    newer = older = None
+    if rows:
+        if after is not None:
+            newer = rows[0]['id'] if has_more else None
+            older = rows[-1]['id']
+        else:
+            newer = rows[0]['id'] if before is not None else None
+            older = rows[-1]['id'] if has_more else None
+    return rows, {'limit': limit, 'newer': newer, 'older': older}
+
+def render_table_page(table_name):
+    conn = get_db_connection()
+    try:
+        data, page = fetch_page(conn, table_name, request.args)
+    except ValueError as e:
+        flash(str(e))
+        data, page = fetch_page(conn, table_name, MultiDict())
+    finally:
+        conn.close()
+    page['args'] = {key: values for key, values in request.args.to_dict(flat=False).items()
+                    if key not in ('before', 'after')}
+    return render_template(f'{table_name}.html', data=data, page=page)
+
 @app.route('/domain_cost')
+@cached_response('domain_cost')
 def domain_cost():
-    conn = get_db_connection()
-    data = conn.execute('SELECT * FROM domain_cost ORDER BY id DESC LIMIT 100').fetchall()
-    conn.close()
-    return render_template('domain_cost.html', data=data)
+    return render_table_page('domain_cost')
 
 @app.route('/hosting_cost')
+@cached_response('hosting_cost')
 def hosting_cost():
-    conn = get_db_connection()
-    data = conn.execute('SELECT * FROM hosting_cost ORDER BY id DESC LIMIT 100').fetchall()
-    conn.close()
-    return render_template('hosting_cost.html', data=data)
+    return render_table_page('hosting_cost')
 
 @app.route('/performance')
+@cached_response('performance')
 def performance():
-    conn = get_db_connection()
-    data = conn.execute('SELECT * FROM performance ORDER BY id DESC LIMIT 100').fetchall()
-    conn.close()
-    return render_template('performance.html', data=data)
+    return render_table_page('performance')
 
 @app.route('/revenue')
+@cached_response('revenue')
 def revenue():
-    conn = get_db_connection()
-    data = conn.execute('SELECT * FROM revenue ORDER BY id DESC LIMIT 100').fetchall()
-    conn.close()
-    return render_template('revenue.html', data=data)
+    return render_table_page('revenue')
 
 @app.route('/salary')
+@cached_response('salary')
 def salary():
+    return render_table_page('salary')
+
+@app.route('/api/<table_name>')
+@cached_response('{table_name}')
+def api_table(table_name):
+    """Keyset-paginated, filterable JSON listing of a table"""
+    if table_name not in TABLE_COLUMNS:
+        return jsonify({"error": f"Unknown table: {table_name}"}), 404
+
+    fields = request.args.get('fields')
+    columns = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+    conn = get_db_connection()
+    try:
+        rows, page = fetch_page(conn, table_name, request.args, columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        conn.close()
+
+    return jsonify({
+        'table': table_name,
+        'data': [dict(row) for row in rows],
+        'limit': page['limit'],
+        'next_before': page['older'],
+        'prev_after': page['newer'],
+    })
+
+# Rows fetched per cursor step and bytes buffered per chunk when exporting
+EXPORT_FETCH_ROWS = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+def iter_export_rows(conn, table_name, clauses, params, months=(None, None)):
+    """Yield the export header, then every matching row in id order.
+
+    Headers are the column names, which import_csv reads back; performance
+    rows carry their monthly figures as 'Regis - May 2025' / 'Topup - May
+    2025' pairs. Rows are fetched from the cursor in small steps, so memory
+    use does not grow with the table. Archives holding months in the
+    (first, last) months range are exported too. The month header and the
+    rows are read in one transaction, so a write committed mid-export
+    cannot add a month the header lacks.
+    """
+    columns = ['id'] + SOURCE_COLUMNS[table_name]
+    source = READ_SOURCES.get(table_name, table_name)
+    month_positions = {}
+    header = list(columns)
+    # Archives are attached first: ATTACH cannot run inside the transaction
+    monthly_arms = None
+    if table_name == 'performance':
+        monthly_arms = archive_arms(conn, 'performance_monthly', *months)
+        columns = columns + [f"(SELECT group_concat(month_key || ':' || regis || ':' || topup) "
+                             f"FROM {{schema}}.performance_monthly WHERE domain_id = {source}.id) AS months"]
+    sql, params = archive_select(conn, table_name, columns, clauses, params, *months)
+    conn.execute('BEGIN')
+    if monthly_arms is not None:
+        monthly = archive_union(monthly_arms, 'SELECT month_key FROM {schema}.performance_monthly')
+        for (month_key,) in conn.execute(f'SELECT DISTINCT month_key FROM ({monthly}) ORDER BY month_key'):
+            label = date(month_key // 100, month_key % 100, 1).strftime('%b %Y')
+            month_positions[month_key] = len(header)
+            header += [f'Regis - {label}', f'Topup - {label}']
+    yield header
+
+    cursor = conn.execute(f'{sql} ORDER BY id', params)
+    while True:
+        rows = cursor.fetchmany(EXPORT_FETCH_ROWS)
+        if not rows:
+            break
+        for row in rows:
+            if monthly_arms is None:
+                yield tuple(row)
+                continue
+            values = list(row[:-1]) + [''] * (len(header) - len(row) + 1)
+            for month in row[-1].split(',') if row[-1] else ():
+                month_key, regis, topup = month.split(':')
+                position = month_positions[int(month_key)]
+                values[position:position + 2] = regis, topup
+            yield values
+
+def stream_export(table_name, clauses, params, export_format, compress, months=(None, None)):
+    """Generate an export as encoded (and optionally gzipped) chunks.
+
+    The connection is taken when the response starts streaming and returned
+    when it ends or the client goes away. The header goes out on its own so
+    the first byte is sent before the query has produced anything.
+    """
     conn = get_db_connection()
-    data = conn.execute('SELECT * FROM salary ORDER BY id DESC LIMIT 100').fetchall()
-    conn.close()
-    return render_template('salary.html', data=data)
+    try:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def flush(sync=False):
+            chunk = buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+            if compressor:
+                chunk = compressor.compress(chunk)
+                if sync:
+                    chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+            return chunk
+
+        rows = iter_export_rows(conn, table_name, clauses, params, months)
+        header = next(rows)
+        if export_format == 'csv':
+            writer.writerow(header)
+            yield flush(sync=True)
+        for row in rows:
+            if export_format == 'csv':
+                writer.writerow(row)
+            else:
+                buffer.write(json.dumps(dict(zip(header, row)), ensure_ascii=False) + '\n')
+            if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+        chunk = flush()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+    finally:
+        conn.close()
+
+@app.route('/export/<table_name>')
+def export_table(table_name):
+    """Stream a table as CSV (default) or NDJSON, accepting the listing filters
 
-def safe_float(value):
-    """Safely convert value to float"""
-    if not value or value == '':
-        return 0.0
+    ?gzip=1 compresses the stream with Content-Encoding: gzip.
+    """
+    if table_name not in TABLE_COLUMNS:
+        return jsonify({"error": f"Unknown table: {table_name}"}), 404
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unknown export format: {export_format}"}), 400
+    try:
+        clauses, params = build_filters(table_name, request.args)
+        months = archive_range(table_name, request.args)
+        # Checked up front: once streaming has started, errors can only cut the file short
+        conn = get_db_connection()
+        try:
+            archive_partitions_in_range(conn, table_name, *months)
+        finally:
+            conn.close()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    compress = request.args.get('gzip') in ('1', 'true')
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = app.response_class(stream_export(table_name, clauses, params, export_format, compress, months),
+                                  mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={table_name}.{extension}'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+SEARCH_LIMIT = 20
+
+def search_table(conn, table, query, limit):
+    """Search one table's FTS index, newest matches first.
+
+    Trigram indexes need at least three characters, so shorter queries (and
+    databases without FTS5) fall back to a LIKE scan bounded by the limit.
+    """
+    fts_table = f'{table}_fts'
+    columns = SEARCH_COLUMNS[table]
+    select_list = ', '.join(f'{table}.{column}' for column in TABLE_COLUMNS[table])
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (fts_table,)).fetchone()
+    trigram = row is not None and 'trigram' in row['sql']
+
+    if row is not None and (len(query) >= 3 or not trigram):
+        phrases = [query] if trigram else query.split()
+        match = ' '.join('"' + phrase.replace('"', '""') + '"' + ('' if trigram else '*')
+                         for phrase in phrases)
+        return conn.execute(f'''
+            SELECT {select_list} FROM {fts_table}
+            JOIN {table} ON {table}.id = {fts_table}.rowid
+            WHERE {fts_table} MATCH ?
+            ORDER BY {fts_table}.rowid DESC
+            LIMIT ?
+        ''', (match, limit)).fetchall()
+
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    where = ' OR '.join(f"{column} LIKE ? ESCAPE '\\'" for column in columns)
+    return conn.execute(f'SELECT {select_list} FROM {table} WHERE {where} ORDER BY id DESC LIMIT ?',
+                        [pattern] * len(columns) + [limit]).fetchall()
+
+@app.route('/api/search')
+@cached_response()
+def api_search():
+    """Substring/prefix search over domain, kw, code and owner columns"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Missing search query 'q'"}), 400
+    limit = min(max(request.args.get('limit', SEARCH_LIMIT, type=int), 1), MAX_PAGE_SIZE)
+    tables = request.args.get('tables')
+    tables = [table.strip() for table in tables.split(',')] if tables else list(SEARCH_COLUMNS)
+    unknown = [table for table in tables if table not in SEARCH_COLUMNS]
+    if unknown:
+        return jsonify({"error": f"Unknown table: {', '.join(unknown)}"}), 400
+
+    conn = get_db_connection()
+    try:
+        results = {table: [dict(row) for row in search_table(conn, table, query, limit)]
+                   for table in tables}
+    finally:
+        conn.close()
+    return jsonify({'query': query, 'results': results})
+
+# Rows converted and written per executemany() call during CSV import
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+
+# Bytes read from an upload per decode step
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Import modes: append every row, or upsert by natural key (NATURAL_KEYS)
+IMPORT_MODES = ('append', 'upsert')
+
+# Rejected rows reported individually in an import summary
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+# Columns filled from CSV cells or form fields, in INSERT order
+SOURCE_COLUMNS = {
+    table: [column for column in columns if column != 'id'
+            and column not in {key for key, _, _ in DATE_KEY_COLUMNS.get(table, ())}]
+    for table, columns in TABLE_COLUMNS.items()
+}
+
+# Positions of the source columns parsed into each date key
+DATE_KEY_POSITIONS = {
+    table: [(SOURCE_COLUMNS[table].index(source_column), parser)
+            for _, source_column, parser in DATE_KEY_COLUMNS.get(table, ())]
+    for table in TABLE_COLUMNS
+}
+
+WRITE_COLUMNS = {
+    table: SOURCE_COLUMNS[table] + [key for key, _, _ in DATE_KEY_COLUMNS.get(table, ())]
+    for table in TABLE_COLUMNS
+}
+
+INSERT_STATEMENTS = {
+    table: f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for table, columns in WRITE_COLUMNS.items()
+}
+
+# Inserts with an explicit id, for rows whose children are written alongside them
+INSERT_WITH_ID_STATEMENTS = {
+    table: f"INSERT INTO {table} (id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})"
+    for table, columns in WRITE_COLUMNS.items()
+}
+
+PERFORMANCE_MONTHLY_UPSERT = ('INSERT OR REPLACE INTO performance_monthly (domain_id, month_key, regis, topup) '
+                              'VALUES (?, ?, ?, ?)')
+
+UPDATE_STATEMENTS = {
+    table: f"UPDATE {table} SET {', '.join(f'{column}=?' for column in columns)} WHERE id=?"
+    for table, columns in WRITE_COLUMNS.items()
+}
+
+def with_date_keys(table_name, values):
+    """Append the parsed date keys to a tuple of SOURCE_COLUMNS values"""
+    return values + tuple(parser(values[position]) for position, parser in DATE_KEY_POSITIONS[table_name])
+
+# CSV headers accepted for a source column, in order of preference, where
+# they differ from the column name. Headers match case-insensitively with runs
+# of spaces, dashes and underscores treated alike, so 'First Seen - CG' fills
+# first_seen_cg and 'Total Register' fills total_register.
+CSV_HEADERS = {
+    'salary': {
+        'nickname': ('ชื่อเล่น', 'nickname'),
+        'salary': ('เงินเดือน', 'salary'),
+        'team': ('เบิกทีม', 'team'),
+    },
+}
+
+def csv_header_key(header):
+    return re.sub(r'[\s_-]+', '_', header.strip().lower()).strip('_')
+
+def parse_float_cell(value, header):
+    """Convert a CSV cell to float, raising ValueError for malformed numbers.
+
+    Clean cells go straight through float(); thousands separators and stray
+    quotes are only stripped when that fails. Blank cells are None (NULL),
+    in imports, forms and bulk updates alike, so an exported row with an
+    empty number reads back the same.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    clean_value = value.replace(',', '').replace('"', '').strip()
+    if not clean_value:
+        return None
     try:
-        clean_value = str(value).replace(',', '').replace('"', '').strip()
         return float(clean_value)
-    except (ValueError, TypeError):
-        return 0.0
+    except ValueError:
+        raise ValueError(f"invalid number {value!r} in column '{header}'")
 
-def safe_int(value):
-    """Safely convert value to int"""
-    if not value or value == '':
-        return 0
+def parse_int_cell(value, header):
+    """Convert a CSV cell to int (None when blank), raising ValueError for malformed numbers"""
+    if not value:
+        return None
     try:
-        clean_value = str(value).replace(',', '').replace('"', '').strip()
-        return int(float(clean_value))
-    except (ValueError, TypeError):
-        return 0
+        return int(value)
+    except ValueError:
+        number = parse_float_cell(value, header)
+        return None if number is None else int(number)
+
+CELL_PARSERS = {int: parse_int_cell, float: parse_float_cell}
+
+@functools.lru_cache(maxsize=64)
+def row_converter(table_name, headers):
+    """Compile a converter for rows of cells laid out as headers.
+
+    Source columns are resolved to cell positions once, so converting a row
+    is a single itemgetter call plus the numeric coercions, and yields the
+    WRITE_COLUMNS values (date keys included) for INSERT_STATEMENTS and
+    UPDATE_STATEMENTS. Short rows are padded in place with empty cells; rows with
+    more cells than headers raise ValueError, as do malformed numbers.
+    Columns without a header get an empty value (NULL for numbers).
+    """
+    types = TABLE_COLUMNS[table_name]
+    aliases = CSV_HEADERS.get(table_name, {})
+    width = len(headers)
+    found = {}
+    for position, header in enumerate(headers):
+        found.setdefault(csv_header_key(header), position)
+
+    positions, coercions = [], []
+    for index, column in enumerate(SOURCE_COLUMNS[table_name]):
+        keys = [csv_header_key(header) for header in aliases.get(column, (column,))]
+        position = next((found[key] for key in keys if key in found), None)
+        parse = CELL_PARSERS.get(types[column])
+        if position is None:
+            positions.append(0)
+            default = parse('', column) if parse else ''
+            coercions.append((index, lambda value, header, default=default: default, column))
+        else:
+            positions.append(position)
+            if parse:
+                coercions.append((index, parse, headers[position]))
+    getter = operator.itemgetter(*positions) if len(positions) > 1 else lambda cells: (cells[positions[0]],)
+    date_keys = DATE_KEY_POSITIONS[table_name]
+
+    def convert(cells):
+        if len(cells) != width:
+            if len(cells) > width:
+                raise ValueError(f'expected {width} fields, found {len(cells)}')
+            cells.extend([''] * (width - len(cells)))
+        values = list(getter(cells))
+        for index, parse, header in coercions:
+            values[index] = parse(values[index], header)
+        for position, parser in date_keys:
+            values.append(parser(values[position]))
+        return tuple(values)
+
+    return convert
+
+def iter_upload_lines(stream, chunk_size=UPLOAD_CHUNK_SIZE, timings=None):
+    """Decode a binary upload incrementally and yield it line by line.
+
+    If given, timings['decode'] accumulates the seconds spent reading and
+    decoding chunks.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    while True:
+        started = time.perf_counter()
+        chunk = stream.read(chunk_size)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = pending.split('\n')
+        pending = lines.pop()
+        if timings is not None:
+            timings['decode'] += time.perf_counter() - started
+        for line in lines:
+            yield line + '\n'
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+# Performance CSV headers carrying monthly figures, e.g. 'Regis - May' or
+# 'Topup - June 2025'
+PERFORMANCE_MONTH_HEADER = re.compile(r'^(regis|topup)\s*-\s*([a-z]+)\.?(?:\s+(\d{4}))?$', re.IGNORECASE)
+
+def performance_month_headers(headers):
+    """Pair the 'Regis - <Month>' / 'Topup - <Month>' headers of a CSV.
+
+    Returns (month, year or None, regis cell, topup cell) tuples, where a
+    cell is a (position, header) pair; either may be None when its counterpart is missing. Headers
+    that do not name a month are ignored.
+    """
+    months = {}
+    for position, header in enumerate(headers):
+        match = PERFORMANCE_MONTH_HEADER.match(header.strip())
+        if not match:
+            continue
+        kind, name, year = match.groups()
+        month_key = parse_month_key(f'{name} 2000')
+        if month_key is None:
+            continue
+        month = (month_key % 100, int(year) if year else None)
+        months.setdefault(month, {})[kind.lower()] = (position, header)
+    return [(month, year, found.get('regis'), found.get('topup'))
+            for (month, year), found in months.items()]
+
+def csv_monthly_values(month_headers, cells, end_date_key):
+    """(month_key, regis, topup) for the non-empty months of a performance CSV row.
+
+    Headers without a year take it from the row's end date, or the current
+    year when there is none.
+    """
+    default_year = end_date_key // 10000 if end_date_key else date.today().year
+    months = []
+    for month, year, regis_header, topup_header in month_headers:
+        # A month without a row counts as zero, so blank figures are 0 here
+        regis = (parse_int_cell(cells[regis_header[0]], regis_header[1]) if regis_header else None) or 0
+        topup = (parse_int_cell(cells[topup_header[0]], topup_header[1]) if topup_header else None) or 0
+        if regis or topup:
+            months.append(((year or default_year) * 100 + month, regis, topup))
+    return months
+
+def insert_import_batch(conn, sql, batch, lines, summary):
+    """Write one batch with executemany, rejecting rows the database refuses.
+
+    executemany() stops at the first failing row with the earlier rows
+    already written, so on a row-level error we reject that row and resume
+    with the next one. Returns the positions of the rejected rows.
+    """
+    rejected = []
+    start = 0
+    while start < len(batch):
+        position = start
+
+        def remaining_rows():
+            nonlocal position
+            for position in range(start, len(batch)):
+                yield batch[position]
+
+        try:
+            conn.executemany(sql, remaining_rows())
+            summary['rows_inserted'] += len(batch) - start
+            break
+        except (sqlite3.IntegrityError, sqlite3.DataError) as e:
+            summary['rows_inserted'] += position - start
+            reject_import_row(summary, lines[position], str(e))
+            rejected.append(position)
+            start = position + 1
+    return rejected
+
+def reject_import_row(summary, line, reason):
+    summary['rows_rejected'] += 1
+    if len(summary['errors']) < IMPORT_MAX_REPORTED_ERRORS:
+        summary['errors'].append({'line': line, 'reason': reason})
+
+def import_row_hash(values):
+    """Content hash of a converted import row, stored in row_hash"""
+    return hashlib.blake2b(repr(values).encode(), digest_size=8).hexdigest()
+
+def import_stage_tables(table_name):
+    """Names of the temp tables an upsert into table_name is staged in, rows and months"""
+    return f'import_stage_{table_name}', f'import_stage_{table_name}_monthly'
+
+def create_import_stage(conn, table_name):
+    """Create the temp tables an upsert import is staged in; returns the staging INSERT"""
+    columns = WRITE_COLUMNS[table_name]
+    stage, monthly = import_stage_tables(table_name)
+    conn.execute(f'DROP TABLE IF EXISTS temp.{stage}')
+    conn.execute(f'DROP TABLE IF EXISTS temp.{monthly}')
+    conn.execute(f"CREATE TEMP TABLE {stage} (line INTEGER, row_hash TEXT, changed INTEGER, "
+                 f"{', '.join(columns)})")
+    conn.execute(f'CREATE TEMP TABLE {monthly} (line INTEGER, month_key INTEGER, '
+                 'regis INTEGER, topup INTEGER)')
+    return (f"INSERT INTO {stage} (line, row_hash, {', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * (len(columns) + 2))})")
+
+def merge_import_stage(conn, table_name, summary, snapshot=False, months=False):
+    """Upsert the staged rows into table_name by its natural key.
+
+    Rows whose content hash matches the stored one are skipped, changed rows
+    are updated in place and new keys inserted, each with one set-based
+    statement, so only the delta is written. Rows edited since their import
+    have row_hash '' (see create_row_hash_triggers()) and are rewritten. For a key with no upserted row yet, the newest existing row is
+    adopted and updated instead of adding a duplicate. With snapshot, the
+    file is the whole table and every row not in it is deleted. With months,
+    the performance_monthly rows of changed rows are replaced too.
+    """
+    key = NATURAL_KEYS[table_name]
+    key_list = ', '.join(key)
+    columns = ', '.join(WRITE_COLUMNS[table_name])
+    stage, monthly = import_stage_tables(table_name)
+
+    # IS, not =: a NULL key part matches NULL, as GROUP BY pairs it below,
+    # so such rows are upserted instead of inserted again on every import
+    def matches(target, source):
+        return ' AND '.join(f'{target}.{column} IS {source}.{column}' for column in key)
+
+    keyed = f"{matches('t', stage)} AND t.row_hash IS NOT NULL"
+
+    # Later rows of the file win over earlier ones with the same key
+    latest = f'SELECT MAX(rowid) FROM {stage} GROUP BY {key_list}'
+    for row in conn.execute(f'SELECT line FROM {stage} WHERE rowid NOT IN ({latest}) ORDER BY rowid'):
+        reject_import_row(summary, row['line'], 'duplicate key, superseded by a later row')
+    conn.execute(f'DELETE FROM {stage} WHERE rowid NOT IN ({latest})')
+    conn.execute(f'CREATE INDEX temp.{stage}_key ON {stage} ({key_list})')
+    conn.execute(f'CREATE INDEX temp.{monthly}_line ON {monthly} (line)')
+
+    conn.execute(f'''
+        UPDATE {table_name} SET row_hash = ''
+        WHERE id IN (SELECT (SELECT MAX(id) FROM {table_name} t WHERE {matches('t', stage)})
+                     FROM {stage} WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {keyed}))
+    ''')
+    conn.execute(f'''
+        UPDATE {stage} SET changed = NOT EXISTS (
+            SELECT 1 FROM {table_name} t WHERE {keyed} AND t.row_hash = {stage}.row_hash)
+    ''')
+    staged, existing, unchanged = conn.execute(f'''
+        SELECT COUNT(*), TOTAL(EXISTS (SELECT 1 FROM {table_name} t WHERE {keyed})), COUNT(*) - TOTAL(changed)
+        FROM {stage}
+    ''').fetchone()
+
+    # Not INSERT ... ON CONFLICT DO UPDATE: an upsert overrides the OR IGNORE
+    # of the rollup triggers' inserts, so update and insert separately
+    conn.execute(f'''
+        UPDATE {table_name} SET ({columns}, row_hash) = (
+            SELECT {columns}, row_hash FROM {stage}
+            WHERE {matches(table_name, stage)})
+        WHERE id IN (SELECT t.id FROM {stage} JOIN {table_name} t ON {keyed}
+                     WHERE {stage}.changed)
+    ''')
+    conn.execute(f'''
+        INSERT INTO {table_name} ({columns}, row_hash)
+        SELECT {columns}, row_hash FROM {stage}
+        WHERE changed AND NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {keyed})
+    ''')
+    if months:
+        changed_ids = f'SELECT t.id FROM {stage} JOIN performance t ON {keyed} WHERE {stage}.changed'
+        conn.execute(f'DELETE FROM performance_monthly WHERE domain_id IN ({changed_ids})')
+        conn.execute(f'''
+            INSERT INTO performance_monthly (domain_id, month_key, regis, topup)
+            SELECT t.id, m.month_key, m.regis, m.topup
+            FROM {stage} JOIN performance t ON {keyed}
+            JOIN {monthly} m ON m.line = {stage}.line
+            WHERE {stage}.changed
+        ''')
+    if snapshot:
+        summary['rows_deleted'] = conn.execute(f'''
+            DELETE FROM {table_name} WHERE row_hash IS NULL
+            OR NOT EXISTS (SELECT 1 FROM {stage} WHERE {matches(table_name, stage)})
+        ''').rowcount
+
+    summary['rows_inserted'] += staged - int(existing)
+    summary['rows_updated'] += int(existing - unchanged)
+    summary['rows_unchanged'] += int(unchanged)
+    conn.execute(f'DROP TABLE temp.{stage}')
+    conn.execute(f'DROP TABLE temp.{monthly}')
+
+def convert_import_rows(table_name, headers, rows, upsert=False):
+    """Convert the (line, cells) rows of a CSV laid out as headers.
+
+    Pure CPU work with no database access, so bundle imports run it in
+    worker processes. Returns the converted rows as (line, values, months,
+    row_hash) tuples, where months are the performance_monthly figures and
+    row_hash is only computed for upserts, and the (line, reason) pairs of
+    rejected rows. Empty rows are skipped.
+    """
+    convert = row_converter(table_name, headers)
+    month_headers = performance_month_headers(headers) if table_name == 'performance' else []
+    if month_headers:
+        end_date_position = WRITE_COLUMNS[table_name].index('end_date_key')
+    converted, rejected = [], []
+    for line, cells in rows:
+        if not cells:
+            continue
+        try:
+            values = convert(cells)
+            months = csv_monthly_values(month_headers, cells, values[end_date_position]) if month_headers else []
+            converted.append((line, values, months, import_row_hash(values + tuple(months)) if upsert else None))
+        except ValueError as e:
+            rejected.append((line, str(e)))
+    return converted, rejected
+
+class TableLoad:
+    """Writes converted CSV rows into one table inside the caller's transaction.
+
+    begin() switches off the per-row trigger work (see begin_bulk_load())
+    and, for upserts, creates the staging tables; write() takes the output
+    of convert_import_rows(); finish() merges the staged rows and catches
+    the search index and stats up. Committing is left to the caller, so
+    several tables can be loaded in one transaction.
+    """
+
+    def __init__(self, table_name, headers, mode='append', snapshot=False):
+        if mode not in IMPORT_MODES:
+            raise ValueError(f'Unknown import mode: {mode}')
+        self.table_name = table_name
+        self.upsert = mode == 'upsert'
+        self.snapshot = snapshot
+        self.months = table_name == 'performance' and bool(performance_month_headers(headers))
+        self.sql = INSERT_STATEMENTS[table_name]
+        self.watermark = self.next_id = None
+        self.summary = {
+            'table': table_name,
+            'rows_read': 0,
+            'rows_inserted': 0,
+            'rows_rejected': 0,
+            'rows_updated': 0,
+            'rows_unchanged': 0,
+            'rows_deleted': 0,
+            'mode': mode,
+            'errors': [],
+            'elapsed_seconds': 0.0,
+        }
+
+    def begin(self, conn):
+        self.watermark = begin_bulk_load(conn, self.table_name)
+        if self.upsert:
+            self.sql = create_import_stage(conn, self.table_name)
+        elif self.months:
+            # Monthly rows reference their performance row, so ids are assigned here
+            self.sql = INSERT_WITH_ID_STATEMENTS[self.table_name]
+            self.next_id = conn.execute("SELECT MAX(?, COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0))",
+                                        (self.watermark, self.table_name)).fetchone()[0] + 1
+
+    def write(self, conn, converted, rejected):
+        summary = self.summary
+        summary['rows_read'] += len(converted) + len(rejected)
+        for line, reason in rejected:
+            reject_import_row(summary, line, reason)
+        if not converted:
+            return
+        if self.upsert:
+            conn.executemany(self.sql, [(line, row_hash) + values for line, values, _, row_hash in converted])
+            if self.months:
+                monthly = import_stage_tables(self.table_name)[1]
+                conn.executemany(f'INSERT INTO {monthly} VALUES (?, ?, ?, ?)',
+                                 [(line,) + month for line, _, months, _ in converted for month in months])
+        elif self.months:
+            first_id = self.next_id
+            self.next_id += len(converted)
+            batch = [(first_id + position,) + row[1] for position, row in enumerate(converted)]
+            rejected_rows = set(insert_import_batch(conn, self.sql, batch, [row[0] for row in converted], summary))
+            conn.executemany(PERFORMANCE_MONTHLY_UPSERT,
+                             ((first_id + position,) + month for position, row in enumerate(converted)
+                              if position not in rejected_rows for month in row[2]))
+        else:
+            insert_import_batch(conn, self.sql, [row[1] for row in converted], [row[0] for row in converted],
+                                summary)
+
+    def finish(self, conn, timings=None):
+        """Merge staged rows and run the deferred trigger work; timings gets 'merge' and 'catch_up'"""
+        started = time.perf_counter()
+        if self.upsert:
+            merge_import_stage(conn, self.table_name, self.summary, self.snapshot, months=self.months)
+        merged = time.perf_counter()
+        finish_bulk_load(conn, self.table_name, self.watermark)
+        if timings is not None:
+            timings['merge'] += merged - started
+            timings['catch_up'] += time.perf_counter() - merged
+
+def read_import_rows(reader, batch_size):
+    """Next batch_size rows of a csv.reader as (line number, cells) pairs"""
+    return [(reader.line_num, cells) for cells in itertools.islice(reader, batch_size)]
+
+def stream_csv_import(conn, table_name, stream, batch_size=None, progress=None, mode='append',
+                      snapshot=False):
+    """Stream a CSV upload into table_name using batched inserts.
+
+    The whole import runs in a single transaction. Returns a summary with the
+    rows read, inserted and rejected (with line numbers and reasons) and the
+    elapsed time in seconds, split into phase_seconds: decode, parse, insert,
+    merge (upserts), catch_up (deferred trigger work) and commit. If given,
+    progress(summary) is called after every batch.
+
+    In 'upsert' mode rows are staged and merged by natural key at the end
+    (see merge_import_stage()), adding updated, unchanged and deleted
+    counts to the summary; otherwise every row is appended.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f'Unknown import mode: {mode}')
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    started = time.perf_counter()
+    timings = dict.fromkeys(('decode', 'parse', 'insert', 'merge', 'catch_up', 'commit'), 0.0)
+
+    reader = csv.reader(iter_upload_lines(stream, timings=timings))
+    headers = tuple(next(reader, ()))
+    load = TableLoad(table_name, headers, mode, snapshot)
+    summary = load.summary
+    conn.execute('BEGIN')
+    try:
+        load.begin(conn)
+        while True:
+            phase_started, decoded = time.perf_counter(), timings['decode']
+            rows = read_import_rows(reader, batch_size)
+            converted, rejected = convert_import_rows(table_name, headers, rows, load.upsert)
+            phase_ended = time.perf_counter()
+            timings['parse'] += phase_ended - phase_started - (timings['decode'] - decoded)
+            load.write(conn, converted, rejected)
+            timings['insert'] += time.perf_counter() - phase_ended
+            if progress:
+                progress(summary)
+            if len(rows) < batch_size:
+                break
+        load.finish(conn, timings)
+        phase_started = time.perf_counter()
+        conn.commit()
+        timings['commit'] = time.perf_counter() - phase_started
+    except Exception:
+        conn.rollback()
+        raise
+
+    summary['elapsed_seconds'] = round(time.perf_counter() - started, 3)
+    summary['phase_seconds'] = {phase: round(seconds, 3) for phase, seconds in timings.items()}
+    if METRICS_ENABLED:
+        for phase, seconds in timings.items():
+            metrics.observe('import_phase_seconds', (('table', table_name), ('phase', phase)), seconds)
+    return summary
+
+def import_summary_message(summary):
+    message = (f"Imported {summary['rows_inserted']} of {summary['rows_read']} rows "
+               f"into {summary['table']} in {summary['elapsed_seconds']:.2f}s")
+    if summary['mode'] == 'upsert':
+        message += (f", updated {summary['rows_updated']}, {summary['rows_unchanged']} unchanged, "
+                    f"deleted {summary['rows_deleted']}")
+    if summary['rows_rejected']:
+        details = '; '.join(f"line {e['line']}: {e['reason']}" for e in summary['errors'][:5])
+        message += f" ({summary['rows_rejected']} rejected: {details})"
+    return message
+
+def wants_json():
+    """True when the client asked for a JSON response instead of HTML"""
+    if request.args.get('format') == 'json':
+        return True
+    best = request.accept_mimetypes.best_match(['text/html', 'application/json'])
+    return best == 'application/json'
 
 @app.route('/import_csv/<table_name>', methods=['POST'])
 def import_csv(table_name):
+    if table_name not in INSERT_STATEMENTS:
+        flash(f'Unknown table: {table_name}')
+        return redirect(url_for('index'))
+
     if 'file' not in request.files:
         flash('No file selected')
         return redirect(url_for(table_name))
@@ -271,273 +2767,1655 @@ def import_csv(table_name):
         flash('Please select a valid CSV file')
         return redirect(url_for(table_name))
 
+    batch_size = request.values.get('batch_size', type=int)
+    mode = request.values.get('mode', 'append')
+    if mode not in IMPORT_MODES:
+        if wants_json():
+            return jsonify({"error": f'Unknown import mode: {mode}'}), 400
+        flash(f'Unknown import mode: {mode}')
+        return redirect(url_for(table_name))
+    snapshot = request.values.get('snapshot') in ('1', 'true', 'on')
+    if snapshot and mode != 'upsert':
+        if wants_json():
+            return jsonify({"error": 'snapshot requires mode=upsert'}), 400
+        flash('Snapshot imports require upsert mode')
+        return redirect(url_for(table_name))
+    if request.values.get('async') in ('1', 'true', 'on'):
+        job = submit_import_job(table_name, file, batch_size, mode, snapshot)
+        if wants_json():
+            return jsonify(import_job_status(job)), 202, {'Location': url_for('api_import_job', job_id=job['id'])}
+        flash(f"Import of {file.filename} queued as job {job['id']}")
+        return redirect(url_for(table_name))
+
     try:
-        conn = get_db_connection()
-        csv_data = file.read().decode('utf-8').splitlines()
-        csv_reader = csv.DictReader(csv_data)
-        
-        imported_count = 0
-        
-        for row in csv_reader:
-            try:
-                if table_name == 'domain_cost':
-                    conn.execute('''
-                        INSERT INTO domain_cost (domain, kw, type, team, owner, end_date, plan, cost, month)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        row.get('Domain', ''), 
-                        row.get('kw', ''), 
-                        row.get('type', ''), 
-                        row.get('team', ''), 
-                        row.get('owner', ''), 
-                        row.get('end_date', ''),
-                        row.get('plan', ''), 
-                        safe_float(row.get('Cost', 0)), 
-                        row.get('Month', '')
-                    ))
-                
-                elif table_name == 'hosting_cost':
-                    conn.execute('''
-                        INSERT INTO hosting_cost (month_registration, month_expire, domain, team, sum_hosting_cost_by_domain)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (
-                        row.get('month_registration', ''), 
-                        row.get('month_expire', ''), 
-                        row.get('domain', ''), 
-                        row.get('team', ''), 
-                        safe_float(row.get('sum_hosting_cost_by_domain', 0))
-                    ))
-                
-                elif table_name == 'performance':
-                    conn.execute('''
-                        INSERT INTO performance (domain, team, owner, plan, end_date, cashgame, chalong, playgame,
-                                               total_register, total_topup, regis_may, topup_may, regis_june, topup_june,
-                                               regis_july, topup_july, cvr, first_seen_cg, first_seen_cl, first_seen_pg,
-                                               date_gap, unique_visits)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        row.get('Domain', ''),
-                        row.get('team', ''),
-                        row.get('owner', ''),
-                        row.get('plan', ''),
-                        row.get('end_date', ''),
-                        row.get('CASHGAME', ''),
-                        row.get('CHALONG', ''),
-                        row.get('PLAYGAME', ''),
-                        safe_int(row.get('Total Register', 0)),
-                        safe_int(row.get('Total Topup', 0)),
-                        safe_int(row.get('Regis - May', 0)),
-                        safe_int(row.get('Topup - May', 0)),
-                        safe_int(row.get('Regis - June', 0)),
-                        safe_int(row.get('Topup - June', 0)),
-                        safe_int(row.get('Regis - July', 0)),
-                        safe_int(row.get('Topup - July', 0)),
-                        row.get('CVR', ''),
-                        row.get('First Seen - CG', ''),
-                        row.get('First Seen - CL', ''),
-                        row.get('First Seen - PG', ''),
-                        row.get('Date Gap', ''),
-                        safe_int(row.get('unique visits', 0))
-                    ))
-                
-                elif table_name == 'revenue':
-                    conn.execute('''
-                        INSERT INTO revenue (code, month, owner, team, web, win_loss, rename, reteam)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (
-                        row.get('code', ''),
-                        row.get('month', ''),
-                        row.get('Owner', ''),
-                        row.get('team', ''),
-                        row.get('web', ''),
-                        safe_float(row.get('win_loss', 0)),
-                        row.get('Rename', ''),
-                        row.get('Reteam', '')
-                    ))
-                
-                elif table_name == 'salary':
-                    conn.execute('''
-                        INSERT INTO salary (nickname, salary, team)
-                        VALUES (?, ?, ?)
-                    ''', (
-                        row.get('ชื่อเล่น', '') or row.get('nickname', ''),
-                        safe_float(row.get('เงินเดือน', 0) or row.get('salary', 0)),
-                        row.get('เบิกทีม', '') or row.get('team', '')
-                    ))
-                
-                imported_count += 1
-                
-            except Exception as row_error:
-                continue
-        
-        conn.commit()
-        flash(f'Successfully imported {imported_count} records to {table_name}!')
-        
+        summary = write_queue.run(
+            lambda conn: stream_csv_import(conn, table_name, file.stream, batch_size, mode=mode, snapshot=snapshot),
+            exclusive=True, timeout=None)
     except Exception as e:
+        if wants_json():
+            return jsonify({"error": f'Error importing CSV: {str(e)}'}), 400
         flash(f'Error importing CSV: {str(e)}')
-    finally:
-        conn.close()
-    
+        return redirect(url_for(table_name))
+
+    if wants_json():
+        return jsonify(summary)
+    flash(import_summary_message(summary))
     return redirect(url_for(table_name))
 
+# Background imports: uploads are spooled to disk and processed by a thread
+# pool. Job state lives in JSON files next to the spooled uploads so that every
+# gunicorn worker can report on any job.
+IMPORT_SPOOL_DIR = os.environ.get('IMPORT_SPOOL_DIR',
+                                  os.path.join(tempfile.gettempdir(), 'database_explorer_imports'))
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 2))
+
+_import_executor = None
+_import_executor_lock = threading.Lock()
+
+def get_import_executor():
+    """Create the import thread pool lazily so it is never shared across forks"""
+    global _import_executor
+    with _import_executor_lock:
+        if _import_executor is None:
+            _import_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS,
+                                                  thread_name_prefix='csv-import')
+        return _import_executor
+
+def import_job_path(job_id):
+    return os.path.join(IMPORT_SPOOL_DIR, f'{job_id}.json')
+
+def save_import_job(job):
+    job['updated_at'] = time.time()
+    tmp_path = import_job_path(job['id']) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, import_job_path(job['id']))
+
+def load_import_job(job_id):
+    if not re.fullmatch(r'[0-9a-f]{32}', job_id):
+        return None
+    try:
+        with open(import_job_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def submit_import_job(table_name, file, batch_size=None, mode='append', snapshot=False):
+    """Spool an uploaded file to disk and queue it for background import"""
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    upload_path = os.path.join(IMPORT_SPOOL_DIR, f'{job_id}.csv')
+    file.save(upload_path)
+
+    job = {
+        'id': job_id,
+        'table': table_name,
+        'filename': file.filename,
+        'mode': mode,
+        'snapshot': snapshot,
+        'status': 'queued',
+        'total_bytes': os.path.getsize(upload_path),
+        'bytes_processed': 0,
+        'rows_read': 0,
+        'rows_inserted': 0,
+        'rows_rejected': 0,
+        'rows_committed': 0,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'summary': None,
+        'error': None,
+    }
+    save_import_job(job)
+    get_import_executor().submit(run_import_job, dict(job), upload_path, batch_size)
+    return job
+
+def run_import_job(job, upload_path, batch_size):
+    job['status'] = 'running'
+    job['started_at'] = time.time()
+    save_import_job(job)
+
+    try:
+        with open(upload_path, 'rb') as f:
+            def progress(summary):
+                job['bytes_processed'] = f.tell()
+                job['rows_read'] = summary['rows_read']
+                job['rows_inserted'] = summary['rows_inserted']
+                job['rows_rejected'] = summary['rows_rejected']
+                save_import_job(job)
+
+            summary = write_queue.run(
+                lambda conn: stream_csv_import(conn, job['table'], f, batch_size, progress,
+                                               job.get('mode', 'append'), job.get('snapshot', False)),
+                exclusive=True, timeout=None)
+
+        job['status'] = 'completed'
+        job['bytes_processed'] = job['total_bytes']
+        job['rows_committed'] = summary['rows_inserted']
+        job['summary'] = summary
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    finally:
+        job['finished_at'] = time.time()
+        save_import_job(job)
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
+
+def import_job_status(job):
+    """Add throughput and ETA figures to a stored job record"""
+    status = dict(job)
+    started = job['started_at']
+    if started is None:
+        status.update(elapsed_seconds=0.0, rows_per_second=None, bytes_per_second=None, eta_seconds=None)
+        return status
+
+    elapsed = (job['finished_at'] or time.time()) - started
+    status['elapsed_seconds'] = round(elapsed, 3)
+    if elapsed > 0:
+        status['rows_per_second'] = round(job['rows_read'] / elapsed, 1)
+        status['bytes_per_second'] = round(job['bytes_processed'] / elapsed, 1)
+    else:
+        status['rows_per_second'] = status['bytes_per_second'] = None
+
+    if job['status'] != 'running':
+        status['eta_seconds'] = 0.0 if job['status'] == 'completed' else None
+    elif status['bytes_per_second']:
+        remaining = job['total_bytes'] - job['bytes_processed']
+        status['eta_seconds'] = round(remaining / status['bytes_per_second'], 1)
+    else:
+        status['eta_seconds'] = None
+    return status
+
+@app.route('/api/import_jobs')
+def api_import_jobs():
+    """List known background import jobs, newest first"""
+    jobs = []
+    if os.path.isdir(IMPORT_SPOOL_DIR):
+        for name in os.listdir(IMPORT_SPOOL_DIR):
+            if name.endswith('.json'):
+                job = load_import_job(name[:-len('.json')])
+                if job:
+                    jobs.append(import_job_status(job))
+    jobs.sort(key=lambda job: job['created_at'], reverse=True)
+    return jsonify(jobs)
+
+@app.route('/api/import_jobs/<job_id>')
+def api_import_job(job_id):
+    job = load_import_job(job_id)
+    if job is None:
+        return jsonify({"error": "Import job not found"}), 404
+    return jsonify(import_job_status(job))
+
+# Bundle imports: a zip or directory holding one CSV per table, e.g. the
+# monthly "Sample Data - *.csv" export. Files are parsed in worker processes
+# while one transaction writes every table, so readers see all of the refresh
+# or none of it.
+IMPORT_PROCESSES = int(os.environ.get('IMPORT_PROCESSES', os.cpu_count() or 1))
+
+def detect_csv_table(headers):
+    """The table a CSV header row belongs to, or None when unclear.
+
+    Each table scores the share of its source columns found among the
+    headers (CSV_HEADERS aliases included). The best table must cover at
+    least half of its columns and beat every other table.
+    """
+    found = {csv_header_key(header) for header in headers}
+    scores = []
+    for table_name, columns in SOURCE_COLUMNS.items():
+        aliases = CSV_HEADERS.get(table_name, {})
+        matched = sum(any(csv_header_key(header) in found for header in aliases.get(column, (column,)))
+                      for column in columns)
+        scores.append((matched / len(columns), table_name))
+    scores.sort(reverse=True)
+    (best, table_name), (runner_up, _) = scores[0], scores[1]
+    return table_name if best >= 0.5 and best > runner_up else None
+
+def list_bundle_files(path):
+    """(name, source) for the CSVs of a bundle; a source is (path, zip member or None)"""
+    if os.path.isdir(path):
+        return [(name, (os.path.join(path, name), None)) for name in sorted(os.listdir(path))
+                if name.lower().endswith('.csv') and not name.startswith('.')]
+    if not zipfile.is_zipfile(path):
+        raise ValueError('A bundle must be a zip file or a directory of CSV files')
+    with zipfile.ZipFile(path) as archive:
+        return [(name, (path, name)) for name in sorted(archive.namelist())
+                if name.lower().endswith('.csv') and not name.startswith('__MACOSX/')
+                and not os.path.basename(name).startswith('.')]
+
+@contextlib.contextmanager
+def open_bundle_file(source):
+    path, member = source
+    if member is None:
+        with open(path, 'rb') as stream:
+            yield stream
+        return
+    with zipfile.ZipFile(path) as archive, archive.open(member) as stream:
+        yield stream
+
+def read_bundle_headers(source):
+    with open_bundle_file(source) as stream:
+        return tuple(next(csv.reader(iter_upload_lines(stream)), ()))
+
+def iter_bundle_batches(source, table_name, batch_size, upsert):
+    """Read and convert one bundle file, yielding convert_import_rows() results"""
+    with open_bundle_file(source) as stream:
+        reader = csv.reader(iter_upload_lines(stream))
+        headers = tuple(next(reader, ()))
+        while True:
+            rows = read_import_rows(reader, batch_size)
+            yield convert_import_rows(table_name, headers, rows, upsert)
+            if len(rows) < batch_size:
+                break
+
+# Set in each bundle worker process by init_bundle_worker()
+_bundle_batches = None
+_bundle_abort = None
+
+def init_bundle_worker(batches, abort):
+    global _bundle_batches, _bundle_abort
+    _bundle_batches, _bundle_abort = batches, abort
+    # Workers exit at pool shutdown, when the writer has either read every
+    # batch or given up on them; don't wait to flush batches nobody will read
+    batches.cancel_join_thread()
+
+def parse_bundle_file(index, source, table_name, batch_size, upsert):
+    """Worker process: send one file's converted batches to the writer, then None"""
+    try:
+        for batch in iter_bundle_batches(source, table_name, batch_size, upsert):
+            if _bundle_abort.is_set():
+                return
+            _bundle_batches.put((index, batch))
+    finally:
+        _bundle_batches.put((index, None))
+
+def iter_bundle_parallel(files, batch_size, upsert, processes):
+    """(file index, batch) pairs from files parsed in a process pool.
+
+    Each file is parsed by one worker, so its batches arrive in order; the
+    bounded queue stops workers from running far ahead of the writer. A
+    worker error is raised here, and closing the generator early stops the
+    remaining workers.
+
+    Workers are never forked from this process: it runs the writer and
+    request threads, and a fork copies whatever locks they hold. They start
+    from a fork server that has imported this module once (spawn where there
+    is none), so everything they are passed must pickle.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+    else:
+        context = multiprocessing.get_context('spawn')
+    batches, abort = context.Queue(maxsize=2 * processes), context.Event()
+    with ProcessPoolExecutor(processes, mp_context=context, initializer=init_bundle_worker,
+                             initargs=(batches, abort)) as pool:
+        futures = [pool.submit(parse_bundle_file, index, source, table_name, batch_size, upsert)
+                   for index, (_, source, table_name, _) in enumerate(files)]
+        pending = set(range(len(futures)))
+        try:
+            while pending:
+                try:
+                    index, batch = batches.get(timeout=1)
+                except queue.Empty:
+                    # A worker that died or failed never sends more batches
+                    for index in pending:
+                        if futures[index].done() and futures[index].exception():
+                            raise futures[index].exception()
+                    continue
+                if batch is None:
+                    pending.discard(index)
+                    futures[index].result()
+                else:
+                    yield index, batch
+        finally:
+            if pending:
+                abort.set()
+                for future in futures:
+                    future.cancel()
+                # Keep draining so that workers blocked on a full queue can exit
+                while not all(future.done() for future in futures):
+                    try:
+                        batches.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+
+def import_bundle(conn, path, batch_size=None, mode='append', snapshot=False, processes=None):
+    """Load every CSV of a bundle into its table in one transaction.
+
+    The target table of each file is detected from its headers. With more
+    than one process, files are converted in parallel by a process pool and
+    this connection writes their batches as they arrive. Returns the table
+    of each file, per-table import summaries and the elapsed time.
+    """
+    started = time.perf_counter()
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    files, tables = [], {}
+    for name, source in list_bundle_files(path):
+        headers = read_bundle_headers(source)
+        table_name = detect_csv_table(headers)
+        if table_name is None:
+            raise ValueError(f'{name}: cannot tell which table the headers belong to')
+        if table_name in tables:
+            raise ValueError(f'{tables[table_name]} and {name} are both {table_name} files')
+        tables[table_name] = name
+        files.append((name, source, table_name, headers))
+    if not files:
+        raise ValueError('The bundle has no CSV files')
+
+    loads = [TableLoad(table_name, headers, mode, snapshot) for _, _, table_name, headers in files]
+    upsert = mode == 'upsert'
+    processes = max(1, min(processes or IMPORT_PROCESSES, len(files)))
+    if processes > 1:
+        batches = iter_bundle_parallel(files, batch_size, upsert, processes)
+    else:
+        batches = ((index, batch) for index, (_, source, table_name, _) in enumerate(files)
+                   for batch in iter_bundle_batches(source, table_name, batch_size, upsert))
+
+    conn.execute('BEGIN')
+    try:
+        with contextlib.closing(batches):
+            for load in loads:
+                load.begin(conn)
+            for index, (converted, rejected) in batches:
+                loads[index].write(conn, converted, rejected)
+        for load in loads:
+            load.finish(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    elapsed = round(time.perf_counter() - started, 3)
+    for load in loads:
+        load.summary['elapsed_seconds'] = elapsed
+    return {
+        'files': {name: table_name for name, _, table_name, _ in files},
+        'tables': {load.table_name: load.summary for load in loads},
+        'mode': mode,
+        'processes': processes,
+        'elapsed_seconds': elapsed,
+    }
+
+@app.route('/import_bundle', methods=['POST'])
+def import_bundle_upload():
+    """Import a zip of CSVs, one per table, as a single refresh"""
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        if wants_json():
+            return jsonify({"error": 'No file selected'}), 400
+        flash('No file selected')
+        return redirect(url_for('index'))
+
+    mode = request.values.get('mode', 'append')
+    if mode not in IMPORT_MODES:
+        if wants_json():
+            return jsonify({"error": f'Unknown import mode: {mode}'}), 400
+        flash(f'Unknown import mode: {mode}')
+        return redirect(url_for('index'))
+    snapshot = request.values.get('snapshot') in ('1', 'true', 'on')
+    if snapshot and mode != 'upsert':
+        if wants_json():
+            return jsonify({"error": 'snapshot requires mode=upsert'}), 400
+        flash('Snapshot imports require upsert mode')
+        return redirect(url_for('index'))
+    batch_size = request.values.get('batch_size', type=int)
+
+    # Spooled to disk: zip members are read by seeking, and by worker processes
+    os.makedirs(IMPORT_SPOOL_DIR, exist_ok=True)
+    upload_path = os.path.join(IMPORT_SPOOL_DIR, f'{uuid.uuid4().hex}.zip')
+    file.save(upload_path)
+    try:
+        summary = write_queue.run(lambda conn: import_bundle(conn, upload_path, batch_size, mode, snapshot),
+                                  exclusive=True, timeout=None)
+    except Exception as e:
+        if wants_json():
+            return jsonify({"error": f'Error importing bundle: {str(e)}'}), 400
+        flash(f'Error importing bundle: {str(e)}')
+        return redirect(url_for('index'))
+    finally:
+        try:
+            os.remove(upload_path)
+        except OSError:
+            pass
+
+    if wants_json():
+        return jsonify(summary)
+    for table_summary in summary['tables'].values():
+        flash(import_summary_message(table_summary))
+    return redirect(url_for('index'))
+
+@db_cli.command('import')
+@click.argument('path', type=click.Path(exists=True))
+@click.option('--mode', type=click.Choice(IMPORT_MODES), default='append', show_default=True,
+              help='Append every row, or update rows with the same key.')
+@click.option('--snapshot', is_flag=True, help='Files are full snapshots; delete rows missing from them.')
+@click.option('--processes', type=int, help='Parser processes (default: IMPORT_PROCESSES).')
+@click.option('--batch-size', type=int, help='Rows per batch (default: IMPORT_BATCH_SIZE).')
+def db_import(path, mode, snapshot, processes, batch_size):
+    """Load a bundle of CSVs (a zip or directory, one per table) in one transaction."""
+    if snapshot and mode != 'upsert':
+        raise click.UsageError('--snapshot requires --mode upsert')
+    try:
+        summary = write_queue.run(lambda conn: import_bundle(conn, path, batch_size, mode, snapshot, processes),
+                                  exclusive=True, timeout=None)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for name, table_name in summary['files'].items():
+        click.echo(f"{name}: {import_summary_message(summary['tables'][table_name])}")
+    click.echo(f"Committed in {summary['elapsed_seconds']:.2f}s with {summary['processes']} parser process(es)")
+
+def form_row_values(table_name, form):
+    """Read WRITE_COLUMNS values for table_name from a submitted form.
+
+    Every column must be present, so a partial form cannot overwrite the
+    fields it left out. Fields are converted as CSV cells are: blank numbers
+    are stored as NULL and malformed ones raise ValueError.
+    """
+    columns = SOURCE_COLUMNS[table_name]
+    missing = [column for column in columns if column not in form]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    return row_converter(table_name, tuple(columns))([form[column] for column in columns])
+
+# Performance form fields carrying monthly figures, e.g. regis_may or topup_june
+PERFORMANCE_MONTH_FIELD = re.compile(r'^(regis|topup)_([a-z]+)$')
+
+def performance_months_year(conn, performance_id, end_date_key):
+    """Year the regis_<month>/topup_<month> columns of a performance row refer to.
+
+    The end date's year, or for rows without one the latest year already
+    stored for the row, as in the performance_wide view; new rows without
+    an end date take the current year.
+    """
+    if end_date_key:
+        return end_date_key // 10000
+    (year,) = conn.execute('SELECT MAX(month_key) / 100 FROM performance_monthly WHERE domain_id = ?',
+                           (performance_id,)).fetchone()
+    return year or date.today().year
+
+def write_form_months(conn, performance_id, form, end_date_key, previous_year=None):
+    """Store the regis_<month>/topup_<month> fields of a performance form.
+
+    The year is given by performance_months_year(). When an edit moves the
+    row to another year (previous_year is the year before the edit), the
+    row's monthly figures of that year move along instead of staying behind
+    under the old year. Months whose figures are both zero are removed.
+    """
+    months = {}
+    for field in form:
+        match = PERFORMANCE_MONTH_FIELD.match(field)
+        month_key = parse_month_key(f'{match.group(2)} 2000') if match else None
+        if month_key is None:
+            continue
+        months.setdefault(month_key % 100, {})[match.group(1)] = parse_int_cell(form[field], field) or 0
+    year = performance_months_year(conn, performance_id, end_date_key)
+    if previous_year and previous_year != year:
+        conn.execute('UPDATE OR REPLACE performance_monthly SET month_key = ? * 100 + month_key % 100 '
+                     'WHERE domain_id = ? AND month_key / 100 = ?', (year, performance_id, previous_year))
+    rows = [(performance_id, year * 100 + month, values.get('regis', 0), values.get('topup', 0))
+            for month, values in months.items()]
+    conn.executemany(PERFORMANCE_MONTHLY_UPSERT, [row for row in rows if row[2] or row[3]])
+    conn.executemany('DELETE FROM performance_monthly WHERE domain_id = ? AND month_key = ?',
+                     [row[:2] for row in rows if not (row[2] or row[3])])
+
+# Shown when a form write times out behind an import or other long write
+WRITER_BUSY_MESSAGE = 'The database is busy with another write (such as an import); nothing was saved, please try again shortly.'
+# Seconds clients are told to wait before retrying a write that timed out
+WRITER_RETRY_AFTER = '5'
+
 @app.route('/add/<table_name>', methods=['POST'])
 def add_record(table_name):
-    conn = get_db_connection()
-    
+    if table_name not in TABLE_COLUMNS:
+        flash(f'Unknown table: {table_name}')
+        return redirect(url_for('index'))
+
+    form = request.form
+
+    def add(conn):
+        cursor = conn.execute(INSERT_STATEMENTS[table_name], values)
+        if table_name == 'performance':
+            write_form_months(conn, cursor.lastrowid, form, values[WRITE_COLUMNS[table_name].index('end_date_key')])
+
     try:
-        if table_name == 'domain_cost':
-            conn.execute('''
-                INSERT INTO domain_cost (domain, kw, type, team, owner, end_date, plan, cost, month)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (request.form['domain'], request.form['kw'], request.form['type'], 
-                 request.form['team'], request.form['owner'], request.form['end_date'],
-                 request.form['plan'], float(request.form['cost']), request.form['month']))
-        
-        elif table_name == 'hosting_cost':
-            conn.execute('''
-                INSERT INTO hosting_cost (month_registration, month_expire, domain, team, sum_hosting_cost_by_domain)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (request.form['month_registration'], request.form['month_expire'], 
-                 request.form['domain'], request.form['team'], float(request.form['sum_hosting_cost_by_domain'])))
-        
-        elif table_name == 'performance':
-            conn.execute('''
-                INSERT INTO performance (domain, team, owner, plan, end_date, cashgame, chalong, playgame,
-                                       total_register, total_topup, regis_may, topup_may, regis_june, topup_june,
-                                       regis_july, topup_july, cvr, first_seen_cg, first_seen_cl, first_seen_pg,
-                                       date_gap, unique_visits)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (request.form['domain'], request.form['team'], request.form['owner'], request.form['plan'],
-                 request.form['end_date'], request.form['cashgame'], request.form['chalong'], request.form['playgame'],
-                 int(request.form['total_register']), int(request.form['total_topup']),
-                 int(request.form['regis_may']), int(request.form['topup_may']),
-                 int(request.form['regis_june']), int(request.form['topup_june']),
-                 int(request.form['regis_july']), int(request.form['topup_july']),
-                 request.form['cvr'], request.form['first_seen_cg'], request.form['first_seen_cl'],
-                 request.form['first_seen_pg'], request.form['date_gap'], int(request.form['unique_visits'])))
-        
-        elif table_name == 'revenue':
-            conn.execute('''
-                INSERT INTO revenue (code, month, owner, team, web, win_loss, rename, reteam)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (request.form['code'], request.form['month'], request.form['owner'],
-                 request.form['team'], request.form['web'], float(request.form['win_loss']),
-                 request.form['rename'], request.form['reteam']))
-        
-        elif table_name == 'salary':
-            conn.execute('''
-                INSERT INTO salary (nickname, salary, team)
-                VALUES (?, ?, ?)
-            ''', (request.form['nickname'], float(request.form['salary']), request.form['team']))
-        
-        conn.commit()
+        values = form_row_values(table_name, form)
+        write_queue.run(add)
         flash('Record added successfully!')
+    except WriterBusy:
+        flash(WRITER_BUSY_MESSAGE)
     except Exception as e:
         flash(f'Error adding record: {str(e)}')
-    finally:
-        conn.close()
     
     return redirect(url_for(table_name))
 
 @app.route('/edit/<table_name>/<int:record_id>', methods=['POST'])
 def edit_record(table_name, record_id):
-    conn = get_db_connection()
-    
+    if table_name not in TABLE_COLUMNS:
+        flash(f'Unknown table: {table_name}')
+        return redirect(url_for('index'))
+
+    form = request.form
+
+    def edit(conn):
+        previous_year = None
+        if table_name == 'performance':
+            row = conn.execute('SELECT end_date_key FROM performance WHERE id = ?', (record_id,)).fetchone()
+            previous_year = performance_months_year(conn, record_id, row[0]) if row else None
+        conn.execute(UPDATE_STATEMENTS[table_name], values + (record_id,))
+        if table_name == 'performance':
+            write_form_months(conn, record_id, form, values[WRITE_COLUMNS[table_name].index('end_date_key')],
+                              previous_year)
+
     try:
-        if table_name == 'domain_cost':
-            conn.execute('''
-                UPDATE domain_cost SET domain=?, kw=?, type=?, team=?, owner=?, end_date=?, plan=?, cost=?, month=?
-                WHERE id=?
-            ''', (request.form['domain'], request.form['kw'], request.form['type'], 
-                 request.form['team'], request.form['owner'], request.form['end_date'],
-                 request.form['plan'], float(request.form['cost']), request.form['month'], record_id))
-        
-        elif table_name == 'hosting_cost':
-            conn.execute('''
-                UPDATE hosting_cost SET month_registration=?, month_expire=?, domain=?, team=?, sum_hosting_cost_by_domain=?
-                WHERE id=?
-            ''', (request.form['month_registration'], request.form['month_expire'], 
-                 request.form['domain'], request.form['team'], float(request.form['sum_hosting_cost_by_domain']), record_id))
-        
-        elif table_name == 'performance':
-            conn.execute('''
-                UPDATE performance SET domain=?, team=?, owner=?, plan=?, end_date=?, cashgame=?, chalong=?, playgame=?,
-                                     total_register=?, total_topup=?, regis_may=?, topup_may=?, regis_june=?, topup_june=?,
-                                     regis_july=?, topup_july=?, cvr=?, first_seen_cg=?, first_seen_cl=?, first_seen_pg=?,
-                                     date_gap=?, unique_visits=?
-                WHERE id=?
-            ''', (request.form['domain'], request.form['team'], request.form['owner'], request.form['plan'],
-                 request.form['end_date'], request.form['cashgame'], request.form['chalong'], request.form['playgame'],
-                 int(request.form['total_register']), int(request.form['total_topup']),
-                 int(request.form['regis_may']), int(request.form['topup_may']),
-                 int(request.form['regis_june']), int(request.form['topup_june']),
-                 int(request.form['regis_july']), int(request.form['topup_july']),
-                 request.form['cvr'], request.form['first_seen_cg'], request.form['first_seen_cl'],
-                 request.form['first_seen_pg'], request.form['date_gap'], int(request.form['unique_visits']), record_id))
-        
-        elif table_name == 'revenue':
-            conn.execute('''
-                UPDATE revenue SET code=?, month=?, owner=?, team=?, web=?, win_loss=?, rename=?, reteam=?
-                WHERE id=?
-            ''', (request.form['code'], request.form['month'], request.form['owner'],
-                 request.form['team'], request.form['web'], float(request.form['win_loss']),
-                 request.form['rename'], request.form['reteam'], record_id))
-        
-        elif table_name == 'salary':
-            conn.execute('''
-                UPDATE salary SET nickname=?, salary=?, team=?
-                WHERE id=?
-            ''', (request.form['nickname'], float(request.form['salary']), request.form['team'], record_id))
-        
-        conn.commit()
+        values = form_row_values(table_name, form)
+        write_queue.run(edit)
         flash('Record updated successfully!')
+    except WriterBusy:
+        flash(WRITER_BUSY_MESSAGE)
     except Exception as e:
         flash(f'Error updating record: {str(e)}')
-    finally:
-        conn.close()
     
     return redirect(url_for(table_name))
 
 @app.route('/delete/<table_name>/<int:record_id>')
 def delete_record(table_name, record_id):
-    conn = get_db_connection()
+    if table_name not in TABLE_COLUMNS:
+        flash(f'Unknown table: {table_name}')
+        return redirect(url_for('index'))
+
     try:
-        conn.execute(f'DELETE FROM {table_name} WHERE id = ?', (record_id,))
-        conn.commit()
+        write_queue.run(lambda conn: conn.execute(f'DELETE FROM {table_name} WHERE id = ?', (record_id,)))
         flash('Record deleted successfully!')
+    except WriterBusy:
+        flash(WRITER_BUSY_MESSAGE)
     except Exception as e:
         flash(f'Error deleting record: {str(e)}')
-    finally:
-        conn.close()
     
     return redirect(url_for(table_name))
 
+# Ids listed in a bulk dry run
+BULK_SAMPLE_SIZE = 20
+
+def bulk_target(conn, table_name, payload):
+    """WHERE clause selecting the rows of a bulk request, by ids or filter.
+
+    Ids go through a temp table, so any number of them fits in one
+    statement. Filters take the same keys as /api/<table_name>.
+    """
+    ids, filters = payload.get('ids'), payload.get('filter')
+    if (ids is None) == (filters is None):
+        raise ValueError("Give either 'ids' or 'filter'")
+    if ids is not None:
+        if not isinstance(ids, list) or not all(type(id_) is int for id_ in ids):
+            raise ValueError("'ids' must be a list of integers")
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.bulk_ids')
+        conn.executemany('INSERT OR IGNORE INTO temp.bulk_ids (id) VALUES (?)', ((id_,) for id_ in ids))
+        return 'id IN (SELECT id FROM temp.bulk_ids)', []
+
+    if not isinstance(filters, dict) or not filters:
+        raise ValueError("'filter' must be a non-empty object")
+    args = MultiDict([(key, str(value)) for key, values in filters.items()
+                      for value in (values if isinstance(values, list) else [values])])
+    paging = [key for key in args if key in PAGING_ARGS]
+    if paging:
+        raise ValueError(f"Unknown filter: {', '.join(paging)}")
+    clauses, params = build_filters(table_name, args)
+    if not clauses:
+        raise ValueError("'filter' must select rows")
+    where = ' AND '.join(clauses)
+    if table_name in READ_SOURCES:
+        where = f'id IN (SELECT id FROM {READ_SOURCES[table_name]} WHERE {where})'
+    return where, params
+
+def bulk_assignments(table_name, changes):
+    """Typed column values for a bulk update, with their date keys re-parsed.
+
+    String values for numeric columns are cleaned like form and CSV cells.
+    """
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError("'set' must be a non-empty object")
+    types = TABLE_COLUMNS[table_name]
+    values = {}
+    for column, value in changes.items():
+        if column not in SOURCE_COLUMNS[table_name]:
+            raise ValueError(f'Cannot update column: {column}')
+        parse = CELL_PARSERS.get(types[column]) if isinstance(value, str) else None
+        try:
+            values[column] = (None if value is None else
+                              parse(value, column) if parse else types[column](value))
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {column}: {value!r}')
+    for key_column, source_column, parser in DATE_KEY_COLUMNS.get(table_name, ()):
+        if source_column in values:
+            values[key_column] = parser(values[source_column])
+    return values
+
+@app.route('/api/<table_name>/bulk', methods=['POST'])
+def api_bulk(table_name):
+    """Delete or update many rows of a table with one statement and transaction
+
+    Takes a JSON object with "action" ("delete" or "update"), either "ids"
+    or "filter", "set" (column values) for updates and optionally
+    "dry_run". Returns the matched and affected row counts; a dry run
+    reports how many rows would change and a sample of their ids.
+    """
+    if table_name not in TABLE_COLUMNS:
+        return jsonify({"error": f"Unknown table: {table_name}"}), 404
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"error": "Expected a JSON object"}), 400
+    action = payload.get('action')
+    if action not in ('delete', 'update'):
+        return jsonify({"error": "action must be 'delete' or 'update'"}), 400
+    dry_run = bool(payload.get('dry_run'))
+    try:
+        values = bulk_assignments(table_name, payload.get('set')) if action == 'update' else {}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def bulk(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        where, params = bulk_target(conn, table_name, payload)
+        matched = conn.execute(f'SELECT COUNT(*) FROM {table_name} WHERE {where}', params).fetchone()[0]
+        if values:
+            # Only rows that actually change are written
+            where += ' AND NOT (' + ' AND '.join(f'{column} IS ?' for column in values) + ')'
+            params = params + list(values.values())
+
+        result = {'table': table_name, 'action': action, 'dry_run': dry_run, 'matched': matched}
+        if dry_run:
+            result['affected'] = conn.execute(f'SELECT COUNT(*) FROM {table_name} WHERE {where}',
+                                              params).fetchone()[0]
+            result['sample_ids'] = [row['id'] for row in conn.execute(
+                f'SELECT id FROM {table_name} WHERE {where} ORDER BY id LIMIT ?', params + [BULK_SAMPLE_SIZE])]
+            conn.rollback()
+        else:
+            if action == 'update':
+                assignments = ', '.join(f'{column} = ?' for column in values)
+                cursor = conn.execute(f'UPDATE {table_name} SET {assignments} WHERE {where}',
+                                      list(values.values()) + params)
+            else:
+                cursor = conn.execute(f'DELETE FROM {table_name} WHERE {where}', params)
+            result['affected'] = cursor.rowcount
+            conn.execute('DROP TABLE IF EXISTS temp.bulk_ids')
+            conn.commit()
+        return result
+
+    # Exclusive: the statement may touch many rows, and dry runs roll back
+    try:
+        return jsonify(write_queue.run(bulk, exclusive=True))
+    except WriterBusy as e:
+        return jsonify({"error": f'{e}; try again shortly'}), 503, {'Retry-After': WRITER_RETRY_AFTER}
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except sqlite3.IntegrityError as e:
+        return jsonify({"error": str(e)}), 409
+
 @app.route('/health')
 def health_check():
-    """Health check endpoint for Render"""
+    """Health check endpoint for Render; unhealthy while migrations are pending"""
+    global schema_current
+    if not schema_current:
+        conn = get_db_connection()
+        try:
+            schema_current = read_schema_version(conn) >= SCHEMA_VERSION
+        finally:
+            conn.close()
+        if not schema_current:
+            return {"status": "schema_outdated", "timestamp": datetime.now().isoformat()}, 503
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.before_request
+def start_request_timer():
+    if METRICS_ENABLED:
+        g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Observe the request latency; streamed bodies are timed up to their first byte"""
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_duration_seconds',
+                        (('method', request.method), ('route', route), ('status', response.status_code)),
+                        time.perf_counter() - started)
+    return response
+
+def start_template_timer(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+def record_template_metrics(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        metrics.observe('template_render_seconds', (('template', template.name),),
+                        time.perf_counter() - started)
+
+if METRICS_ENABLED:
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template_metrics, app)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text metrics for this worker process"""
+    pool = db_pool.stats()
+    cache = response_cache.stats()
+    writes = write_queue.stats()
+    samples = [
+        ('db_pool_connections', 'gauge', 'Pooled database connections by state',
+         [((('state', state),), pool[state]) for state in ('open', 'idle', 'in_use')]),
+        ('db_pool_acquires_total', 'counter', 'Connection pool acquisitions by outcome',
+         [((('result', result),), pool[key]) for result, key in
+          (('hit', 'hits'), ('miss', 'misses'), ('wait', 'waits'), ('timeout', 'timeouts'))]),
+        ('db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a free connection',
+         [((), pool['wait_seconds'])]),
+        ('response_cache_lookups_total', 'counter', 'Response cache lookups by outcome',
+         [((('result', result),), cache[result]) for result in ('hits', 'misses', 'stale')]),
+        ('response_cache_evictions_total', 'counter', 'Responses evicted from the cache',
+         [((), cache['evictions'])]),
+        ('response_cache_not_modified_total', 'counter', 'Cached responses answered with 304',
+         [((), cache['not_modified'])]),
+        ('response_cache_entries', 'gauge', 'Responses held in the cache', [((), cache['entries'])]),
+        ('response_cache_bytes', 'gauge', 'Bytes of responses held in the cache', [((), cache['bytes'])]),
+        ('write_queue_jobs_total', 'counter', 'Writes applied by the writer thread, by outcome',
+         [((('result', 'ok'),), writes['jobs'] - writes['failed']), ((('result', 'failed'),), writes['failed']),
+          ((('result', 'timeout'),), writes['timeouts'])]),
+        ('write_queue_transactions_total', 'counter', 'Writer transactions by kind',
+         [((('kind', 'group'),), writes['groups']), ((('kind', 'exclusive'),), writes['exclusive'])]),
+        ('write_queue_depth', 'gauge', 'Writes waiting for the writer thread', [((), writes['queued'])]),
+        ('analytics_store_rows', 'gauge', 'Rows held in the analytics column stores',
+         [((('table', table),), len(store)) for table, store in analytics_stores.items()]),
+        ('analytics_store_bytes', 'gauge', 'Approximate bytes held by the analytics column stores',
+         [((('table', table),), store.footprint()) for table, store in analytics_stores.items()]),
+    ]
+    return app.response_class(metrics.render(samples), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/db_pool')
+def api_db_pool():
+    """Connection pool hit and wait statistics for this worker process"""
+    return jsonify(db_pool.stats())
+
+@app.route('/api/write_queue')
+def api_write_queue():
+    """Group commit and write lock statistics for this worker process"""
+    return jsonify(write_queue.stats())
+
 @app.route('/api/stats')
+@cached_response()
 def api_stats():
-    """API endpoint for database statistics"""
+    """API endpoint for database statistics
+
+    Returns row counts per table, of the rows listings can return;
+    ?detail=1 adds max ids, running totals and, under 'archived', the
+    counts and totals of archived rows.
+    """
+    detail = request.args.get('detail') in ('1', 'true')
     try:
         conn = get_db_connection()
-        stats = {}
-        tables = ['domain_cost', 'hosting_cost', 'performance', 'revenue', 'salary']
-        
-        for table in tables:
-            count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
-            stats[table] = count
-        
-        conn.close()
-        return jsonify(stats)
+        try:
+            stats = read_table_stats(conn)
+            archived = read_archived_stats(conn) if detail else {}
+        finally:
+            conn.close()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    if not detail:
+        stats = {table: table_stats['row_count'] for table, table_stats in stats.items()}
+    else:
+        for table, table_stats in stats.items():
+            table_stats['archived'] = archived.get(table, {'row_count': 0, 'sums': {}})
+    return jsonify(stats)
+
+@app.route('/api/cache')
+def api_cache():
+    """Response cache hit/miss statistics for this worker process"""
+    return jsonify(response_cache.stats())
+
+ROLLUP_LIMIT = 1000
+
+# How long a rollup read waits for its refresh before serving the rows as they are
+ROLLUP_REFRESH_WAIT = float(os.environ.get('ROLLUP_REFRESH_WAIT', 0.5))
+
+_rollup_refresh = None
+_rollup_refresh_lock = threading.Lock()
+
+def queue_rollup_refresh():
+    """Future for a refresh_rollups() job, shared with any one still queued"""
+    global _rollup_refresh
+    with _rollup_refresh_lock:
+        # A refresh that has started may have missed keys marked since
+        if _rollup_refresh is None or _rollup_refresh.running() or _rollup_refresh.done():
+            _rollup_refresh = write_queue.submit(refresh_rollups, exclusive=True)
+        return _rollup_refresh
+
+@app.route('/api/rollup/<level>')
+@cached_response()
+def api_rollup(level):
+    """Materialized P&L per (domain, month) or (team, month)
+
+    Accepts domain/team equality filters, month_from/month_to (e.g. 'Jan 2025'
+    or '2025-01') and limit. Stale keys are refreshed before reading; when
+    the writer is busy, the rows are served as they are with stale set and
+    the refresh stays queued.
+    """
+    tables = {'domains': ('pnl_domain_month', 'domain'), 'teams': ('pnl_team_month', 'team')}
+    if level not in tables:
+        return jsonify({"error": f"Unknown rollup: {level}"}), 404
+    table, key_column = tables[level]
+
+    clauses, params = [], []
+    for column in ('domain', 'team'):
+        value = request.args.get(column)
+        if value is None:
+            continue
+        if column != key_column:
+            return jsonify({"error": f"Unknown filter: {column}"}), 400
+        clauses.append(f'{column} = ?')
+        params.append(value)
+    for arg, op in (('month_from', '>='), ('month_to', '<=')):
+        value = request.args.get(arg)
+        if value is None:
+            continue
+        key = parse_month_key(value)
+        if key is None:
+            return jsonify({"error": f"Invalid month for {arg}: {value!r}"}), 400
+        clauses.append(f'month_key {op} ?')
+        params.append(key)
+    limit = min(max(request.args.get('limit', ROLLUP_LIMIT, type=int), 1), 10 * ROLLUP_LIMIT)
+
+    sql = f'SELECT * FROM {table}'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += f' ORDER BY month_key DESC, {key_column} LIMIT ?'
+
+    conn = get_db_connection()
+    try:
+        refreshed, stale = {'domains': 0, 'teams': 0}, False
+        if rollups_pending(conn):
+            try:
+                refreshed = queue_rollup_refresh().result(ROLLUP_REFRESH_WAIT)
+            except FutureTimeoutError:
+                stale = True
+        rows = conn.execute(sql, params + [limit]).fetchall()
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        conn.close()
+    response = jsonify({'level': level, 'data': [dict(row) for row in rows], 'refreshed': refreshed,
+                        'stale': stale})
+    if stale:
+        # Not cached, so the next read picks up the refresh
+        response.cache_control.no_store = True
+    return response
+
+@app.route('/api/rollup/rebuild', methods=['POST'])
+def api_rollup_rebuild():
+    """Mark every domain and team stale and recompute the rollups"""
+    def rebuild(conn):
+        for table in ROLLUP_SOURCES:
+            mark_rollups_dirty(conn, table)
+        # Keys whose rows have all been archived only appear in the rollups
+        conn.execute('INSERT OR IGNORE INTO pnl_dirty_domains (domain) SELECT DISTINCT domain FROM pnl_domain_month')
+        conn.execute('INSERT OR IGNORE INTO pnl_dirty_teams (team) SELECT DISTINCT team FROM pnl_team_month')
+        conn.commit()
+        return refresh_rollups(conn)
+
+    try:
+        return jsonify({'refreshed': write_queue.run(rebuild, exclusive=True)})
+    except WriterBusy as e:
+        return jsonify({"error": f'{e}; try again shortly'}), 503, {'Retry-After': WRITER_RETRY_AFTER}
+
+@app.route('/api/performance/monthly')
+@cached_response('performance')
+def api_performance_monthly():
+    """Registrations and topups per month across all domains
+
+    Accepts month_from/month_to and a team filter.
+    """
+    clauses, params = [], []
+    for arg, op in (('month_from', '>='), ('month_to', '<=')):
+        value = request.args.get(arg)
+        if value is None:
+            continue
+        key = parse_month_key(value)
+        if key is None:
+            return jsonify({"error": f"Invalid month for {arg}: {value!r}"}), 400
+        clauses.append(f'month_key {op} ?')
+        params.append(key)
+    team = request.args.get('team')
+    if team is not None:
+        clauses.append('domain_id IN (SELECT id FROM performance WHERE team = ?)')
+        params.append(team)
+
+    sql = ('SELECT month_key, COUNT(*) AS domains, TOTAL(regis) AS regis, TOTAL(topup) AS topup '
+           'FROM performance_monthly')
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += ' GROUP BY month_key ORDER BY month_key'
+
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    return jsonify({'data': [dict(row, regis=int(row['regis']), topup=int(row['topup'])) for row in rows]})
+
+# Columnar analytics: per-worker copies of the numeric revenue and performance
+# columns for group-by totals and top-N queries
+ANALYTICS_ENABLED = os.environ.get('ANALYTICS_ENABLED', '1').lower() not in ('0', 'false', 'off')
+ANALYTICS_MAX_BYTES = int(os.environ.get('ANALYTICS_MAX_BYTES', 128 * 1024 * 1024))
+ANALYTICS_LIMIT = 10
+ANALYTICS_FETCH_ROWS = 10000
+
+# Dimensions (dictionary-encoded) and measures (summed) per table
+ANALYTICS_SOURCES = {
+    'revenue': (('team', 'owner', 'web', 'month_key'), ('win_loss',)),
+    'performance': (('team', 'owner', 'plan', 'domain'), ('total_register', 'total_topup', 'unique_visits')),
+}
+
+# array('I') codes are viewed as uint32 by numpy
+ANALYTICS_CODE_TYPE = 'I' if array.array('I').itemsize == 4 else 'L'
+
+class ColumnStore:
+    """Array-backed copy of a table's analytics columns.
+
+    Dimensions are dictionary-encoded into compact code arrays and
+    measures kept as float arrays. refresh() appends the rows past the id
+    watermark while the table has only seen inserts, and reloads it once
+    write_generations.rewrites shows an update or delete. Group totals are
+    vectorized with numpy when it is installed; without it, unfiltered
+    totals are kept incrementally and filtered ones take one pass over the
+    arrays.
+    """
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.dimensions, self.measures = ANALYTICS_SOURCES[table_name]
+        self.lock = threading.Lock()
+        # rewrites count at which the store last outgrew its budget; only
+        # deletes (which bump rewrites) can bring it back under
+        self.over_budget = None
+        self._stats = {'appends': 0, 'reloads': 0, 'rows_loaded': 0, 'load_seconds': 0.0}
+        self.reset()
+
+    def reset(self):
+        self.lookups = {dimension: {} for dimension in self.dimensions}
+        self.labels = {dimension: [] for dimension in self.dimensions}
+        self.codes = {dimension: array.array(ANALYTICS_CODE_TYPE) for dimension in self.dimensions}
+        self.values = {measure: array.array('d') for measure in self.measures}
+        self.label_bytes = 0
+        self.watermark = 0
+        self.version = None
+        self.totals = {}
+
+    def __len__(self):
+        return len(self.values[self.measures[0]])
+
+    @property
+    def row_bytes(self):
+        return 4 * len(self.dimensions) + 8 * len(self.measures)
+
+    def footprint(self):
+        """Approximate bytes held: arrays, dictionaries and their labels"""
+        dictionaries = sum(sys.getsizeof(self.lookups[dimension]) + sys.getsizeof(self.labels[dimension])
+                           for dimension in self.dimensions)
+        return len(self) * self.row_bytes + dictionaries + self.label_bytes
+
+    def refresh(self, conn, budget):
+        """Bring the store up to date within budget bytes.
+
+        Returns 'current', 'append', 'reload' or 'over_budget'.
+        """
+        conn.execute('BEGIN')
+        try:
+            row = conn.execute('SELECT generation, rewrites FROM write_generations WHERE table_name = ?',
+                               (self.table_name,)).fetchone()
+            version = (row['generation'], row['rewrites'])
+            if version == self.version:
+                return 'current'
+            if self.over_budget == version[1]:
+                return 'over_budget'
+            mode = 'append' if self.version is not None and version[1] == self.version[1] else 'reload'
+            if mode == 'reload':
+                self.reset()
+                row_count = conn.execute('SELECT row_count FROM table_stats WHERE table_name = ?',
+                                         (self.table_name,)).fetchone()[0]
+                if row_count * self.row_bytes > budget:
+                    self.over_budget = version[1]
+                    return 'over_budget'
+            started = time.perf_counter()
+            loaded = self.load(conn, budget)
+            if loaded is None:
+                self.over_budget = version[1]
+                self.reset()
+                return 'over_budget'
+        finally:
+            conn.rollback()
+        self.over_budget = None
+        self.version = version
+        self._stats[f'{mode}s'] += 1
+        self._stats['rows_loaded'] += loaded
+        self._stats['load_seconds'] += time.perf_counter() - started
+        return mode
+
+    def load(self, conn, budget):
+        """Append the rows past the watermark; returns how many were read.
+
+        Stops and returns None as soon as the store grows past budget bytes.
+        """
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        columns = list(self.dimensions) + [f'CAST(COALESCE({measure}, 0) AS REAL)' for measure in self.measures]
+        cursor.execute(f"SELECT id, {', '.join(columns)} FROM {self.table_name} WHERE id > ? ORDER BY id",
+                       (self.watermark,))
+        loaded = 0
+        while True:
+            rows = cursor.fetchmany(ANALYTICS_FETCH_ROWS)
+            if not rows:
+                break
+            loaded += len(rows)
+            columns = list(zip(*rows))
+            self.watermark = columns[0][-1]
+            for dimension, column in zip(self.dimensions, columns[1:]):
+                lookup = self.lookups[dimension]
+                known = len(lookup)
+                setdefault = lookup.setdefault
+                self.codes[dimension].extend([setdefault(value, len(lookup)) for value in column])
+                if len(lookup) > known:
+                    added = list(itertools.islice(lookup, known, None))
+                    self.labels[dimension].extend(added)
+                    self.label_bytes += sum(map(sys.getsizeof, added))
+            for measure, column in zip(self.measures, columns[1 + len(self.dimensions):]):
+                self.values[measure].extend(column)
+            if self.footprint() > budget:
+                return None
+        return loaded
+
+    def group_totals(self, group_by, filters):
+        """Row counts and measure sums per code of group_by.
+
+        filters maps dimensions to the set of codes a row must have.
+        Returns (counts, {measure: sums}), lists indexed by code.
+        """
+        size = len(self.labels[group_by])
+        if numpy is not None:
+            codes = numpy.frombuffer(self.codes[group_by], dtype=numpy.uint32)
+            mask = None
+            for dimension, allowed in filters.items():
+                matches = numpy.isin(numpy.frombuffer(self.codes[dimension], dtype=numpy.uint32),
+                                     numpy.fromiter(allowed, dtype=numpy.uint32, count=len(allowed)))
+                mask = matches if mask is None else mask & matches
+            if mask is not None:
+                codes = codes[mask]
+            sums = {}
+            for measure in self.measures:
+                values = numpy.frombuffer(self.values[measure], dtype=numpy.float64)
+                sums[measure] = numpy.bincount(codes, weights=values if mask is None else values[mask],
+                                               minlength=size).tolist()
+            return numpy.bincount(codes, minlength=size).tolist(), sums
+
+        if not filters:
+            return self.running_totals(group_by)
+        selectors = None
+        for dimension, allowed in filters.items():
+            matches = bytes(map(allowed.__contains__, self.codes[dimension]))
+            selectors = matches if selectors is None else bytes(map(operator.and_, selectors, matches))
+        codes = list(itertools.compress(self.codes[group_by], selectors))
+        counts, sums = [0] * size, {}
+        for code, count in collections.Counter(codes).items():
+            counts[code] = count
+        for measure in self.measures:
+            totals = sums[measure] = [0.0] * size
+            for code, value in zip(codes, itertools.compress(self.values[measure], selectors)):
+                totals[code] += value
+        return counts, sums
+
+    def running_totals(self, group_by):
+        """Unfiltered totals per code, extended over rows appended since the last call"""
+        done, counts, sums = self.totals.get(group_by, (0, [], {measure: [] for measure in self.measures}))
+        size = len(self.labels[group_by])
+        counts.extend([0] * (size - len(counts)))
+        codes = self.codes[group_by][done:]
+        for code, count in collections.Counter(codes).items():
+            counts[code] += count
+        for measure in self.measures:
+            totals = sums[measure]
+            totals.extend([0.0] * (size - len(totals)))
+            for code, value in zip(codes, self.values[measure][done:]):
+                totals[code] += value
+        self.totals[group_by] = (len(self), counts, sums)
+        return counts, sums
+
+    def stats(self):
+        stats = dict(self._stats, table=self.table_name, rows=len(self), bytes=self.footprint(),
+                     watermark=self.watermark, over_budget=self.over_budget is not None,
+                     dimensions={dimension: len(self.labels[dimension]) for dimension in self.dimensions})
+        stats['load_seconds'] = round(stats['load_seconds'], 3)
+        return stats
+
+analytics_stores = {table: ColumnStore(table) for table in ANALYTICS_SOURCES}
+
+def analytics_engine():
+    return 'numpy' if numpy is not None else 'array'
+
+def analytics_columnar(conn, store, group_by, filters, months, sort, limit):
+    """Top groups from the column store, or None when it is over budget"""
+    with store.lock:
+        other_stores = sum(other.footprint() for other in analytics_stores.values() if other is not store)
+        refresh = store.refresh(conn, ANALYTICS_MAX_BYTES - other_stores)
+        if refresh == 'over_budget':
+            return None, refresh
+        allowed = {}
+        for dimension, values in filters.items():
+            lookup = store.lookups[dimension]
+            allowed[dimension] = {lookup[value] for value in values if value in lookup}
+        if months:
+            low, high = months
+            allowed['month_key'] = {code for code, key in enumerate(store.labels['month_key'])
+                                    if key is not None and low <= key <= high
+                                    and code in allowed.get('month_key', [code])}
+        counts, sums = store.group_totals(group_by, allowed)
+        labels = store.labels[group_by]
+        ranking = counts if sort == 'rows' else sums[sort]
+        # Find the limit-th largest value at C speed, then order just the
+        # groups that reach it, breaking ties by label like the SQL path
+        largest = heapq.nlargest(limit, itertools.compress(ranking, counts))
+        candidates = [code for code in itertools.compress(range(len(ranking)), map(largest[-1].__le__, ranking))
+                      if counts[code]] if largest else []
+        top = sorted(candidates, key=lambda code: (-ranking[code], labels[code] is None,
+                                                   '' if labels[code] is None else labels[code]))[:limit]
+        return [dict({group_by: labels[code], 'rows': counts[code]},
+                     **{measure: sums[measure][code] for measure in store.measures}) for code in top], refresh
+
+def analytics_sql(conn, table_name, group_by, filters, months, sort, limit):
+    """The same top groups computed with a GROUP BY, for when the store is unavailable"""
+    measures = ANALYTICS_SOURCES[table_name][1]
+    clauses, params = [], []
+    for dimension, values in filters.items():
+        clauses.append(f"{dimension} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    if months:
+        clauses.append('month_key BETWEEN ? AND ?')
+        params.extend(months)
+    totals = ', '.join(f'TOTAL({measure}) AS {measure}' for measure in measures)
+    sql = f'SELECT {group_by}, COUNT(*) AS rows, {totals} FROM {table_name}'
+    if clauses:
+        sql += ' WHERE ' + ' AND '.join(clauses)
+    sql += f' GROUP BY {group_by} ORDER BY {sort} DESC, {group_by} IS NULL, {group_by} LIMIT ?'
+    return [dict(row) for row in conn.execute(sql, params + [limit])]
+
+@app.route('/api/analytics/<table_name>')
+@cached_response('{table_name}')
+def api_analytics(table_name):
+    """Group-by totals and top-N groups over revenue or performance
+
+    group_by names a dimension (default team); the other dimensions filter
+    by equality (repeat to match several values) and month_from/month_to
+    range over revenue months. sort is a measure or 'rows' and limit caps
+    the groups returned, largest first.
+    """
+    if table_name not in ANALYTICS_SOURCES:
+        return jsonify({"error": f"Unknown table: {table_name}"}), 404
+    dimensions, measures = ANALYTICS_SOURCES[table_name]
+    group_by = request.args.get('group_by', 'team')
+    if group_by not in dimensions:
+        return jsonify({"error": f"group_by must be one of: {', '.join(dimensions)}"}), 400
+    sort = request.args.get('sort', measures[0])
+    if sort not in measures and sort != 'rows':
+        return jsonify({"error": f"sort must be 'rows' or one of: {', '.join(measures)}"}), 400
+    limit = min(max(request.args.get('limit', ANALYTICS_LIMIT, type=int), 1), ROLLUP_LIMIT)
+
+    filters, months = {}, None
+    for key in request.args:
+        if key in ('group_by', 'sort', 'limit'):
+            continue
+        if key in ('month_from', 'month_to') and 'month_key' in dimensions:
+            continue
+        if key not in dimensions:
+            return jsonify({"error": f"Unknown filter: {key}"}), 400
+        values = request.args.getlist(key)
+        if TABLE_COLUMNS[table_name][key] is int:
+            try:
+                values = [int(value) for value in values]
+            except ValueError:
+                return jsonify({"error": f"Invalid value for {key}: {request.args.get(key)!r}"}), 400
+        filters[key] = values
+    if 'month_key' in dimensions and ('month_from' in request.args or 'month_to' in request.args):
+        months = []
+        for arg, default in (('month_from', 0), ('month_to', 999999)):
+            value = request.args.get(arg)
+            key = default if value is None else parse_month_key(value)
+            if key is None:
+                return jsonify({"error": f"Invalid month for {arg}: {value!r}"}), 400
+            months.append(key)
+
+    conn = get_db_connection()
+    try:
+        data, refresh = None, 'disabled'
+        if ANALYTICS_ENABLED:
+            data, refresh = analytics_columnar(conn, analytics_stores[table_name], group_by, filters,
+                                               months, sort, limit)
+        engine = analytics_engine()
+        if data is None:
+            data, engine = analytics_sql(conn, table_name, group_by, filters, months, sort, limit), 'sql'
+    finally:
+        conn.close()
+
+    for row in data:
+        for measure in measures:
+            if TABLE_COLUMNS[table_name][measure] is int:
+                row[measure] = int(row[measure])
+    return jsonify({'table': table_name, 'group_by': group_by, 'sort': sort, 'engine': engine,
+                    'refresh': refresh, 'data': data})
+
+@app.route('/api/analytics')
+def api_analytics_status():
+    """Column store sizes and refresh statistics for this worker process"""
+    stores = {}
+    for table, store in analytics_stores.items():
+        with store.lock:
+            stores[table] = store.stats()
+    return jsonify({'enabled': ANALYTICS_ENABLED, 'engine': analytics_engine(), 'max_bytes': ANALYTICS_MAX_BYTES,
+                    'bytes': sum(stats['bytes'] for stats in stores.values()), 'stores': stores})
+
+# Hot/cold partitions: rows dated before a month cutoff are moved out of the
+# hot database into one archive file per year. Readers ATTACH the archives
+# read-only when a query's date range reaches them, so filtered listings and
+# exports span both while the hot database only holds recent months; rollups
+# read each archive in turn.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(DATABASE)), 'archive'))
+ARCHIVE_HOT_MONTHS = int(os.environ.get('ARCHIVE_HOT_MONTHS', 12))
+# Most archives one query may attach; SQLite allows 10 attached databases by default
+ARCHIVE_MAX_ATTACHED = int(os.environ.get('ARCHIVE_MAX_ATTACHED', 8))
+
+# Archived tables, with the date key column rows are partitioned on and its
+# scale to a month key (performance is keyed by its yyyymmdd end date)
+ARCHIVE_TABLES = {
+    'domain_cost': ('month_key', 1),
+    'hosting_cost': ('month_registration_key', 1),
+    'revenue': ('month_key', 1),
+    'performance': ('end_date_key', 100),
+}
+
+# Tables whose rows are archived along with their parent row
+ARCHIVE_CHILD_TABLES = {'performance_monthly': 'performance'}
+
+def archive_path(period):
+    stem = os.path.splitext(os.path.basename(DATABASE))[0]
+    return os.path.join(ARCHIVE_DIR, f'{stem}-{period}.db')
+
+def archive_schema(period):
+    return f'archive_{period}'
+
+def archive_cutoff(today=None):
+    """First month key kept hot when the last ARCHIVE_HOT_MONTHS months stay hot"""
+    today = today or date.today()
+    months = today.year * 12 + today.month - ARCHIVE_HOT_MONTHS
+    return (months // 12) * 100 + months % 12 + 1
+
+def attached_schemas(conn):
+    return {row[1] for row in conn.execute('PRAGMA database_list')}
+
+def attach_archive(conn, period):
+    """Attach period's archive read-only, unless conn already has it"""
+    schema = archive_schema(period)
+    if schema not in attached_schemas(conn):
+        uri = pathlib.Path(archive_path(period)).resolve().as_uri() + '?mode=ro'
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (uri,))
+    return schema
+
+def detach_archives(conn):
+    for schema in attached_schemas(conn):
+        if schema.startswith('archive_'):
+            conn.execute(f'DETACH DATABASE {schema}')
+    conn.archives_attached = False
+
+def archive_partitions_in_range(conn, table_name, first=None, last=None):
+    """(period, archived_before) of table_name's archives holding months in first..last.
+
+    Without a range (both None) no archive is read: archives are only
+    attached for date filters that reach them. Either end may be None for
+    an open range. Raises ValueError when the range needs more than
+    ARCHIVE_MAX_ATTACHED archives.
+    """
+    parent = ARCHIVE_CHILD_TABLES.get(table_name, table_name)
+    if parent not in ARCHIVE_TABLES or (first is None and last is None):
+        return []
+    partitions = []
+    for period, archived_before in conn.execute('SELECT period, archived_before FROM archive_partitions '
+                                                'WHERE table_name = ? ORDER BY period', (parent,)).fetchall():
+        if last is not None and period * 100 + 1 > last:
+            continue
+        if first is not None and min(period * 100 + 12, archived_before - 1) < first:
+            continue
+        partitions.append((period, archived_before))
+    if len(partitions) > ARCHIVE_MAX_ATTACHED:
+        raise ValueError(f'The date range reaches {len(partitions)} archived years; '
+                         f'at most {ARCHIVE_MAX_ATTACHED} can be read at once, narrow month_from/month_to')
+    return partitions
+
+def archive_arms(conn, table_name, first=None, last=None):
+    """(schema, condition) for each partition a read of table_name needs.
+
+    The hot database ('main', no condition) always comes first, followed by
+    the archives archive_partitions_in_range() selects, attached read-only
+    the first time this connection needs them; pooled connections detach
+    them again when released. The condition keeps an archive to the months
+    it is registered for, hiding rows an interrupted archive_months() run
+    copied but never removed from the hot side.
+    """
+    parent = ARCHIVE_CHILD_TABLES.get(table_name, table_name)
+    arms = [('main', None)]
+    for period, archived_before in archive_partitions_in_range(conn, table_name, first, last):
+        schema = attach_archive(conn, period)
+        conn.archives_attached = True
+        column, scale = ARCHIVE_TABLES[parent]
+        condition = f'{column} < {archived_before * scale}' if parent == table_name else None
+        arms.append((schema, condition))
+    return arms
+
+def archive_union(arms, sql):
+    """sql once per partition in arms, joined by UNION ALL.
+
+    {schema} in sql names the partition's database and {visible} is its row
+    condition ('1' for the hot database).
+    """
+    return '\nUNION ALL\n'.join(sql.format(schema=schema, visible=condition or '1')
+                                for schema, condition in arms)
+
+def archive_range(table_name, args):
+    """(first, last) month keys the date filters in args limit table_name's partition key to"""
+    if table_name not in ARCHIVE_TABLES:
+        return None, None
+    column = ARCHIVE_TABLES[table_name][0]
+    first = last = None
+    if MONTH_FILTER_COLUMNS.get(table_name) == column:
+        first, last = parse_month_key(args.get('month_from')), parse_month_key(args.get('month_to'))
+    if 'expires_within_days' in args and EXPIRY_FILTER_COLUMNS.get(table_name, (None,))[0] == column:
+        ends = sorted((date.today(), date.today() + timedelta(days=int(args.get('expires_within_days')))))
+        first, last = [end.year * 100 + end.month for end in ends]
+    return first, last
+
+def archive_select(conn, table_name, columns, clauses, params, first=None, last=None):
+    """SELECT of columns from table_name's listing source over every partition in range.
+
+    clauses and params are build_filters() output, repeated per partition;
+    columns may name the partition as {schema}. Returns (sql, params), to
+    be completed with ORDER BY/LIMIT over the result columns.
+    """
+    source = READ_SOURCES.get(table_name, table_name)
+    arms = archive_arms(conn, table_name, first, last)
+    where = ' AND '.join(clauses + ['{visible}'])
+    sql = archive_union(arms, f"SELECT {', '.join(columns)} FROM {{schema}}.{source} AS {source} WHERE {where}")
+    return sql, list(params) * len(arms)
+
+def create_archive_tables(conn, schema):
+    """Create or catch up the archived tables in an attached archive file.
+
+    Tables and their non-unique indexes are copied from the hot definitions;
+    columns added to a hot table since the archive was created are added
+    to it. Each file gets its own performance_wide view.
+    """
+    for table_name in list(ARCHIVE_TABLES) + list(ARCHIVE_CHILD_TABLES):
+        existing = {row['name'] for row in conn.execute(f'PRAGMA {schema}.table_info({table_name})')}
+        if not existing:
+            (sql,) = conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'table' AND name = ?",
+                                  (table_name,)).fetchone()
+            conn.execute(re.sub(r'^CREATE TABLE\s+', f'CREATE TABLE {schema}.', sql))
+        else:
+            for row in conn.execute(f'PRAGMA main.table_info({table_name})').fetchall():
+                if row['name'] not in existing:
+                    conn.execute(f"ALTER TABLE {schema}.{table_name} ADD COLUMN {row['name']} {row['type']}")
+        for (sql,) in conn.execute("SELECT sql FROM main.sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                   "AND sql LIKE 'CREATE INDEX %'", (table_name,)).fetchall():
+            conn.execute(re.sub(r'^CREATE INDEX\s+', f'CREATE INDEX IF NOT EXISTS {schema}.', sql))
+    conn.execute(f'DROP VIEW IF EXISTS {schema}.performance_wide')
+    conn.execute(f'CREATE VIEW {schema}.performance_wide AS {performance_wide_sql()}')
+
+def count_archive_partition(conn, schema, period, table_name):
+    """Record the row count and STATS_SUM_COLUMNS totals of a registered partition.
+
+    Only rows its archived_before lets reads see are counted, from the
+    archive attached as schema.
+    """
+    column, scale = ARCHIVE_TABLES[table_name]
+    (archived_before,) = conn.execute('SELECT archived_before FROM archive_partitions '
+                                      'WHERE period = ? AND table_name = ?', (period, table_name)).fetchone()
+    sum_columns = STATS_SUM_COLUMNS[table_name]
+    row = conn.execute(f"SELECT {', '.join(['COUNT(*)'] + [f'TOTAL({name})' for name in sum_columns])} "
+                       f'FROM {schema}.{table_name} WHERE {column} < ?', (archived_before * scale,)).fetchone()
+    conn.execute('UPDATE archive_partitions SET row_count = ? WHERE period = ? AND table_name = ?',
+                 (row[0], period, table_name))
+    conn.executemany('INSERT OR REPLACE INTO archive_partition_sums (period, table_name, column_name, total) '
+                     'VALUES (?, ?, ?, ?)',
+                     [(period, table_name, name, total) for name, total in zip(sum_columns, row[1:])])
+
+def archive_months(conn, before):
+    """Move rows dated before the month key `before` into per-year archive files.
+
+    Partitioning follows ARCHIVE_TABLES; performance rows take their
+    monthly figures along. Each year is first copied into its archive and
+    committed there, then deleted from the hot database in a second
+    transaction that also registers it in archive_partitions, so a run that
+    stops half way loses nothing and the next run finishes the move.
+    table_stats follows the hot rows down; archived rows are counted per
+    partition instead (see count_archive_partition()). Moving rows changes
+    no P&L, so the pending rollup keys are left as they were. Returns the
+    rows moved per table.
+    """
+    started = time.perf_counter()
+    periods = set()
+    for table_name, (column, scale) in ARCHIVE_TABLES.items():
+        periods.update(period for (period,) in conn.execute(
+            f'SELECT DISTINCT {column} / {100 * scale} FROM {table_name} WHERE {column} < ?', (before * scale,)))
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    moved = dict.fromkeys(ARCHIVE_TABLES, 0)
+    for period in sorted(periods):
+        schema = archive_schema(period)
+        # A read-only attachment from an earlier read is replaced by a writable one
+        if schema in attached_schemas(conn):
+            conn.execute(f'DETACH DATABASE {schema}')
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (archive_path(period),))
+        try:
+            conn.execute(f'PRAGMA {schema}.journal_mode = DELETE')
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                create_archive_tables(conn, schema)
+                # Rows of an unregistered table are leftovers of an interrupted
+                # archive or restore run, and are all still in the hot database
+                registered = {row[0] for row in conn.execute(
+                    'SELECT table_name FROM archive_partitions WHERE period = ?', (period,))}
+                for table_name, parent in [(table, table) for table in ARCHIVE_TABLES] + list(ARCHIVE_CHILD_TABLES.items()):
+                    if parent not in registered:
+                        conn.execute(f'DELETE FROM {schema}.{table_name}')
+                for table_name, (column, scale) in ARCHIVE_TABLES.items():
+                    columns = ', '.join(row['name'] for row in conn.execute(f'PRAGMA main.table_info({table_name})'))
+                    conn.execute(f'INSERT OR REPLACE INTO {schema}.{table_name} ({columns}) '
+                                 f'SELECT {columns} FROM main.{table_name} '
+                                 f'WHERE {column} < ? AND {column} / {100 * scale} = ?', (before * scale, period))
+                conn.execute(f'''
+                    INSERT OR REPLACE INTO {schema}.performance_monthly (domain_id, month_key, regis, topup)
+                    SELECT domain_id, month_key, regis, topup FROM main.performance_monthly
+                    WHERE domain_id IN (SELECT id FROM {schema}.performance)
+                ''')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                dirty_domains = conn.execute('SELECT domain FROM pnl_dirty_domains').fetchall()
+                dirty_teams = conn.execute('SELECT team FROM pnl_dirty_teams').fetchall()
+                for table_name, (column, scale) in ARCHIVE_TABLES.items():
+                    # Monthly rows go with their performance row (performance_monthly_cascade)
+                    moved[table_name] += conn.execute(
+                        f'DELETE FROM main.{table_name} WHERE {column} < ? AND {column} / {100 * scale} = ? '
+                        f'AND id IN (SELECT id FROM {schema}.{table_name})', (before * scale, period)).rowcount
+                    (archived,) = conn.execute(f'SELECT COUNT(*) FROM {schema}.{table_name}').fetchone()
+                    if archived:
+                        conn.execute('''
+                            INSERT INTO archive_partitions (period, table_name, archived_before, row_count, archived_at)
+                            VALUES (?, ?, ?, 0, ?)
+                            ON CONFLICT (table_name, period) DO UPDATE SET
+                                archived_before = MAX(archived_before, excluded.archived_before),
+                                archived_at = excluded.archived_at
+                        ''', (period, table_name, before, datetime.now().isoformat(timespec='seconds')))
+                        count_archive_partition(conn, schema, period, table_name)
+                conn.execute('DELETE FROM pnl_dirty_domains')
+                conn.execute('DELETE FROM pnl_dirty_teams')
+                conn.executemany('INSERT INTO pnl_dirty_domains (domain) VALUES (?)', dirty_domains)
+                conn.executemany('INSERT INTO pnl_dirty_teams (team) VALUES (?)', dirty_teams)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute(f'DETACH DATABASE {schema}')
+
+    return {
+        'before': before,
+        'periods': sorted(periods),
+        'tables': moved,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+
+def restore_archives(conn, periods=None):
+    """Move the rows of archived years (all of them by default) back into the hot database.
+
+    The reverse of archive_months(): each year's visible rows are copied
+    back with their ids and monthly figures and unregistered from
+    archive_partitions in one transaction, then the archive file is
+    removed. table_stats counts the rows back in as they are inserted and
+    the rollups are left as they were; the tables count as rewritten, so
+    column stores reload. Returns the rows restored per table.
+    """
+    started = time.perf_counter()
+    registered = sorted({row[0] for row in conn.execute('SELECT period FROM archive_partitions')})
+    periods = registered if periods is None else sorted(set(periods) & set(registered))
+    restored = dict.fromkeys(ARCHIVE_TABLES, 0)
+    for period in periods:
+        schema = archive_schema(period)
+        if schema in attached_schemas(conn):
+            conn.execute(f'DETACH DATABASE {schema}')
+        conn.execute(f'ATTACH DATABASE ? AS {schema}', (archive_path(period),))
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                dirty_domains = conn.execute('SELECT domain FROM pnl_dirty_domains').fetchall()
+                dirty_teams = conn.execute('SELECT team FROM pnl_dirty_teams').fetchall()
+                partitions = conn.execute('SELECT table_name, archived_before FROM archive_partitions '
+                                          'WHERE period = ?', (period,)).fetchall()
+                for table_name, archived_before in partitions:
+                    column, scale = ARCHIVE_TABLES[table_name]
+                    visible = f'{column} < {archived_before * scale}'
+                    if table_name == 'performance':
+                        # Monthly rows go first, so their insert triggers find
+                        # no performance row to clear the row_hash of
+                        conn.execute(f'''
+                            INSERT OR REPLACE INTO main.performance_monthly (domain_id, month_key, regis, topup)
+                            SELECT domain_id, month_key, regis, topup FROM {schema}.performance_monthly
+                            WHERE domain_id IN (SELECT id FROM {schema}.performance WHERE {visible})
+                        ''')
+                    columns = ', '.join(row['name'] for row in conn.execute(f'PRAGMA main.table_info({table_name})'))
+                    restored[table_name] += conn.execute(
+                        f'INSERT INTO main.{table_name} ({columns}) SELECT {columns} FROM {schema}.{table_name} '
+                        f'WHERE {visible} AND id NOT IN (SELECT id FROM main.{table_name})').rowcount
+                    conn.execute("UPDATE write_generations SET rewrites = rewrites + 1 WHERE table_name = ?",
+                                 (table_name,))
+                conn.execute('DELETE FROM archive_partitions WHERE period = ?', (period,))
+                conn.execute('DELETE FROM archive_partition_sums WHERE period = ?', (period,))
+                conn.execute('DELETE FROM pnl_dirty_domains')
+                conn.execute('DELETE FROM pnl_dirty_teams')
+                conn.executemany('INSERT INTO pnl_dirty_domains (domain) VALUES (?)', dirty_domains)
+                conn.executemany('INSERT INTO pnl_dirty_teams (team) VALUES (?)', dirty_teams)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute(f'DETACH DATABASE {schema}')
+        # A file left behind is unregistered, so it is never read and the
+        # next archive_months() run clears it
+        os.remove(archive_path(period))
+
+    return {
+        'periods': periods,
+        'tables': restored,
+        'elapsed_seconds': round(time.perf_counter() - started, 3),
+    }
+
+def read_archive_partitions(conn):
+    return [dict(row, path=archive_path(row['period'])) for row in conn.execute(
+        'SELECT period, table_name, archived_before, row_count, archived_at FROM archive_partitions '
+        'ORDER BY period, table_name')]
+
+@app.route('/api/archive', methods=['GET', 'POST'])
+def api_archive():
+    """Archive partitions; POST moves rows dated before ?before= (default: keep ARCHIVE_HOT_MONTHS hot)"""
+    if request.method == 'POST':
+        value = request.values.get('before')
+        before = parse_month_key(value) if value else archive_cutoff()
+        if before is None:
+            return jsonify({"error": f"Invalid month for before: {value!r}"}), 400
+        return jsonify(write_queue.run(lambda conn: archive_months(conn, before), exclusive=True, timeout=None))
+
+    conn = get_db_connection()
+    try:
+        partitions = read_archive_partitions(conn)
+    finally:
+        conn.close()
+    return jsonify({'archive_dir': ARCHIVE_DIR, 'hot_months': ARCHIVE_HOT_MONTHS, 'cutoff': archive_cutoff(),
+                    'partitions': partitions})
+
+@app.route('/api/archive/restore', methods=['POST'])
+def api_archive_restore():
+    """Move archived years back into the hot database; ?year= (repeatable) picks them, default all"""
+    try:
+        periods = [int(value) for value in request.values.getlist('year')] or None
+    except ValueError:
+        return jsonify({"error": f"Invalid year: {request.values.get('year')!r}"}), 400
+    return jsonify(write_queue.run(lambda conn: restore_archives(conn, periods), exclusive=True, timeout=None))
+
+@db_cli.command('archive')
+@click.option('--before', help="Archive rows dated before this month, e.g. 'Jan 2025' "
+                               "(default: keep ARCHIVE_HOT_MONTHS months hot).")
+@click.option('--vacuum', is_flag=True, help='VACUUM the hot database afterwards to return the space.')
+def db_archive(before, vacuum):
+    """Move old months into per-year archive files."""
+    cutoff = parse_month_key(before) if before else archive_cutoff()
+    if cutoff is None:
+        raise click.BadParameter(f'Invalid month: {before!r}', param_hint='--before')
+
+    def archive(conn):
+        summary = archive_months(conn, cutoff)
+        if vacuum:
+            conn.execute('VACUUM')
+        return summary
+
+    summary = write_queue.run(archive, exclusive=True, timeout=None)
+    for table_name, count in summary['tables'].items():
+        click.echo(f'{table_name}: {count} rows archived')
+    click.echo(f"Archived before {cutoff} into {len(summary['periods'])} file(s) "
+               f"in {summary['elapsed_seconds']:.2f}s")
+
+@db_cli.command('restore')
+@click.option('--year', 'years', type=int, multiple=True, help='Archived year to restore (repeatable; default: all).')
+def db_restore(years):
+    """Move archived years back into the hot database."""
+    summary = write_queue.run(lambda conn: restore_archives(conn, list(years) or None), exclusive=True, timeout=None)
+    for table_name, count in summary['tables'].items():
+        click.echo(f'{table_name}: {count} rows restored')
+    click.echo(f"Restored {len(summary['periods'])} archive file(s) in {summary['elapsed_seconds']:.2f}s")
+
 # Initialize database on startup
 with app.app_context():
-    init_database()
-    import_initial_data()
+    schema_current = check_schema()
+    db_pool.clear()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
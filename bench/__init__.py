@@ -0,0 +1,8 @@
+"""Load and benchmark suite for the database explorer.
+
+``python -m bench generate`` writes synthetic CSVs shaped like the
+"Sample Data - *.csv" files, ``python -m bench run`` imports them into a
+scratch database through the Flask test client and records throughput,
+latency and memory as a JSON report, and ``python -m bench compare``
+diffs two reports.
+"""
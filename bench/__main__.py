@@ -0,0 +1,62 @@
+"""Command line entry point: python -m bench {generate,run,compare}"""
+import argparse
+import json
+import sys
+
+from bench.generate import TABLE_HEADERS, generate_dataset
+from bench.runner import compare_reports, load_report, run_benchmark, write_report
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_data_options(command):
+        command.add_argument('--rows', type=int, default=10000, help='rows per table (default 10000)')
+        command.add_argument('--tables', nargs='+', choices=sorted(TABLE_HEADERS), help='tables to include')
+        command.add_argument('--seed', type=int, default=0, help='random seed (default 0)')
+
+    generate = commands.add_parser('generate', help='write synthetic CSVs')
+    add_data_options(generate)
+    generate.add_argument('--out', default='bench_data', help='output directory (default bench_data)')
+
+    run = commands.add_parser('run', help='import synthetic data and time the app')
+    add_data_options(run)
+    run.add_argument('--requests', type=int, default=200, help='samples per endpoint (default 200)')
+    run.add_argument('--batch-size', type=int, help='import batch size (default IMPORT_BATCH_SIZE)')
+    run.add_argument('--data', help='directory of CSVs from `generate` to import instead')
+    run.add_argument('--workdir', help='scratch directory for the database (default: a temp dir)')
+    run.add_argument('--output', help='write the JSON report here instead of stdout')
+
+    compare = commands.add_parser('compare', help='diff two JSON reports')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'generate':
+        for table, path in generate_dataset(args.out, args.rows, args.tables, args.seed).items():
+            print(f'{table}: {path}')
+    elif args.command == 'run':
+        report = run_benchmark(args.rows, args.workdir, args.tables, args.seed, args.requests,
+                               args.batch_size, args.data)
+        if args.output:
+            write_report(report, args.output)
+            print(f'Report written to {args.output}', file=sys.stderr)
+        else:
+            print(json.dumps(report, indent=2, sort_keys=True))
+    else:
+        old, new = load_report(args.old), load_report(args.new)
+        for setting in ('rows_per_table', 'tables', 'seed', 'requests'):
+            if old['meta'].get(setting) != new['meta'].get(setting):
+                print(f"warning: {setting} differs ({old['meta'].get(setting)} vs {new['meta'].get(setting)})",
+                      file=sys.stderr)
+        rows = compare_reports(old, new)
+        width = max((len(row[0]) for row in rows), default=6)
+        print(f"{'metric':<{width}}  {'old':>12}  {'new':>12}  {'change':>8}")
+        for metric, old_value, new_value, change, better in rows:
+            marker = '' if change == 0 else ' better' if better else ' worse'
+            print(f'{metric:<{width}}  {old_value:>12}  {new_value:>12}  {change:>+7.1f}%{marker}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Synthetic CSV data for all five tables.
+
+Headers are copied from the "Sample Data - *.csv" files, including the Thai
+salary headers and the blank column in the revenue export, and values follow
+the same formats (``4 Dec 2024`` dates, ``"15,000.00"`` salaries, ``Regis -
+May`` month columns). Rows are streamed to disk, so any scale fits in
+memory, and a fixed seed makes every run produce the same files.
+"""
+import csv
+import os
+import random
+from datetime import date, timedelta
+
+TABLE_HEADERS = {
+    'domain_cost': ['Domain', 'kw', 'type', 'team', 'owner', 'end_date', 'plan', 'Cost', 'Month'],
+    'hosting_cost': ['id', 'month_registration', 'month_expire', 'domain', 'team',
+                     'sum_hosting_cost_by_domain'],
+    'performance': ['Domain', 'team', 'owner', 'plan', 'end_date', 'CASHGAME', 'CHALONG', 'PLAYGAME',
+                    'Total Register', 'Total Topup', 'Regis - May', 'Topup - May', 'Regis - June',
+                    'Topup - June', 'Regis - July', 'Topup - July', 'CVR', 'First Seen - CG',
+                    'First Seen - CL', 'First Seen - PG', 'Date Gap', 'unique visits'],
+    'revenue': ['code', 'month', 'Owner', 'team', 'web', 'win_loss', '', 'Rename', 'Reteam'],
+    'salary': ['ชื่อเล่น', 'เงินเดือน', 'เบิกทีม'],
+}
+
+TEAMS = ['Internal', 'Mulan', 'Mesa', 'SA', 'Aum', 'Sa']
+OWNERS = ['Ming', 'Tuk', 'Thee', 'Fern', 'Pim', 'Pee_int', 'Aum_int', 'Chin', 'Lee']
+PLANS = ['A', 'B', 'C', 'IN']
+DOMAIN_TYPES = ['แบรนด์คู่แข่ง', 'แบรนด์หลัก', 'ทั่วไป']
+WEBS = ['CG168', 'CL168', 'PG168']
+TLDS = ['com', 'net', 'org', 'bet', 'co', 'info']
+SYLLABLES = ['ka', 'mo', 'ri', 'play', 'game', 'lotto', 'spin', 'win', 'nova', 'ton', 'chai',
+             'sun', 'bet', 'pro', 'home', 'star', 'lucky', 'max']
+
+# Generated dates fall in the five years up to this day
+LAST_DAY = date(2025, 7, 31)
+DAY_SPAN = 5 * 365
+
+def random_domain(rng, row):
+    # The row number keeps domains unique at any scale
+    name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3)))
+    return f'{name}{row}.{rng.choice(TLDS)}'
+
+def random_day(rng):
+    return LAST_DAY - timedelta(days=rng.randrange(DAY_SPAN))
+
+def month_label(day):
+    return day.strftime('%b %Y')
+
+def domain_cost_row(rng, row):
+    end_date = random_day(rng)
+    return [random_domain(rng, row), f'{rng.choice(SYLLABLES)}{rng.randint(1, 99)}', rng.choice(DOMAIN_TYPES),
+            rng.choice(TEAMS), rng.choice(OWNERS), f'{end_date.day} {end_date:%b %Y}', rng.choice(PLANS),
+            f'{rng.uniform(10, 1000):.2f}', month_label(end_date)]
+
+def hosting_cost_row(rng, row):
+    registered = random_day(rng)
+    return [row, month_label(registered), f'{registered:%b} {registered.year + 1}', random_domain(rng, row),
+            rng.choice(TEAMS + ['']), rng.choice(['0', f'{rng.uniform(10, 200):.2f}'])]
+
+def performance_row(rng, row):
+    end_date = random_day(rng)
+    code = f'int{rng.randint(1000, 9999)}'
+    months = [rng.randint(0, 50) for _ in range(6)]
+    regis, topup = sum(months[0::2]), sum(months[1::2])
+    cvr = f'{topup / regis * 100:.2f}%' if regis else rng.choice(['', '0.00%'])
+    first_seen = [f'{random_day(rng):%d/%m/%Y}' if rng.random() < 0.2 else '' for _ in range(3)]
+    return ([random_domain(rng, row), rng.choice(TEAMS), rng.choice(OWNERS), rng.choice(PLANS),
+             f'{end_date:%d/%m/%Y}', code, code, code, regis, topup] + months
+            + [cvr] + first_seen + [rng.choice(['', str(rng.randint(0, 90))]), rng.randint(0, 5000)])
+
+def revenue_row(rng, row):
+    owner, team = rng.choice(OWNERS), rng.choice(TEAMS)
+    return [f'{owner.lower()[:4]}{row:06d}', month_label(random_day(rng)), owner, team, rng.choice(WEBS),
+            f'{rng.uniform(-2000, 5000):.2f}', '', owner, team]
+
+def salary_row(rng, row):
+    return [f'{rng.choice(OWNERS)} {row}', f'{rng.randrange(12000, 60000, 500):,.2f}', rng.choice(TEAMS)]
+
+ROW_GENERATORS = {
+    'domain_cost': domain_cost_row,
+    'hosting_cost': hosting_cost_row,
+    'performance': performance_row,
+    'revenue': revenue_row,
+    'salary': salary_row,
+}
+
+def write_table_csv(table_name, rows, path, seed=0):
+    """Write rows synthetic rows for table_name to path and return the path"""
+    rng = random.Random(f'{seed}:{table_name}')
+    make_row = ROW_GENERATORS[table_name]
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(TABLE_HEADERS[table_name])
+        writer.writerows(make_row(rng, row) for row in range(1, rows + 1))
+    return path
+
+def generate_dataset(directory, rows, tables=None, seed=0):
+    """Write one CSV per table into directory; returns {table: path}"""
+    os.makedirs(directory, exist_ok=True)
+    return {table: write_table_csv(table, rows, os.path.join(directory, f'{table}.csv'), seed)
+            for table in (tables or TABLE_HEADERS)}
@@ -0,0 +1,215 @@
+"""Drive the app through the Flask test client and collect a JSON report.
+
+The app reads DATABASE_PATH and IMPORT_SPOOL_DIR when it is imported, so
+run_benchmark points both at a scratch directory before importing it.
+"""
+import contextlib
+import importlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from bench.generate import TABLE_HEADERS, generate_dataset
+
+REPORT_VERSION = 1
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far, in KiB"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def latency_summary(samples):
+    """p50/p99/mean/max in milliseconds for a list of durations in seconds"""
+    ordered = sorted(samples)
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))] * 1000
+    return {
+        'requests': len(ordered),
+        'p50_ms': round(percentile(50), 3),
+        'p99_ms': round(percentile(99), 3),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+def time_requests(client, urls, clear_cache=None):
+    """Request every URL in turn; returns per-request durations in seconds"""
+    samples = []
+    for url in urls:
+        if clear_cache:
+            clear_cache()
+        started = time.perf_counter()
+        response = client.get(url)
+        samples.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f'GET {url} returned {response.status_code}')
+        response.close()
+    return samples
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+                              ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(rows, workdir=None, tables=None, seed=0, requests=200, batch_size=None, data_dir=None):
+    """Generate data, import it and time the read paths; returns the report dict.
+
+    workdir holds the scratch database and spooled uploads (a temporary
+    directory by default). data_dir reuses CSVs from an earlier
+    ``bench generate`` run instead of writing new ones.
+    """
+    tables = list(tables or TABLE_HEADERS)
+    workdir = workdir or tempfile.mkdtemp(prefix='bench-')
+    os.makedirs(workdir, exist_ok=True)
+    database = os.path.join(workdir, 'bench.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(database + suffix):
+            os.remove(database + suffix)
+    os.environ['DATABASE_PATH'] = database
+    os.environ['IMPORT_SPOOL_DIR'] = os.path.join(workdir, 'spool')
+
+    report = {
+        'version': REPORT_VERSION,
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'rows_per_table': rows,
+            'tables': tables,
+            'seed': seed,
+            'requests': requests,
+            'batch_size': batch_size,
+        },
+        'generate': {},
+        'import': {},
+        'latency': {},
+        'peak_rss_kb': {},
+    }
+
+    started = time.perf_counter()
+    if data_dir:
+        paths = {table: os.path.join(data_dir, f'{table}.csv') for table in tables}
+    else:
+        paths = generate_dataset(os.path.join(workdir, 'data'), rows, tables, seed)
+    report['generate'] = {'seconds': round(time.perf_counter() - started, 3),
+                          'bytes': {table: os.path.getsize(path) for table, path in paths.items()}}
+
+    started = time.perf_counter()
+    # The report may go to stdout, so anything the app prints while starting goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        app_module = importlib.import_module('app')
+    report['meta']['startup_seconds'] = round(time.perf_counter() - started, 3)
+    report['peak_rss_kb']['startup'] = peak_rss_kb()
+    client = app_module.app.test_client()
+
+    for table in tables:
+        query = f'?format=json&batch_size={batch_size}' if batch_size else '?format=json'
+        started = time.perf_counter()
+        with open(paths[table], 'rb') as file:
+            response = client.post(f'/import_csv/{table}{query}', data={'file': (file, f'{table}.csv')})
+        elapsed = time.perf_counter() - started
+        summary = response.get_json()
+        if response.status_code != 200:
+            raise RuntimeError(f'Import of {table} failed: {summary}')
+        report['import'][table] = {
+            'rows_read': summary['rows_read'],
+            'rows_inserted': summary['rows_inserted'],
+            'rows_rejected': summary['rows_rejected'],
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(summary['rows_inserted'] / elapsed) if elapsed else None,
+        }
+    report['peak_rss_kb']['import'] = peak_rss_kb()
+
+    # Page cursors are drawn from each table's id range, so uncached samples
+    # hit keyset pages all through the table rather than just the newest rows
+    rng = random.Random(seed)
+    conn = sqlite3.connect(database)
+    try:
+        max_ids = {table: conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 1 for table in tables}
+    finally:
+        conn.close()
+    clear_cache = app_module.response_cache.clear
+    endpoints = {'index': lambda: '/', 'api_stats': lambda: '/api/stats'}
+    if 'revenue' in tables:
+        endpoints['analytics_revenue'] = lambda: '/api/analytics/revenue?group_by=team'
+    if 'performance' in tables:
+        endpoints['analytics_performance'] = lambda: '/api/analytics/performance?group_by=domain&sort=total_topup'
+    for table in tables:
+        endpoints[f'list_{table}'] = lambda table=table: f'/{table}?before={rng.randint(2, max_ids[table] + 1)}'
+        endpoints[f'api_{table}'] = lambda table=table: f'/api/{table}?before={rng.randint(2, max_ids[table] + 1)}'
+
+    for name, make_url in endpoints.items():
+        urls = [make_url() for _ in range(requests)]
+        report['latency'][name] = {
+            'uncached': latency_summary(time_requests(client, urls, clear_cache)),
+            'cached': latency_summary(time_requests(client, [urls[0]] * requests)),
+        }
+    report['peak_rss_kb']['latency'] = peak_rss_kb()
+
+    report['database_bytes'] = sum(os.path.getsize(database + suffix) for suffix in ('', '-wal')
+                                   if os.path.exists(database + suffix))
+    return report
+
+# Metrics compared between reports, as (section path, higher is better)
+COMPARED_METRICS = [
+    (('import', '*', 'rows_per_second'), True),
+    (('latency', '*', 'uncached', 'p50_ms'), False),
+    (('latency', '*', 'uncached', 'p99_ms'), False),
+    (('latency', '*', 'cached', 'p50_ms'), False),
+    (('peak_rss_kb', '*'), False),
+    (('database_bytes',), False),
+]
+
+def iter_metrics(report, path, prefix=()):
+    if not path:
+        yield '.'.join(prefix), report
+        return
+    head, rest = path[0], path[1:]
+    if not isinstance(report, dict):
+        return
+    keys = sorted(report) if head == '*' else [head]
+    for key in keys:
+        if key in report:
+            yield from iter_metrics(report[key], rest, prefix + (key,))
+
+def compare_reports(old, new):
+    """Rows of (metric, old, new, change %, better) for metrics in both reports"""
+    rows = []
+    for path, higher_is_better in COMPARED_METRICS:
+        new_values = dict(iter_metrics(new, path))
+        for metric, old_value in iter_metrics(old, path):
+            new_value = new_values.get(metric)
+            if not old_value or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            rows.append((metric, old_value, new_value, round(change, 1),
+                         change > 0 if higher_is_better else change < 0))
+    return rows
+
+def load_report(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+def write_report(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write('\n')
@@ -13,5 +13,6 @@ echo "🌐 Your app will be available at: http://localhost:8000"
 echo "🛑 Press Ctrl+C to stop the server"
 echo ""
 
-# Start with gunicorn (same as Render)
-PORT=8000 gunicorn --bind 0.0.0.0:8000 --timeout 120 app:app
\ No newline at end of file
+# Migrate the schema, then start with gunicorn (same as Render)
+flask --app app db upgrade
+AUTO_MIGRATE=0 PORT=8000 gunicorn --bind 0.0.0.0:8000 --timeout 120 app:app
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# app reads its paths when imported, so they point at a scratch directory first
+SCRATCH_DIR = tempfile.mkdtemp(prefix='database_explorer_tests_')
+os.environ['DATABASE_PATH'] = os.path.join(SCRATCH_DIR, 'test.db')
+os.environ['ARCHIVE_DIR'] = os.path.join(SCRATCH_DIR, 'archive')
+os.environ['IMPORT_SPOOL_DIR'] = os.path.join(SCRATCH_DIR, 'imports')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+# Tables emptied between tests, children first
+DATA_TABLES = ['performance_monthly'] + list(app_module.TABLE_COLUMNS) + [
+    'pnl_domain_month', 'pnl_team_month', 'pnl_dirty_domains', 'pnl_dirty_teams', 'archive_partitions',
+    'archive_partition_sums']
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Start every test from empty tables, no archives and cold caches"""
+    def clear(conn):
+        for table in DATA_TABLES:
+            conn.execute(f'DELETE FROM {table}')
+
+    app_module.write_queue.run(clear)
+    shutil.rmtree(app_module.ARCHIVE_DIR, ignore_errors=True)
+    for store in app_module.analytics_stores.values():
+        with store.lock:
+            store.reset()
+    app_module.response_cache.clear()
+    yield
+
+
+@pytest.fixture
+def app():
+    return app_module
+
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+
+def insert_rows(table_name, rows):
+    """Insert SOURCE_COLUMNS tuples through the write queue; returns their ids"""
+    def insert(conn):
+        return [conn.execute(app_module.INSERT_STATEMENTS[table_name],
+                             app_module.with_date_keys(table_name, row)).lastrowid for row in rows]
+
+    return app_module.write_queue.run(insert)
+
+
+def query(sql, params=()):
+    conn = app_module.get_db_connection()
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+
+from conftest import insert_rows
+
+TEAMS = ['Alpha', 'Beta', 'Gamma', None]
+MONTHS = ['Jan 2025', 'Feb 2025', 'Mar 2025', 'Apr 2025', '']
+
+
+def revenue_rows(count, seed):
+    rng = random.Random(seed)
+    # Whole numbers keep the float sums exact in any order
+    return [(f'code{rng.randrange(50)}', rng.choice(MONTHS), f'owner{rng.randrange(6)}', rng.choice(TEAMS),
+             f'web{rng.randrange(4)}', float(rng.randrange(-500, 1000)), '', '') for _ in range(count)]
+
+
+def performance_rows(count, seed):
+    rng = random.Random(seed)
+    return [(f'domain{rng.randrange(30)}.com', rng.choice(TEAMS), f'owner{rng.randrange(6)}', rng.choice('ABC'),
+             '15 May 2025', 'cg', 'cl', 'pg', rng.randrange(100), rng.randrange(50), '1%', '', '', '', '',
+             rng.randrange(1000)) for _ in range(count)]
+
+
+QUERIES = {
+    'revenue': [
+        ('team', {}, None, 'win_loss'),
+        ('owner', {}, None, 'rows'),
+        ('web', {'team': ['Alpha', 'Beta']}, None, 'win_loss'),
+        ('month_key', {'owner': ['owner1']}, None, 'rows'),
+        ('team', {}, (202502, 202503), 'win_loss'),
+    ],
+    'performance': [
+        ('team', {}, None, 'total_register'),
+        ('domain', {'plan': ['A']}, None, 'unique_visits'),
+        ('owner', {'team': ['Gamma']}, None, 'rows'),
+    ],
+}
+
+
+@pytest.fixture(params=['array', 'numpy'])
+def engine(request, app, monkeypatch):
+    if request.param == 'array':
+        monkeypatch.setattr(app, 'numpy', None)
+    elif app.numpy is None:
+        pytest.skip('numpy is not installed')
+    return request.param
+
+
+def assert_matches_sql(app, table_name):
+    conn = app.get_db_connection()
+    try:
+        for group_by, filters, months, sort in QUERIES[table_name]:
+            columnar, _ = app.analytics_columnar(conn, app.analytics_stores[table_name], group_by, filters,
+                                                 months, sort, 100)
+            expected = app.analytics_sql(conn, table_name, group_by, filters, months, sort, 100)
+            assert columnar == expected, (group_by, filters, months, sort)
+    finally:
+        conn.close()
+
+
+def refresh(app, table_name):
+    conn = app.get_db_connection()
+    try:
+        with app.analytics_stores[table_name].lock:
+            return app.analytics_stores[table_name].refresh(conn, app.ANALYTICS_MAX_BYTES)
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize('table_name, make_rows', [('revenue', revenue_rows), ('performance', performance_rows)])
+def test_columnar_results_match_sql_after_append(app, engine, table_name, make_rows):
+    insert_rows(table_name, make_rows(300, seed=1))
+    assert refresh(app, table_name) == 'reload'
+    assert_matches_sql(app, table_name)
+
+    insert_rows(table_name, make_rows(200, seed=2))
+    assert refresh(app, table_name) == 'append'
+    assert_matches_sql(app, table_name)
+    assert refresh(app, table_name) == 'current'
+
+
+@pytest.mark.parametrize('table_name, make_rows, column, value', [
+    ('revenue', revenue_rows, 'win_loss', 12345.0),
+    ('performance', performance_rows, 'total_register', 999),
+])
+def test_columnar_results_match_sql_after_rewrite(app, engine, table_name, make_rows, column, value):
+    ids = insert_rows(table_name, make_rows(300, seed=3))
+    assert refresh(app, table_name) == 'reload'
+
+    def rewrite(conn):
+        conn.execute(f'UPDATE {table_name} SET {column} = ?, team = ? WHERE id IN (?, ?, ?)',
+                     (value, 'Delta', ids[0], ids[10], ids[20]))
+        conn.execute(f'DELETE FROM {table_name} WHERE id IN (?, ?)', (ids[5], ids[50]))
+
+    app.write_queue.run(rewrite)
+    assert refresh(app, table_name) == 'reload'
+    assert_matches_sql(app, table_name)
+
+    insert_rows(table_name, make_rows(50, seed=4))
+    assert refresh(app, table_name) == 'append'
+    assert_matches_sql(app, table_name)
+
+
+def test_api_serves_store_results(app, client):
+    insert_rows('revenue', revenue_rows(100, seed=5))
+    response = client.get('/api/analytics/revenue?group_by=owner&sort=rows&limit=3')
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload['engine'] != 'sql'
+    conn = app.get_db_connection()
+    try:
+        assert payload['data'] == app.analytics_sql(conn, 'revenue', 'owner', {}, None, 'rows', 3)
+    finally:
+        conn.close()
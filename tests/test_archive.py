@@ -0,0 +1,207 @@
+import os
+import random
+
+import pytest
+
+from conftest import insert_rows, query
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+TEAMS = ['Alpha', 'Beta', 'Gamma']
+
+
+def seed(app, first_year, last_year, domains=12):
+    """Rows spread over every month of first_year..last_year, P&L linked through performance codes"""
+    rng = random.Random(first_year)
+    months = [(year, month) for year in range(first_year, last_year + 1) for month in range(1, 13)]
+
+    def label(year, month):
+        return f'{MONTH_NAMES[month - 1]} {year}'
+
+    domain_cost, hosting_cost, performance, revenue = [], [], [], []
+    for number in range(domains):
+        domain, team = f'site{number}.com', rng.choice(TEAMS)
+        for year, month in rng.sample(months, 6):
+            domain_cost.append((domain, 'kw', 'x', team, 'o', f'1 {label(year, month)}', 'A',
+                                float(rng.randrange(1, 100)), label(year, month)))
+            hosting_cost.append((label(year, month), label(year + 1, month), domain, team,
+                                 float(rng.randrange(1, 50))))
+        year, month = rng.choice(months)
+        performance.append((domain, team, 'o', 'A', f'15 {label(year, month)}', f'cg{number}', f'cl{number}',
+                            f'pg{number}', 1, 2, '1%', '', '', '', '', 3))
+        for year, month in rng.sample(months, 6):
+            revenue.append((rng.choice([f'cg{number}', f'cl{number}']), label(year, month), 'o', team, 'w',
+                            float(rng.randrange(-500, 900)), 'o', team))
+    insert_rows('domain_cost', domain_cost)
+    insert_rows('hosting_cost', hosting_cost)
+    insert_rows('revenue', revenue)
+    ids = insert_rows('performance', performance)
+
+    def add_months(conn):
+        for performance_id in ids:
+            for year, month in rng.sample(months, 4):
+                conn.execute('INSERT OR REPLACE INTO performance_monthly VALUES (?, ?, ?, ?)',
+                             (performance_id, year * 100 + month, rng.randrange(10), rng.randrange(10)))
+
+    app.write_queue.run(add_months)
+
+
+def rollups(client):
+    return {level: client.get(f'/api/rollup/{level}?limit=10000').get_json()['data']
+            for level in ('domains', 'teams')}
+
+
+def stats(client):
+    """Row counts and sums over hot and archived rows, added up"""
+    return {table: (values['row_count'] + values['archived']['row_count'],
+                    {column: total + values['archived']['sums'].get(column, 0)
+                     for column, total in values['sums'].items()})
+            for table, values in client.get('/api/stats?detail=1').get_json().items()}
+
+
+def contents(app):
+    tables = {table: query(f'SELECT * FROM {table} ORDER BY id') for table in app.ARCHIVE_TABLES}
+    tables['performance_monthly'] = query('SELECT * FROM performance_monthly ORDER BY domain_id, month_key')
+    return tables
+
+
+def listing(client, table_name, query_string):
+    response = client.get(f'/api/{table_name}?limit=10000&{query_string}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['data']
+
+
+def test_archive_and_restore_round_trip(app, client):
+    seed(app, 2021, 2025)
+    before = {'rollups': rollups(client), 'stats': stats(client), 'contents': contents(app),
+              'listings': {table: listing(client, table, 'month_from=2021-01') for table in
+                           ('domain_cost', 'hosting_cost', 'revenue')}}
+
+    summary = client.post('/api/archive', data={'before': 'Jan 2024'}).get_json()
+    assert summary['periods'] == [2021, 2022, 2023]
+    assert all(os.path.exists(app.archive_path(period)) for period in summary['periods'])
+    assert query('SELECT COUNT(*) AS n FROM domain_cost WHERE month_key < 202401') == [{'n': 0}]
+
+    # Archived months leave totals, rollups and ranged listings as they were
+    assert rollups(client) == before['rollups']
+    assert stats(client) == before['stats']
+    for table, rows in before['listings'].items():
+        assert listing(client, table, 'month_from=2021-01') == rows
+        # Unfiltered reads only touch the hot database
+        assert listing(client, table, '') == [row for row in rows if row['id'] in
+                                              {hot['id'] for hot in query(f'SELECT id FROM {table}')}]
+    client.post('/api/rollup/rebuild')
+    assert rollups(client) == before['rollups']
+
+    restored = client.post('/api/archive/restore').get_json()
+    assert restored['periods'] == [2021, 2022, 2023]
+    assert sum(restored['tables'].values()) == sum(summary['tables'].values())
+    assert contents(app) == before['contents']
+    assert client.get('/api/archive').get_json()['partitions'] == []
+    assert not any(os.path.exists(app.archive_path(period)) for period in summary['periods'])
+
+    assert rollups(client) == before['rollups']
+    assert stats(client) == before['stats']
+    client.post('/api/rollup/rebuild')
+    assert rollups(client) == before['rollups']
+
+
+def test_stats_count_hot_and_archived_rows_apart(app, client):
+    seed(app, 2021, 2025)
+    client.post('/api/archive', data={'before': 'Jan 2024'})
+
+    counts, detail = client.get('/api/stats').get_json(), client.get('/api/stats?detail=1').get_json()
+    for table in app.ARCHIVE_TABLES:
+        # Counts match what an unfiltered listing returns
+        assert counts[table] == len(listing(client, table, '')) > 0
+        (column,) = app.STATS_SUM_COLUMNS[table][:1]
+        assert detail[table]['sums'][column] == query(f'SELECT TOTAL({column}) AS total FROM {table}')[0]['total']
+        archived = detail[table]['archived']
+        assert archived['row_count'] == sum(row['row_count'] for row in
+                                            client.get('/api/archive').get_json()['partitions']
+                                            if row['table_name'] == table) > 0
+    assert detail['salary']['archived'] == {'row_count': 0, 'sums': {}}
+
+
+def test_column_store_budget_counts_hot_rows_only(app, client):
+    seed(app, 2015, 2025)
+    client.post('/api/archive', data={'before': 'Jan 2025'})
+    store = app.analytics_stores['revenue']
+    hot = query('SELECT COUNT(*) AS n FROM revenue')[0]['n']
+    archived = client.get('/api/stats?detail=1').get_json()['revenue']['archived']['row_count']
+    assert archived > 2 * hot
+
+    conn = app.get_db_connection()
+    try:
+        with store.lock:
+            # Room for every hot row, though not for the archived ones too
+            assert store.refresh(conn, (hot + archived) * store.row_bytes - 1) == 'reload'
+    finally:
+        conn.close()
+    assert len(store) == hot
+
+
+def test_restore_of_one_year_keeps_the_others_archived(app, client):
+    seed(app, 2021, 2024)
+    before = rollups(client), contents(app)
+    client.post('/api/archive', data={'before': 'Jan 2024'})
+
+    assert client.post('/api/archive/restore?year=2022').get_json()['periods'] == [2022]
+    assert {row['period'] for row in client.get('/api/archive').get_json()['partitions']} == {2021, 2023}
+    assert rollups(client) == before[0]
+
+    client.post('/api/archive/restore')
+    assert contents(app) == before[1]
+
+
+def test_rollups_cover_more_archived_years_than_sqlite_can_attach(app, client):
+    seed(app, 2010, 2025, domains=8)
+    before = rollups(client)
+    summary = client.post('/api/archive', data={'before': 'Jan 2025'}).get_json()
+    assert len(summary['periods']) > 10
+
+    client.post('/api/rollup/rebuild')
+    assert rollups(client) == before
+
+    response = client.get('/api/domain_cost?month_from=2010-01')
+    assert response.status_code == 400
+    assert client.get('/export/domain_cost?month_to=2024-12').status_code == 400
+    assert listing(client, 'domain_cost', 'month_from=2020-01&month_to=2024-12')
+
+    # Pooled connections give their archives back
+    conn = app.get_db_connection()
+    try:
+        assert app.attached_schemas(conn) == {'main'}
+    finally:
+        conn.close()
+
+
+def test_archive_clears_a_file_left_by_an_interrupted_restore(app, client, monkeypatch):
+    seed(app, 2022, 2024)
+    client.post('/api/archive', data={'before': 'Jan 2023'})
+    # The restore commits, but its archive file stays behind
+    with monkeypatch.context() as patch:
+        patch.setattr(app.os, 'remove', lambda path: None)
+        client.post('/api/archive/restore')
+    assert os.path.exists(app.archive_path(2022))
+
+    # Rows changed or deleted since must not come back from the stale copy
+    app.write_queue.run(lambda conn: conn.execute('UPDATE domain_cost SET cost = -1 WHERE month_key < 202207'))
+    app.write_queue.run(lambda conn: conn.execute('DELETE FROM revenue WHERE month_key < 202207'))
+    expected = contents(app), rollups(client)
+    client.post('/api/archive', data={'before': 'Jan 2023'})
+    assert listing(client, 'revenue', 'month_to=2022-06') == []
+    assert rollups(client) == expected[1]
+    client.post('/api/archive/restore')
+    assert contents(app) == expected[0]
+
+
+@pytest.mark.parametrize('table_name', ['revenue', 'performance'])
+def test_column_store_sees_restored_rows(app, client, table_name):
+    seed(app, 2022, 2024)
+    client.get(f'/api/analytics/{table_name}')
+    client.post('/api/archive', data={'before': 'Jan 2024'})
+    client.get(f'/api/analytics/{table_name}')
+    client.post('/api/archive/restore')
+
+    payload = client.get(f'/api/analytics/{table_name}?group_by=owner&limit=50').get_json()
+    assert sum(row['rows'] for row in payload['data']) == query(f'SELECT COUNT(*) AS n FROM {table_name}')[0]['n']
@@ -0,0 +1,98 @@
+import io
+
+import pytest
+
+from conftest import insert_rows, query
+
+
+def domain_cost_rows(count):
+    return [(f'site{number}.com', 'kw', 'x', 'Alpha' if number % 2 else 'Beta', 'o', '1 Jan 2025', 'A',
+             float(number % 3), 'Jan 2025') for number in range(count)]
+
+
+def bulk(client, table_name, payload, status=200):
+    response = client.post(f'/api/{table_name}/bulk', json=payload)
+    assert response.status_code == status, response.get_json()
+    return response.get_json()
+
+
+def test_dry_run_reports_counts_and_rolls_back(client):
+    ids = insert_rows('domain_cost', domain_cost_rows(9))
+    before = query('SELECT * FROM domain_cost ORDER BY id')
+
+    result = bulk(client, 'domain_cost', {'action': 'update', 'ids': ids, 'set': {'cost': 2}, 'dry_run': True})
+    # Rows that already hold the value match but are not affected
+    assert (result['matched'], result['affected']) == (9, 6)
+    assert result['sample_ids'] == [id_ for id_, row in zip(ids, domain_cost_rows(9)) if row[7] != 2]
+    assert bulk(client, 'domain_cost', {'action': 'delete', 'ids': ids[:4], 'dry_run': True})['affected'] == 4
+    assert query('SELECT * FROM domain_cost ORDER BY id') == before
+
+    result = bulk(client, 'domain_cost', {'action': 'update', 'ids': ids, 'set': {'cost': 2}})
+    assert (result['matched'], result['affected'], result['dry_run']) == (9, 6, False)
+    assert {row['cost'] for row in query('SELECT cost FROM domain_cost')} == {2.0}
+
+
+def test_id_list_longer_than_the_sqlite_variable_limit(client):
+    ids = insert_rows('domain_cost', domain_cost_rows(20))
+    # Beyond SQLITE_MAX_VARIABLE_NUMBER (32766 since SQLite 3.32, 999 before)
+    many = ids[:10] + list(range(10 ** 6, 10 ** 6 + 40000))
+
+    assert bulk(client, 'domain_cost', {'action': 'update', 'ids': many, 'set': {'team': 'Gamma'}})['affected'] == 10
+    assert bulk(client, 'domain_cost', {'action': 'delete', 'ids': many})['affected'] == 10
+    assert [row['id'] for row in query('SELECT id FROM domain_cost ORDER BY id')] == ids[10:]
+
+
+def test_filter_selects_rows_like_the_listing(client):
+    insert_rows('domain_cost', domain_cost_rows(10))
+    insert_rows('domain_cost', [('late.com', 'kw', 'x', 'Alpha', 'o', '1 Mar 2025', 'A', 5.0, 'Mar 2025')])
+
+    result = bulk(client, 'domain_cost', {'action': 'update', 'filter': {'team': 'Alpha', 'month_to': '2025-01'},
+                                          'set': {'plan': 'B'}})
+    assert result['affected'] == 5
+    assert query("SELECT domain FROM domain_cost WHERE plan = 'B' ORDER BY id") == [
+        {'domain': f'site{number}.com'} for number in range(1, 10, 2)]
+
+    assert bulk(client, 'domain_cost', {'action': 'delete', 'filter': {'team': ['Beta']}})['affected'] == 5
+    assert query("SELECT COUNT(*) AS n FROM domain_cost")[0]['n'] == 6
+
+
+@pytest.mark.parametrize('payload, message', [
+    ({'action': 'delete', 'filter': {}}, "'filter' must be a non-empty object"),
+    ({'action': 'delete', 'filter': {'limit': 5}}, 'Unknown filter: limit'),
+    ({'action': 'delete', 'ids': [1], 'filter': {'team': 'Alpha'}}, "Give either 'ids' or 'filter'"),
+    ({'action': 'delete', 'ids': ['1']}, "'ids' must be a list of integers"),
+    ({'action': 'update', 'ids': [1], 'set': {'id': 5}}, 'Cannot update column: id'),
+    ({'action': 'update', 'ids': [1], 'set': {'cost': 'lots'}}, "Invalid value for cost: 'lots'"),
+    ({'action': 'truncate', 'ids': [1]}, "action must be 'delete' or 'update'"),
+])
+def test_invalid_requests_are_rejected(client, payload, message):
+    insert_rows('domain_cost', domain_cost_rows(1))
+    assert bulk(client, 'domain_cost', payload, status=400)['error'] == message
+    assert query('SELECT COUNT(*) AS n FROM domain_cost')[0]['n'] == 1
+
+
+def test_update_re_derives_date_keys(client):
+    (id_,) = insert_rows('domain_cost', domain_cost_rows(1))
+    bulk(client, 'domain_cost', {'action': 'update', 'ids': [id_],
+                                 'set': {'month': 'Mar 2024', 'end_date': '15 Apr 2024'}})
+    assert query('SELECT month, month_key, end_date, end_date_key FROM domain_cost') == [
+        {'month': 'Mar 2024', 'month_key': 202403, 'end_date': '15 Apr 2024', 'end_date_key': 20240415}]
+
+
+def test_natural_key_conflict_returns_409(client):
+    text = 'domain,kw,type,team,owner,end_date,plan,cost,month\na.com,kw,x,Alpha,o,,A,1,Jan 2025\n' \
+           'b.com,kw,x,Alpha,o,,A,2,Jan 2025\n'
+    client.post('/import_csv/domain_cost?format=json',
+                data={'file': (io.BytesIO(text.encode()), 'domain_cost.csv'), 'mode': 'upsert'})
+    (id_,) = [row['id'] for row in query("SELECT id FROM domain_cost WHERE domain = 'b.com'")]
+
+    result = bulk(client, 'domain_cost', {'action': 'update', 'ids': [id_], 'set': {'domain': 'a.com'}}, status=409)
+    assert 'UNIQUE' in result['error']
+    assert query("SELECT domain FROM domain_cost ORDER BY id") == [{'domain': 'a.com'}, {'domain': 'b.com'}]
+
+
+@pytest.mark.parametrize('table_name', ['sqlite_master', 'table_stats', 'performance_monthly', 'domain_cost; --'])
+def test_tables_outside_the_whitelist_are_rejected(client, table_name):
+    response = client.post(f'/api/{table_name}/bulk', json={'action': 'delete', 'ids': [1]})
+    assert response.status_code == 404
+    assert query("SELECT COUNT(*) AS n FROM table_stats")[0]['n'] > 0
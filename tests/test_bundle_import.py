@@ -0,0 +1,51 @@
+import pytest
+
+from conftest import query
+
+BUNDLE = {
+    'costs.csv': 'domain,kw,type,team,owner,end_date,plan,cost,month\n'
+                 + ''.join(f'site{number}.com,kw,x,Alpha,o,,A,{number},Jan 2025\n' for number in range(50)),
+    'revenue.csv': 'code,month,owner,team,web,win_loss,rename,reteam\n'
+                   + ''.join(f'cg{number},Feb 2025,o,Beta,w,{number * 10},,\n' for number in range(30)),
+    'salary.csv': 'nickname,salary,team\nNok,1000,Alpha\nPloy,,Beta\n',
+}
+
+
+@pytest.fixture
+def bundle(tmp_path):
+    for name, text in BUNDLE.items():
+        (tmp_path / name).write_text(text)
+    return str(tmp_path)
+
+
+def contents():
+    """Rows of the bundle's tables in insert order, without their ids"""
+    return {table_name: [{column: value for column, value in row.items() if column != 'id'}
+                         for row in query(f'SELECT * FROM {table_name} ORDER BY id')]
+            for table_name in ('domain_cost', 'revenue', 'salary')}
+
+
+def test_parallel_import_matches_a_single_process_one(app, bundle, monkeypatch):
+    start_methods = []
+
+    class RecordingPool(app.ProcessPoolExecutor):
+        def __init__(self, *args, mp_context, **kwargs):
+            start_methods.append(mp_context.get_start_method())
+            super().__init__(*args, mp_context=mp_context, **kwargs)
+
+    monkeypatch.setattr(app, 'ProcessPoolExecutor', RecordingPool)
+
+    def load(processes):
+        return app.write_queue.run(lambda conn: app.import_bundle(conn, bundle, batch_size=7, processes=processes),
+                                   exclusive=True, timeout=None)
+
+    single = load(1)
+    expected = contents()
+    app.write_queue.run(lambda conn: [conn.execute(f'DELETE FROM {table_name}') for table_name in expected])
+
+    parallel = load(3)
+    assert parallel['processes'] == 3
+    assert parallel['files'] == single['files']
+    assert contents() == expected
+    # Workers come from a fork server or a fresh interpreter, never a fork of this process
+    assert start_methods == ['forkserver'] or start_methods == ['spawn']
@@ -0,0 +1,150 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from conftest import insert_rows, query
+
+
+def export_text(client, table_name, query_string=''):
+    response = client.get(f'/export/{table_name}?{query_string}')
+    assert response.status_code == 200, response.get_json()
+    return response.get_data(as_text=True)
+
+
+def import_text(client, table_name, text, mode='append'):
+    response = client.post(f'/import_csv/{table_name}?format=json',
+                           data={'file': (io.BytesIO(text.encode()), f'{table_name}.csv'), 'mode': mode})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def stored_rows(table_name):
+    """Rows without their ids (and row_hash), monthly figures included for performance"""
+    rows = [{column: value for column, value in row.items() if column not in ('id', 'row_hash')}
+            for row in query(f'SELECT * FROM {table_name} ORDER BY id')]
+    if table_name == 'performance':
+        months = query('SELECT month_key, regis, topup FROM performance_monthly ORDER BY domain_id, month_key')
+        return rows, months
+    return rows
+
+
+def clear_table(app, table_name):
+    app.write_queue.run(lambda conn: conn.execute(f'DELETE FROM {table_name}'))
+
+
+BLANK_NUMBER_FORMS = {
+    'revenue': ({'code': 'cg1', 'month': 'May 2025', 'owner': 'o', 'team': 'Alpha', 'web': 'w',
+                 'win_loss': '', 'rename': '', 'reteam': ''}, 'win_loss'),
+    'salary': ({'nickname': 'Nok', 'salary': '', 'team': 'Alpha'}, 'salary'),
+    'performance': ({'domain': 'a.com', 'team': 'Alpha', 'owner': 'o', 'plan': 'A', 'end_date': '20/06/2025',
+                     'cashgame': 'c1', 'chalong': 'l1', 'playgame': 'p1', 'total_register': '',
+                     'total_topup': '4', 'cvr': '', 'first_seen_cg': '', 'first_seen_cl': '', 'first_seen_pg': '',
+                     'date_gap': '', 'unique_visits': '', 'regis_may': '5', 'topup_may': ''}, 'total_register'),
+}
+
+
+@pytest.mark.parametrize('table_name', sorted(BLANK_NUMBER_FORMS))
+@pytest.mark.parametrize('mode', ['append', 'upsert'])
+def test_blank_numbers_round_trip_through_export_and_import(app, client, table_name, mode):
+    form, blank_column = BLANK_NUMBER_FORMS[table_name]
+    client.post(f'/add/{table_name}', data=form)
+    before = stored_rows(table_name)
+    rows = before[0] if table_name == 'performance' else before
+    assert rows[0][blank_column] is None
+
+    text = export_text(client, table_name)
+    clear_table(app, table_name)
+    summary = import_text(client, table_name, text, mode)
+    assert summary['rows_inserted'] == 1 and summary['rows_rejected'] == 0
+    assert stored_rows(table_name) == before
+
+    if mode == 'upsert':
+        assert import_text(client, table_name, text, mode)['rows_unchanged'] == 1
+        assert stored_rows(table_name) == before
+
+
+SAMPLE_ROWS = {
+    'domain_cost': [('a.com', 'kw, with a comma', 'x', 'Alpha', 'o', '1 Jan 2026', 'A', 12.5, 'Jan 2025'),
+                    ('b.com', 'kw "quoted"', 'y', 'Beta', 'o', '', 'B', None, 'Feb 2025'),
+                    ('\u0e01.com', 'kw\nsecond line', 'x', 'Alpha', 'o', '1 Mar 2026', 'A', 3.0, 'Mar 2025')],
+    'hosting_cost': [('Jan 2025', 'Jan 2026', 'a.com', 'Alpha', 100.0),
+                     ('Feb 2025', 'Feb 2026', 'b.com', 'Beta', None)],
+    'revenue': [('cg1', 'Jan 2025', 'o', 'Alpha', 'w', 1500.0, '', ''),
+                ('cg2', 'Feb 2025', 'o', 'Beta', 'w', -20.5, 'r', 't')],
+    'salary': [('Nok', 1000.0, 'Alpha'), ('Ploy', None, 'Beta')],
+    'performance': [('a.com', 'Alpha', 'o', 'A', '20/06/2025', 'c', 'l', 'p', 1, 2, '1%', '', '', '', '', 3),
+                    ('b.com', 'Beta', 'o', 'B', '', 'c', 'l', 'p', None, 4, '', '', '', '', '', None),
+                    ('c.com', 'Beta', 'o', 'B', '01/01/2026', 'c', 'l', 'p', 5, 6, '2%', '', '', '', '', 7)],
+}
+
+# (row position, month_key, regis, topup); b.com has no monthly figures
+SAMPLE_MONTHS = [(0, 202411, 3, 4), (0, 202505, 7, 0), (2, 202505, 0, 9)]
+
+
+def seed(app, table_name):
+    ids = insert_rows(table_name, SAMPLE_ROWS[table_name])
+    if table_name == 'performance':
+        app.write_queue.run(lambda conn: conn.executemany(
+            app.PERFORMANCE_MONTHLY_UPSERT,
+            [(ids[position], month_key, regis, topup) for position, month_key, regis, topup in SAMPLE_MONTHS]))
+    return ids
+
+
+@pytest.mark.parametrize('table_name', sorted(SAMPLE_ROWS))
+def test_export_round_trips_through_import(app, client, monkeypatch, table_name):
+    # Small steps so the cursor and the chunk buffer both go round more than once
+    monkeypatch.setattr(app, 'EXPORT_FETCH_ROWS', 1)
+    monkeypatch.setattr(app, 'EXPORT_CHUNK_SIZE', 16)
+    seed(app, table_name)
+    before = stored_rows(table_name)
+
+    text = export_text(client, table_name)
+    clear_table(app, table_name)
+    summary = import_text(client, table_name, text)
+    assert summary['rows_inserted'] == len(SAMPLE_ROWS[table_name]) and summary['rows_rejected'] == 0
+    assert stored_rows(table_name) == before
+
+
+def test_performance_export_has_a_column_pair_per_month(app, client):
+    seed(app, 'performance')
+    header, *rows = csv.reader(io.StringIO(export_text(client, 'performance')))
+    assert header[-4:] == ['Regis - Nov 2024', 'Topup - Nov 2024', 'Regis - May 2025', 'Topup - May 2025']
+    assert [row[-4:] for row in rows] == [['3', '4', '7', '0'], ['', '', '', ''], ['', '', '0', '9']]
+
+
+def test_ndjson_export_carries_typed_rows(app, client):
+    ids = seed(app, 'domain_cost')
+    lines = export_text(client, 'domain_cost', 'format=ndjson').splitlines()
+    columns = ['id'] + app.SOURCE_COLUMNS['domain_cost']
+    assert [json.loads(line) for line in lines] == [dict(zip(columns, (id_,) + row))
+                                                    for id_, row in zip(ids, SAMPLE_ROWS['domain_cost'])]
+
+
+@pytest.mark.parametrize('export_format', ['csv', 'ndjson'])
+def test_gzip_export_decompresses_to_the_plain_export(app, client, export_format):
+    seed(app, 'domain_cost')
+    response = client.get(f'/export/domain_cost?format={export_format}&gzip=1')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode() == export_text(client, 'domain_cost', f'format={export_format}')
+
+
+def test_export_applies_the_listing_filters(app, client):
+    seed(app, 'domain_cost')
+    query_string = 'team=Alpha&month_from=2025-02'
+    listed = [row['id'] for row in client.get(f'/api/domain_cost?{query_string}').get_json()['data']]
+    _, *rows = csv.reader(io.StringIO(export_text(client, 'domain_cost', query_string)))
+    assert [int(row[0]) for row in rows] == sorted(listed) and len(listed) == 1
+
+
+@pytest.mark.parametrize('table_name, query_string, status, error', [
+    ('domain_cost', 'format=xml', 400, 'Unknown export format: xml'),
+    ('domain_cost', 'colour=red', 400, 'Unknown filter: colour'),
+    ('missing_table', '', 404, 'Unknown table: missing_table'),
+])
+def test_bad_export_requests_are_rejected(client, table_name, query_string, status, error):
+    response = client.get(f'/export/{table_name}?{query_string}')
+    assert response.status_code == status
+    assert response.get_json()['error'] == error
@@ -0,0 +1,92 @@
+import pytest
+
+from conftest import insert_rows
+
+MONTHS = ['Jan 2025', 'Feb 2025', 'Mar 2025', 'Apr 2025', 'May 2025']
+
+
+def domain_cost_rows(count):
+    return [(f'site{number}.com', 'kw', 'x', ['Alpha', 'Beta', 'Gamma'][number % 3], 'o', '1 Jan 2026', 'A',
+             float(number), MONTHS[number % 5]) for number in range(count)]
+
+
+def page(client, table_name, query_string, status=200):
+    response = client.get(f'/api/{table_name}?{query_string}')
+    assert response.status_code == status, response.get_json()
+    return response.get_json()
+
+
+def ids(payload):
+    return [row['id'] for row in payload['data']]
+
+
+def test_keyset_pages_walk_both_ways(client):
+    row_ids = insert_rows('domain_cost', domain_cost_rows(25))
+    newest_first = row_ids[::-1]
+
+    pages, cursor = [], None
+    while True:
+        payload = page(client, 'domain_cost', 'limit=10' + (f'&before={cursor}' if cursor else ''))
+        pages.append(payload)
+        cursor = payload['next_before']
+        if cursor is None:
+            break
+    assert [ids(payload) for payload in pages] == [newest_first[:10], newest_first[10:20], newest_first[20:]]
+    assert pages[0]['prev_after'] is None
+    assert [payload['prev_after'] for payload in pages[1:]] == [newest_first[10], newest_first[20]]
+
+    # Back towards newer rows from the last page; pages stay newest first
+    payload = page(client, 'domain_cost', f"limit=10&after={pages[2]['prev_after']}")
+    assert ids(payload) == newest_first[10:20]
+    assert payload['next_before'] == newest_first[19]
+    payload = page(client, 'domain_cost', f"limit=10&after={payload['prev_after']}")
+    assert ids(payload) == newest_first[:10]
+    assert payload['prev_after'] is None
+
+
+def test_limit_is_clamped(app, client):
+    insert_rows('domain_cost', domain_cost_rows(3))
+    assert page(client, 'domain_cost', 'limit=0')['limit'] == 1
+    assert page(client, 'domain_cost', f'limit={app.MAX_PAGE_SIZE + 1}')['limit'] == app.MAX_PAGE_SIZE
+
+
+@pytest.mark.parametrize('query_string, expected', [
+    ('team=Alpha', lambda row: row[3] == 'Alpha'),
+    ('team=Alpha&team=Gamma', lambda row: row[3] in ('Alpha', 'Gamma')),
+    ('cost_min=5&cost_max=12.5', lambda row: 5 <= row[7] <= 12.5),
+    ('month_from=2025-02&month_to=Apr 2025', lambda row: row[8] in MONTHS[1:4]),
+    ('month_from=2025-03&team=Beta', lambda row: row[8] in MONTHS[2:] and row[3] == 'Beta'),
+])
+def test_filters_select_matching_rows_across_pages(client, query_string, expected):
+    rows = domain_cost_rows(30)
+    row_ids = insert_rows('domain_cost', rows)
+    matching = [id_ for id_, row in zip(row_ids, rows) if expected(row)][::-1]
+
+    first = page(client, 'domain_cost', f'{query_string}&limit=4')
+    second = page(client, 'domain_cost', f"{query_string}&limit=100&before={first['next_before']}")
+    assert ids(first) + ids(second) == matching
+
+
+@pytest.mark.parametrize('query_string, error', [
+    ('colour=red', 'Unknown filter: colour'),
+    ('team_min=A', 'Range filters are only supported on numeric columns: team_min'),
+    ('cost_min=cheap', "Invalid value for cost_min: 'cheap'"),
+    ('fields=domain,colour', 'Unknown column: colour'),
+])
+def test_bad_arguments_are_rejected(client, query_string, error):
+    assert page(client, 'domain_cost', query_string, status=400)['error'] == error
+
+
+def test_fields_project_the_listing(client):
+    row_ids = insert_rows('domain_cost', domain_cost_rows(3))
+    payload = page(client, 'domain_cost', 'fields=domain, cost')
+    assert payload['data'] == [{'id': id_, 'domain': f'site{number}.com', 'cost': float(number)}
+                               for number, id_ in reversed(list(enumerate(row_ids)))]
+
+
+def test_performance_listing_carries_monthly_columns(app, client):
+    (id_,) = insert_rows('performance', [('a.com', 'Alpha', 'o', 'A', '20/06/2025', 'c', 'l', 'p', 1, 2, '1%',
+                                          '', '', '', '', 3)])
+    app.write_queue.run(lambda conn: conn.execute(app.PERFORMANCE_MONTHLY_UPSERT, (id_, 202505, 7, 8)))
+    payload = page(client, 'performance', 'fields=domain,regis_may,topup_may,regis_june')
+    assert payload['data'] == [{'id': id_, 'domain': 'a.com', 'regis_may': 7, 'topup_may': 8, 'regis_june': 0}]
@@ -0,0 +1,116 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / 'migrations.db')
+
+
+def run_app(database, code='', **env):
+    """Import app in a fresh interpreter against database, then run code; returns its stdout"""
+    environment = dict(os.environ, DATABASE_PATH=database,
+                       ARCHIVE_DIR=os.path.join(os.path.dirname(database), 'archive'),
+                       IMPORT_SPOOL_DIR=os.path.join(os.path.dirname(database), 'imports'), **env)
+    result = subprocess.run([sys.executable, '-c', 'import app\n' + code], cwd=REPO_DIR, env=environment,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def db_upgrade(database, *args):
+    return run_app(database, "from flask.cli import main\nimport sys\n"
+                             f"sys.argv = ['flask', '--app', 'app', 'db', 'upgrade', *{list(args)!r}]\nmain()",
+                   AUTO_MIGRATE='0')
+
+
+def execute(database, sql):
+    conn = sqlite3.connect(database)
+    try:
+        conn.executescript(sql)
+    finally:
+        conn.close()
+
+
+def dump(database):
+    """Schema objects and the rows of every table"""
+    conn = sqlite3.connect(database)
+    try:
+        objects = sorted(conn.execute("SELECT type, name, tbl_name, sql FROM sqlite_master "
+                                      "WHERE name NOT LIKE 'sqlite_%'"))
+        rows = {name: sorted(conn.execute(f'SELECT * FROM "{name}"'), key=repr)
+                for kind, name, _, sql in objects
+                if kind == 'table' and not (sql or '').startswith('CREATE VIRTUAL')}
+    finally:
+        conn.close()
+    return objects, rows
+
+
+def fetch_all(database, sql):
+    conn = sqlite3.connect(database)
+    try:
+        return conn.execute(sql).fetchall()
+    finally:
+        conn.close()
+
+
+def schema_versions(database):
+    return [version for (version,) in fetch_all(database, 'SELECT version FROM schema_version ORDER BY version')]
+
+
+def test_migrating_again_changes_nothing(app, database):
+    run_app(database)
+    first = dump(database)
+    assert schema_versions(database) == list(range(1, app.SCHEMA_VERSION + 1))
+
+    assert 'Applied migration' not in db_upgrade(database)
+    run_app(database)
+    assert dump(database) == first
+
+
+def test_database_from_before_schema_version_runs_the_baseline(database, tmp_path):
+    fresh = str(tmp_path / 'fresh.db')
+    run_app(fresh)
+
+    # What startups before schema_version left behind: the baseline schema, no version table
+    output = db_upgrade(database, '--to', '10')
+    assert 'Applied migration 10: sample_data' in output
+    execute(database, "DROP TABLE schema_version; "
+                      "INSERT INTO salary (nickname, salary, team) VALUES ('Nok', 1000, 'Alpha');")
+
+    output = db_upgrade(database)
+    assert 'Applied migration 1: base_tables' in output
+    assert schema_versions(database) == schema_versions(fresh)
+    assert dump(database)[0] == dump(fresh)[0]
+    # The baseline re-run keeps existing rows and does not seed the samples twice
+    assert fetch_all(database, "SELECT nickname FROM salary WHERE nickname = 'Nok'") == [('Nok',)]
+    count = 'SELECT COUNT(*) FROM domain_cost'
+    assert fetch_all(database, count) == fetch_all(fresh, count)
+
+
+def test_health_is_503_until_db_upgrade_runs_without_auto_migrate(database):
+    code = '''
+import subprocess, sys
+client = app.app.test_client()
+print(client.get('/health').status_code)
+subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade'], check=True,
+               stdout=subprocess.DEVNULL)
+print(client.get('/health').status_code)
+'''
+    assert run_app(database, code, AUTO_MIGRATE='0').split() == ['503', '200']
+
+
+def test_emptied_table_is_not_reseeded(database):
+    run_app(database)
+    execute(database, 'DELETE FROM domain_cost')
+    before = dump(database)
+
+    run_app(database)
+    db_upgrade(database)
+    assert dump(database) == before
@@ -0,0 +1,93 @@
+import sqlite3
+
+from conftest import insert_rows
+
+
+def cache_stats(client):
+    return client.get('/api/cache').get_json()
+
+
+def nicknames(client):
+    return [row['nickname'] for row in client.get('/api/salary').get_json()['data']]
+
+
+def test_write_from_another_connection_invalidates_cached_page(app, client):
+    insert_rows('salary', [('Nok', 1000.0, 'Alpha')])
+    assert nicknames(client) == ['Nok']
+    before = cache_stats(client)
+    assert nicknames(client) == ['Nok']
+    assert cache_stats(client)['hits'] == before['hits'] + 1
+
+    # Another process writing straight to the file, past this one's write queue
+    conn = sqlite3.connect(app.DATABASE)
+    try:
+        conn.execute(app.INSERT_STATEMENTS['salary'], ('Ploy', 2000.0, 'Beta'))
+        conn.commit()
+    finally:
+        conn.close()
+    assert nicknames(client) == ['Ploy', 'Nok']
+    assert cache_stats(client)['stale'] == before['stale'] + 1
+
+
+def test_pages_with_pending_flash_messages_bypass_the_cache(client):
+    assert b'Unknown table' not in client.get('/').data
+    before = cache_stats(client)
+
+    client.post('/add/missing_table', data={})
+    assert b'Unknown table: missing_table' in client.get('/').data
+    after = cache_stats(client)
+    assert (after['hits'], after['misses']) == (before['hits'], before['misses'])
+
+    # Once shown, the message is gone and the cached page is served again
+    assert b'Unknown table' not in client.get('/').data
+    assert cache_stats(client)['hits'] == after['hits'] + 1
+
+
+def test_matching_etag_is_answered_with_304(client):
+    response = client.get('/api/stats')
+    assert response.status_code == 200 and response.headers['ETag']
+    before = cache_stats(client)
+
+    revalidated = client.get('/api/stats', headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert cache_stats(client)['not_modified'] == before['not_modified'] + 1
+
+    insert_rows('salary', [('Nok', 1000.0, 'Alpha')])
+    changed = client.get('/api/stats', headers={'If-None-Match': response.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != response.headers['ETag']
+
+
+def entry(body):
+    return {'versions': (1,), 'body': body, 'content_type': 'text/plain', 'etag': 'x'}
+
+
+def test_least_recently_used_entries_are_evicted_by_count(app):
+    cache = app.ResponseCache(max_entries=2, max_bytes=1024)
+    cache.put('a', entry(b'a'))
+    cache.put('b', entry(b'b'))
+    assert cache.get('a', (1,))
+    cache.put('c', entry(b'c'))
+
+    assert cache.get('b', (1,)) is None
+    assert cache.get('a', (1,)) and cache.get('c', (1,))
+    assert cache.stats()['evictions'] == 1
+
+
+def test_least_recently_used_entries_are_evicted_by_bytes(app):
+    cache = app.ResponseCache(max_entries=10, max_bytes=10)
+    cache.put('a', entry(b'aaaa'))
+    cache.put('b', entry(b'bbbb'))
+    cache.put('c', entry(b'cccc'))
+    assert cache.get('a', (1,)) is None
+    assert cache.stats()['bytes'] == 8
+
+    # A body larger than the whole cache is not kept, and evicts nothing
+    cache.put('d', entry(b'd' * 11))
+    assert cache.get('d', (1,)) is None
+    assert cache.stats()['entries'] == 2
+
+    # Stale entries are dropped along with their bytes
+    assert cache.get('b', (2,)) is None
+    assert cache.stats()['bytes'] == 4
@@ -0,0 +1,25 @@
+from conftest import insert_rows
+
+
+def team_months(client, team):
+    rows = client.get(f'/api/rollup/teams?team={team}').get_json()['data']
+    return {row['month']: (row['revenue'], row['domain_cost'], row['salary'], row['profit']) for row in rows}
+
+
+def test_every_team_month_is_charged_the_current_payroll(client):
+    insert_rows('revenue', [('cg1', 'Jan 2025', 'o', 'Alpha', 'w', 1000.0, '', ''),
+                            ('cg2', 'Mar 2025', 'o', 'Alpha', 'w', 500.0, '', '')])
+    insert_rows('domain_cost', [('a.com', 'kw', 'x', 'Alpha', 'o', '', 'A', 100.0, 'Feb 2025')])
+    nok, _, _ = insert_rows('salary', [('Nok', 300.0, 'Alpha'), ('Ploy', 200.0, 'Alpha'), ('Som', 50.0, 'Beta')])
+
+    assert team_months(client, 'Alpha') == {'Jan 2025': (1000.0, 0.0, 500.0, 500.0),
+                                            'Feb 2025': (0.0, 100.0, 500.0, -600.0),
+                                            'Mar 2025': (500.0, 0.0, 500.0, 0.0)}
+    # Salary has no month of its own: a team with only payroll has no months
+    assert team_months(client, 'Beta') == {}
+
+    # A raise is charged to the months already past as well
+    client.post('/api/salary/bulk', json={'action': 'update', 'ids': [nok], 'set': {'salary': 400}})
+    assert team_months(client, 'Alpha') == {'Jan 2025': (1000.0, 0.0, 600.0, 400.0),
+                                            'Feb 2025': (0.0, 100.0, 600.0, -700.0),
+                                            'Mar 2025': (500.0, 0.0, 600.0, -100.0)}
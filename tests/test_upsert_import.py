@@ -0,0 +1,88 @@
+import io
+
+import pytest
+
+from conftest import query
+
+DOMAIN_COST_CSV = """domain,kw,type,team,owner,end_date,plan,cost,month
+a.com,kw,x,Alpha,o,1 Jan 2025,A,10,Jan 2025
+a.com,kw,x,Alpha,o,1 Feb 2025,A,11,Feb 2025
+b.com,kw,x,Beta,o,1 Jan 2025,B,20,Jan 2025
+"""
+
+PERFORMANCE_CSV = """Domain,Team,Owner,Plan,End Date,Cashgame,Chalong,Playgame,Total Register,Total Topup,CVR,First seen CG,First seen CL,First seen PG,Date gap,Unique visits,Regis - May 2025,Topup - May 2025,Regis - Jun 2025,Topup - Jun 2025
+a.com,Alpha,o,A,20/06/2025,c1,l1,p1,1,2,1%,,,,,3,5,6,7,8
+b.com,Beta,o,B,20/06/2025,c2,l2,p2,4,5,2%,,,,,6,1,2,,
+"""
+
+
+def upsert(client, table_name, text, **options):
+    response = client.post(f'/import_csv/{table_name}?format=json',
+                           data=dict({'file': (io.BytesIO(text.encode()), 'upload.csv'), 'mode': 'upsert'},
+                                     **options))
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def counts(summary):
+    return {key: summary[key] for key in ('rows_inserted', 'rows_updated', 'rows_unchanged', 'rows_deleted')}
+
+
+def table_contents(table_name):
+    rows = query(f'SELECT * FROM {table_name} ORDER BY id')
+    if table_name == 'performance':
+        return rows, query('SELECT * FROM performance_monthly ORDER BY domain_id, month_key')
+    return rows
+
+
+@pytest.mark.parametrize('table_name, text', [('domain_cost', DOMAIN_COST_CSV),
+                                              ('performance', PERFORMANCE_CSV)])
+def test_upsert_reimport_is_idempotent(client, table_name, text):
+    first = upsert(client, table_name, text)
+    assert counts(first) == {'rows_inserted': 3 if table_name == 'domain_cost' else 2, 'rows_updated': 0,
+                             'rows_unchanged': 0, 'rows_deleted': 0}
+    contents = table_contents(table_name)
+
+    for snapshot in ('0', '1'):
+        again = upsert(client, table_name, text, snapshot=snapshot)
+        assert counts(again) == {'rows_inserted': 0, 'rows_updated': 0, 'rows_unchanged': first['rows_inserted'],
+                                 'rows_deleted': 0}
+        assert table_contents(table_name) == contents
+
+
+def test_upsert_updates_changed_rows_in_place(client):
+    upsert(client, 'domain_cost', DOMAIN_COST_CSV)
+    ids = [row['id'] for row in query('SELECT id FROM domain_cost ORDER BY id')]
+
+    changed = DOMAIN_COST_CSV.replace('b.com,kw,x,Beta,o,1 Jan 2025,B,20', 'b.com,kw,x,Beta,o,1 Jan 2025,B,25')
+    summary = upsert(client, 'domain_cost', changed + 'c.com,kw,x,Gamma,o,1 Mar 2025,C,30,Mar 2025\n')
+    assert counts(summary) == {'rows_inserted': 1, 'rows_updated': 1, 'rows_unchanged': 2, 'rows_deleted': 0}
+    rows = query('SELECT id, domain, cost FROM domain_cost ORDER BY id')
+    assert [row['id'] for row in rows[:3]] == ids
+    assert [(row['domain'], row['cost']) for row in rows] == [('a.com', 10.0), ('a.com', 11.0), ('b.com', 25.0),
+                                                              ('c.com', 30.0)]
+
+
+def test_upsert_restores_rows_edited_since_import(app, client):
+    upsert(client, 'performance', PERFORMANCE_CSV)
+    contents = table_contents('performance')
+    row = query("SELECT * FROM performance WHERE domain = 'a.com'")[0]
+
+    form = {column: '' if row[column] is None else str(row[column]) for column in app.SOURCE_COLUMNS['performance']}
+    client.post(f"/edit/performance/{row['id']}", data=dict(form, total_register='99', regis_may='50'))
+    response = client.post('/api/performance/bulk', json={'ids': [row['id']], 'action': 'update',
+                                                          'set': {'total_topup': 77}})
+    assert response.status_code == 200
+    assert table_contents('performance') != contents
+
+    summary = upsert(client, 'performance', PERFORMANCE_CSV)
+    assert counts(summary) == {'rows_inserted': 0, 'rows_updated': 1, 'rows_unchanged': 1, 'rows_deleted': 0}
+    assert table_contents('performance') == contents
+    assert counts(upsert(client, 'performance', PERFORMANCE_CSV))['rows_unchanged'] == 2
+
+
+def test_upsert_keeps_the_last_row_of_a_repeated_key(client):
+    summary = upsert(client, 'domain_cost', DOMAIN_COST_CSV + 'b.com,kw,x,Beta,o,1 Jan 2025,B,21,Jan 2025\n')
+    assert summary['rows_inserted'] == 3
+    assert summary['rows_rejected'] == 1
+    assert query("SELECT cost FROM domain_cost WHERE domain = 'b.com'") == [{'cost': 21.0}]
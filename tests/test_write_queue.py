@@ -0,0 +1,117 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from conftest import insert_rows, query
+
+
+def salary_insert(app, nickname):
+    def insert(conn):
+        return conn.execute(app.INSERT_STATEMENTS['salary'], (nickname, 1000.0, 'Team')).lastrowid
+    return insert
+
+
+def hold_writer(app):
+    """Occupy the writer thread until the returned event is set"""
+    started, release = threading.Event(), threading.Event()
+
+    def hold(conn):
+        started.set()
+        return release.wait(10)
+
+    held = app.write_queue.submit(hold, exclusive=True)
+    started.wait(10)
+    return release, held
+
+
+def test_failing_job_rolls_back_only_its_savepoint(app):
+    def failing(conn):
+        salary_insert(app, 'broken')(conn)
+        raise ValueError('rejected')
+
+    release, held = hold_writer(app)
+    before = app.write_queue.stats()
+    futures = [app.write_queue.submit(salary_insert(app, 'first')),
+               app.write_queue.submit(failing),
+               app.write_queue.submit(salary_insert(app, 'last'))]
+    release.set()
+    held.result(10)
+
+    assert futures[0].result(10) and futures[2].result(10)
+    with pytest.raises(ValueError, match='rejected'):
+        futures[1].result(10)
+    assert [row['nickname'] for row in query('SELECT nickname FROM salary ORDER BY id')] == ['first', 'last']
+
+    # Stats are counted just after the futures resolve; the held job's are
+    # in `after` too, earlier jobs' were done before it started
+    deadline = time.monotonic() + 10
+    while app.write_queue.stats()['jobs'] < before['jobs'] + 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    after = app.write_queue.stats()
+    # All three were applied as one group sharing a single commit
+    assert after['groups'] == before['groups'] + 1
+    assert after['failed'] == before['failed'] + 1
+    assert after['largest_group'] >= 3
+
+
+def test_failing_exclusive_job_is_rolled_back(app):
+    def failing(conn):
+        conn.execute('BEGIN IMMEDIATE')
+        salary_insert(app, 'broken')(conn)
+        raise sqlite3.IntegrityError('rejected')
+
+    with pytest.raises(sqlite3.IntegrityError):
+        app.write_queue.run(failing, exclusive=True)
+    app.write_queue.run(salary_insert(app, 'after'))
+    assert [row['nickname'] for row in query('SELECT nickname FROM salary')] == ['after']
+
+
+def test_queued_job_times_out_with_writer_busy(app):
+    release, held = hold_writer(app)
+    try:
+        with pytest.raises(app.WriterBusy):
+            app.write_queue.run(salary_insert(app, 'late'), timeout=0.05)
+    finally:
+        release.set()
+        held.result(10)
+    # The dropped job never runs
+    app.write_queue.run(lambda conn: None)
+    assert query('SELECT nickname FROM salary') == []
+
+
+def test_form_write_behind_busy_writer_asks_to_retry(app, client, monkeypatch):
+    run = app.write_queue.run
+    monkeypatch.setattr(app.write_queue, 'run', lambda work, exclusive=False, timeout=None: run(work, exclusive, 0.05))
+    release, held = hold_writer(app)
+    try:
+        response = client.post('/add/salary', data={'nickname': 'late', 'salary': '1', 'team': 'Team'},
+                               follow_redirects=True)
+    finally:
+        release.set()
+        held.result(10)
+    assert app.WRITER_BUSY_MESSAGE.encode() in response.data
+
+
+def test_rollup_read_serves_materialized_rows_while_writer_is_busy(app, client, monkeypatch):
+    insert_rows('domain_cost', [('a.com', 'kw', 'x', 'Team', 'o', '1 Jan 2025', 'A', 10.0, 'Jan 2025')])
+    assert client.get('/api/rollup/domains').get_json()['stale'] is False
+
+    insert_rows('domain_cost', [('a.com', 'kw', 'x', 'Team', 'o', '1 Jan 2025', 'A', 5.0, 'Jan 2025')])
+    monkeypatch.setattr(app, 'ROLLUP_REFRESH_WAIT', 0.05)
+    release, held = hold_writer(app)
+    try:
+        response = client.get('/api/rollup/domains')
+    finally:
+        release.set()
+        held.result(10)
+    payload = response.get_json()
+    assert payload['stale'] is True
+    assert response.cache_control.no_store
+    assert [row['domain_cost'] for row in payload['data']] == [10.0]
+
+    app.queue_rollup_refresh().result(10)
+    payload = client.get('/api/rollup/domains').get_json()
+    assert payload['stale'] is False
+    assert [row['domain_cost'] for row in payload['data']] == [15.0]